@@ -0,0 +1,170 @@
+"""Animation scheduler module.
+
+Here are defined the class AnimationScheduler and the
+time-based animation tracks it advances.
+"""
+
+import time
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class AnimationTrack:
+	"""Base class of time-based effects.
+
+	Subclasses implement Apply(progress, delta), where progress
+	goes from 0 to 1 along the track duration and delta is the
+	progress increment since the previous update.
+
+	An optional callback is called once the track has finished.
+	"""
+
+	def __init__(self, duration, callback = None):
+		"""Constructor. Duration given in seconds."""
+		self.Duration = float(duration)
+		self.Callback = callback
+		self.StartTime = 0
+		self.Progress = 0
+		self.Finished = False
+
+	def Begin(self, now):
+		"""Set the track start time."""
+		self.StartTime = now
+		self.Progress = 0
+
+	def Advance(self, now):
+		"""Apply the effect up to the time given."""
+		if self.Finished:
+			return
+		if self.Duration > 0:
+			progress = min(1.0, (now - self.StartTime)/self.Duration)
+		else:
+			progress = 1.0
+		if progress > self.Progress:
+			self.Apply(progress, progress - self.Progress)
+			self.Progress = progress
+		if progress >= 1.0:
+			self.Finish()
+
+	def Finish(self):
+		"""Jump to the end of the track."""
+		if self.Finished:
+			return
+		if self.Progress < 1.0:
+			self.Apply(1.0, 1.0 - self.Progress)
+			self.Progress = 1.0
+		self.Finished = True
+		if self.Callback:
+			self.Callback()
+
+	def Apply(self, progress, delta):
+		"""Apply the effect. To be implemented by subclasses."""
+		pass
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class FadeTrack(AnimationTrack):
+	"""Change the opacity of some actors."""
+
+	def __init__(self, actors, duration, start = 1.0, end = 0.0, callback = None):
+		AnimationTrack.__init__(self, duration, callback)
+		self.Actors = actors
+		self.StartOpacity = start
+		self.EndOpacity = end
+
+	def Apply(self, progress, delta):
+		opacity = self.StartOpacity + (self.EndOpacity - self.StartOpacity)*progress
+		for a in self.Actors:
+			a.GetProperty().SetOpacity(opacity)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class TranslateTrack(AnimationTrack):
+	"""Move an actor by an offset."""
+
+	def __init__(self, actor, offset, duration, callback = None):
+		AnimationTrack.__init__(self, duration, callback)
+		self.Actor = actor
+		self.Offset = offset
+
+	def Apply(self, progress, delta):
+		o = self.Offset
+		self.Actor.AddPosition(o[0]*delta, o[1]*delta, o[2]*delta)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class RotateTrack(AnimationTrack):
+	"""Rotate an actor around its Z axis."""
+
+	def __init__(self, actor, angle, duration, callback = None):
+		AnimationTrack.__init__(self, duration, callback)
+		self.Actor = actor
+		self.Angle = angle
+
+	def Apply(self, progress, delta):
+		self.Actor.RotateZ(self.Angle*delta)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class NailMoveTrack(AnimationTrack):
+	"""Animate the nail when key 'A' pressed.
+
+	The nail goes down to the depth given and back again.
+	"""
+
+	def __init__(self, frame, depth = -1.0, duration = 2, callback = None):
+		AnimationTrack.__init__(self, duration, callback)
+		self.Frame = frame
+		self.Depth = depth
+
+	def Apply(self, progress, delta):
+		self.Frame.UpdateNail(self.Depth*(1 - abs(2*progress - 1)))
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class AnimationScheduler:
+	"""Advance all running animations in a single batched update.
+
+	Meant to be driven by the main simulation tick, so all effects
+	stay in phase with rendering. Finished tracks are removed
+	automatically.
+
+	Usage:
+		scheduler = AnimationScheduler()
+		scheduler.Add(FadeTrack([actor], 3))
+		# On every tick
+		scheduler.Advance()
+	"""
+
+	def __init__(self, clock = time.time):
+		"""Constructor. The clock returns the current time in seconds."""
+		self.Clock = clock
+		self.Tracks = list()
+
+	def SetClock(self, clock):
+		"""Set the function used to get the current time."""
+		self.Clock = clock
+
+	def Add(self, track):
+		"""Start a track now."""
+		track.Begin(self.Clock())
+		self.Tracks.append(track)
+		return track
+
+	def Advance(self, now = None):
+		"""Advance every track and drop the finished ones."""
+		if not self.Tracks:
+			return
+		if now is None:
+			now = self.Clock()
+		for t in self.Tracks:
+			t.Advance(now)
+		self.Tracks = [t for t in self.Tracks if not t.Finished]
+
+	def FinishAll(self):
+		"""Jump every track to its end and drop them."""
+		tracks = self.Tracks
+		self.Tracks = list()
+		for t in tracks:
+			t.Finish()
+
+	def IsActive(self):
+		"""Check whether any animation is running."""
+		return len(self.Tracks) > 0
+
+	def GetNumberOfTracks(self):
+		"""Return the number of running tracks."""
+		return len(self.Tracks)
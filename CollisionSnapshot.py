@@ -0,0 +1,90 @@
+"""Collision snapshot module.
+
+Here is defined the class CollisionSnapshot, which reads the
+simulation collisions once per tick so every consumer can share them.
+"""
+
+import numpy
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class CollisionSnapshot:
+	"""Struct-of-arrays copy of the collisions detected in a tick.
+
+	Collisions are stored grouped by object ID, so looking up the
+	collisions of an element does not walk the whole collection.
+
+	Usage:
+		snapshot = CollisionSnapshot()
+		snapshot.Capture(simulation.GetCollisions())
+		pids = snapshot.GetPointIds(element.GetObjectId(), element.GetId())
+	"""
+
+	def __init__(self):
+		"""Constructor."""
+		self.Clear()
+
+	def Clear(self):
+		"""Empty the snapshot."""
+		self.ObjectIds = numpy.zeros(0, numpy.int32)
+		self.ElementIds = numpy.zeros(0, numpy.int32)
+		self.PointIds = numpy.zeros(0, numpy.int32)
+		self.Points = numpy.zeros((0, 3), numpy.float64)
+		self.__groups = dict()
+
+	def Capture(self, collisions):
+		"""Read all collisions of the collection given in a single pass."""
+		n = collisions.GetNumberOfCollisions()
+		if n == 0:
+			if self.ObjectIds.size:
+				self.Clear()
+			return
+
+		object_ids = numpy.empty(n, numpy.int32)
+		element_ids = numpy.empty(n, numpy.int32)
+		point_ids = numpy.empty(n, numpy.int32)
+		points = numpy.empty((n, 3), numpy.float64)
+		i = 0
+		collisions.InitTraversal()
+		c = collisions.GetNextCollision()
+		while c and i < n:
+			object_ids[i] = c.GetObjectId()
+			element_ids[i] = c.GetElementId()
+			point_ids[i] = c.GetPointId()
+			points[i] = c.GetPoint()
+			i += 1
+			c = collisions.GetNextCollision()
+
+		# Group by object, keeping the detection order inside each group
+		order = numpy.argsort(object_ids[:i], kind='mergesort')
+		self.ObjectIds = object_ids[order]
+		self.ElementIds = element_ids[order]
+		self.PointIds = point_ids[order]
+		self.Points = points[order]
+
+		keys, starts, counts = numpy.unique(self.ObjectIds, return_index=True, return_counts=True)
+		self.__groups = dict()
+		for k, s, c in zip(keys, starts, counts):
+			self.__groups[int(k)] = (int(s), int(s + c))
+
+	def GetNumberOfCollisions(self):
+		"""Return the number of collisions captured."""
+		return self.ObjectIds.size
+
+	def GetIndices(self, object_id, element_id = None):
+		"""Return the indices of the collisions of an object or element."""
+		start, stop = self.__groups.get(object_id, (0, 0))
+		if element_id is None or start == stop:
+			return numpy.arange(start, stop)
+		mask = self.ElementIds[start:stop] == element_id
+		return numpy.flatnonzero(mask) + start
+
+	def GetPointIds(self, object_id, element_id = None):
+		"""Return the collision point IDs of an object or element."""
+		return self.PointIds[self.GetIndices(object_id, element_id)]
+
+	def GetFirstPoint(self, object_id, element_id = None):
+		"""Return the first collision point of an object or element, or None."""
+		indices = self.GetIndices(object_id, element_id)
+		if indices.size == 0:
+			return None
+		return tuple(self.Points[indices[0]])
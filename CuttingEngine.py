@@ -0,0 +1,448 @@
+"""Cutting engine module.
+
+Here are defined the classes CutPipeline and CuttingEngine,
+which split elements in two pieces along a plane.
+"""
+
+import vtk
+import numpy
+import logging
+import multiprocessing
+from vtk.util import numpy_support
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def PolyDataToArrays(pd):
+	"""Copy the points, polygons and point data of a polydata into numpy arrays.
+
+	The result can be pickled to send it to another process.
+	Triangle strips are triangulated first. Raise ValueError if
+	the polydata has vertices or lines, which would be lost.
+	"""
+	if pd.GetNumberOfVerts() or pd.GetNumberOfLines():
+		raise ValueError('Only polygons and triangle strips can be copied.')
+	if pd.GetNumberOfStrips():
+		triangles = vtk.vtkTriangleFilter()
+		triangles.SetInput(pd)
+		triangles.Update()
+		pd = triangles.GetOutput()
+	arrays = dict()
+	if not pd.GetPoints() or pd.GetNumberOfPolys() == 0:
+		arrays['points'] = numpy.zeros((0, 3), numpy.float32)
+		arrays['polys'] = numpy.zeros(0, numpy.int64)
+		arrays['num_polys'] = 0
+		return arrays
+	arrays['points'] = numpy_support.vtk_to_numpy(pd.GetPoints().GetData()).copy()
+	arrays['polys'] = numpy_support.vtk_to_numpy(pd.GetPolys().GetData()).copy()
+	arrays['num_polys'] = pd.GetNumberOfPolys()
+	pointdata = pd.GetPointData()
+	for name, data in (('normals', pointdata.GetNormals()), ('tcoords', pointdata.GetTCoords())):
+		if data:
+			arrays[name] = numpy_support.vtk_to_numpy(data).copy()
+	return arrays
+
+def ArraysToPolyData(arrays):
+	"""Build a polydata from the output of PolyDataToArrays."""
+	pd = vtk.vtkPolyData()
+	points = vtk.vtkPoints()
+	points.SetData(numpy_support.numpy_to_vtk(arrays['points'], deep=1))
+	pd.SetPoints(points)
+	polys = vtk.vtkCellArray()
+	connectivity = arrays['polys'].astype(numpy_support.ID_TYPE_CODE)
+	polys.SetCells(arrays['num_polys'], numpy_support.numpy_to_vtkIdTypeArray(connectivity, deep=1))
+	pd.SetPolys(polys)
+	if 'normals' in arrays:
+		pd.GetPointData().SetNormals(numpy_support.numpy_to_vtk(arrays['normals'], deep=1))
+	if 'tcoords' in arrays:
+		pd.GetPointData().SetTCoords(numpy_support.numpy_to_vtk(arrays['tcoords'], deep=1))
+	return pd
+
+def ComputeCut(arrays, origin, normal):
+	"""Worker process entry point. Cut a serialized polydata.
+
+	Return the serialized pieces.
+	"""
+	pipeline = CutPipeline()
+	pipeline.SetInput(ArraysToPolyData(arrays))
+	pipeline.Cut(origin, normal)
+	return [PolyDataToArrays(pipeline.GetOutput(i)) for i in range(2)]
+
+# Worker started before the GUI, shared by all engines (see StartWorkerPool)
+WorkerPool = None
+
+def StartWorkerPool():
+	"""Start the shared cut worker process.
+
+	Must be called before any window or GL context exists, as the
+	worker may be forked from the calling process.
+	"""
+	global WorkerPool
+	if WorkerPool is None:
+		WorkerPool = multiprocessing.Pool(1)
+	return WorkerPool
+
+def NewWorkerPool():
+	"""Return a single process pool for the cut computations, or None.
+
+	The worker started with StartWorkerPool is used if any. Else a
+	worker is spawned where multiprocessing has start contexts
+	(Python 3.4 and later). Forking the GUI process would copy its
+	X/GL state into the child, so on older versions None is
+	returned and cuts are computed synchronously.
+	"""
+	if WorkerPool:
+		return WorkerPool
+	if hasattr(multiprocessing, 'get_context'):
+		return multiprocessing.get_context('spawn').Pool(1)
+	logging.getLogger('HysTrainer').warning('No cut worker started before the GUI: cutting synchronously')
+	return None
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class CutPipeline:
+	"""Reusable VTK pipeline that splits a polydata by a plane.
+
+	All filters are built and connected once. A cut only updates
+	the plane parameters and pulls the results.
+
+	Texture coordinates of the input are carried through the clip,
+	and the cap polygons get the ones interpolated by the cutter.
+	Spherical texture mapping is only applied to inputs without
+	texture coordinates.
+
+	Usage:
+		pipeline = CutPipeline()
+		pipeline.SetInputConnection(vis.GetOutputPort())
+		pipeline.Cut(origin, normal)
+		port = pipeline.GetOutputPort(0)
+	"""
+
+	def __init__(self):
+		"""Constructor. Build and connect all filters."""
+		self.Plane = vtk.vtkPlane()
+
+		self.Clipper = vtk.vtkClipPolyData()
+		self.Clipper.SetValue(0)
+		self.Clipper.GenerateClippedOutputOn()
+		self.Clipper.SetClipFunction(self.Plane)
+
+		self.Cutter = vtk.vtkCutter()
+		self.Cutter.SetCutFunction(self.Plane)
+		self.Stripper = vtk.vtkStripper()
+		self.Stripper.SetInputConnection(self.Cutter.GetOutputPort())
+
+		# Cap polygon closing both pieces
+		self.CapPoly = vtk.vtkPolyData()
+		self.Reverse = vtk.vtkReverseSense()
+		self.Reverse.SetInput(self.CapPoly)
+		self.Reverse.ReverseNormalsOn()
+
+		self.Appends = list()
+		self.Cleaners = list()
+		self.TextureMaps = list()
+		for i in range(2):
+			piece = vtk.vtkAppendPolyData()
+			if i == 0:
+				piece.AddInputConnection(self.Reverse.GetOutputPort())
+				piece.AddInputConnection(self.Clipper.GetOutputPort())
+			else:
+				piece.AddInput(self.CapPoly)
+				piece.AddInputConnection(self.Clipper.GetClippedOutputPort())
+			cleaner = vtk.vtkCleanPolyData()
+			cleaner.SetInputConnection(piece.GetOutputPort())
+			txt_map = vtk.vtkTextureMapToSphere()
+			txt_map.PreventSeamOn()
+			txt_map.SetInputConnection(cleaner.GetOutputPort())
+			self.Appends.append(piece)
+			self.Cleaners.append(cleaner)
+			self.TextureMaps.append(txt_map)
+
+	def SetInputConnection(self, port):
+		"""Set the pipeline input from an algorithm output port."""
+		self.Clipper.SetInputConnection(port)
+		self.Cutter.SetInputConnection(port)
+
+	def SetInput(self, pd):
+		"""Set the pipeline input from a polydata."""
+		self.Clipper.SetInput(pd)
+		self.Cutter.SetInput(pd)
+
+	def Cut(self, origin, normal):
+		"""Split the input by the plane given and update both pieces."""
+		self.Plane.SetOrigin(origin)
+		self.Plane.SetNormal(normal)
+
+		self.Stripper.Update()
+		strips = self.Stripper.GetOutput()
+		self.CapPoly.SetPoints(strips.GetPoints())
+		self.CapPoly.SetPolys(strips.GetLines())
+		# Only the cutter texture coordinates: its normals are the
+		# side wall ones. The cap is flat and faces the +normal side,
+		# reversed for the other piece.
+		pointdata = self.CapPoly.GetPointData()
+		pointdata.Initialize()
+		tcoords = strips.GetPointData().GetTCoords()
+		if tcoords:
+			pointdata.SetTCoords(tcoords)
+		n = numpy.asarray(normal, numpy.float32)
+		n /= max(numpy.linalg.norm(n), 1e-12)
+		normals = numpy.tile(n, (strips.GetNumberOfPoints(), 1))
+		pointdata.SetNormals(numpy_support.numpy_to_vtk(normals, deep=1))
+		self.CapPoly.Modified()
+
+		for cleaner in self.Cleaners:
+			cleaner.Update()
+		if not self.HasTCoords():
+			for txt_map in self.TextureMaps:
+				txt_map.Update()
+
+	def HasTCoords(self):
+		"""Check whether the pieces kept the input texture coordinates."""
+		return self.Cleaners[0].GetOutput().GetPointData().GetTCoords() is not None
+
+	def GetOutputFilter(self, i):
+		"""Return the last filter of the piece i (0 or 1)."""
+		if self.HasTCoords():
+			return self.Cleaners[i]
+		return self.TextureMaps[i]
+
+	def GetOutputPort(self, i):
+		"""Return the output port of the piece i (0 or 1)."""
+		return self.GetOutputFilter(i).GetOutputPort()
+
+	def GetOutput(self, i):
+		"""Return the polydata of the piece i (0 or 1)."""
+		return self.GetOutputFilter(i).GetOutput()
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class CuttingEngine:
+	"""Split elements in two pieces along a plane.
+
+	Every element gets a warmed CutPipeline and a pool of
+	mapper/actor pairs when the engine is warmed, so no VTK object
+	needs to be created when a cut happens. Scenarios that never
+	cut pay nothing: call Warm when cutting is enabled, otherwise
+	each element is warmed on its first cut. Pieces are given back
+	to the pool once their animation has finished.
+
+	In asynchronous mode the cut geometry is computed in a worker
+	process from a copy of the element polydata. Finished pieces
+	are collected on a later tick, so rendering is not stalled.
+
+	Usage:
+		engine = CuttingEngine()
+		engine.SetRenderer(ren)
+		engine.AddElement(element)
+		engine.Initialize()
+		engine.Warm()
+		actor_1, actor_2 = engine.Cut(eid, point, normal)
+		...
+		engine.Release(eid, actor_1, actor_2)
+
+	Asynchronous usage:
+		engine.AsyncOn()
+		engine.CutAsync(eid, point, normal)
+		...
+		for eid, actors in engine.CollectFinished():
+			...
+		engine.Close()
+	"""
+
+	def __init__(self, pool_size = 2):
+		"""Constructor.
+
+		pool_size is the number of mapper/actor pairs warmed per element.
+		"""
+		self.PoolSize = pool_size
+		self.Async = False
+		self.Worker = None
+		self.Pending = list()
+		self.Initialized = False
+		self.ren = None
+		self.Elements = list()
+		self.Pipelines = list()
+		self.Pools = list()
+		self.ResetCounters()
+
+	def ResetCounters(self):
+		"""Restart the profiling counters."""
+		self.Allocations = 0
+		self.Acquisitions = 0
+		self.PoolHits = 0
+		self.Releases = 0
+		self.Cuts = 0
+
+	def GetStatistics(self):
+		"""Return pool usage and allocation counters in a dictionary."""
+		free = sum([len(p) for p in self.Pools])
+		return {'pipelines': len([p for p in self.Pipelines if p]),
+		        'allocations': self.Allocations,
+		        'acquisitions': self.Acquisitions,
+		        'pool_hits': self.PoolHits,
+		        'releases': self.Releases,
+		        'in_use': self.Acquisitions - self.Releases,
+		        'free': free,
+		        'pending': len(self.Pending),
+		        'cuts': self.Cuts}
+
+	def AsyncOn(self):
+		"""Compute cuts in a worker process."""
+		self.Async = True
+
+	def AsyncOff(self):
+		"""Compute cuts synchronously."""
+		self.Async = False
+
+	def Close(self):
+		"""Stop the worker process, if any."""
+		self.Pending = list()
+		# The shared worker outlives the engine
+		if self.Worker and self.Worker is not WorkerPool:
+			self.Worker.terminate()
+		self.Worker = None
+
+	def SetRenderer(self, ren):
+		"""Set the renderer pieces are added to."""
+		self.ren = ren
+
+	def AddElement(self, element):
+		"""Add an element that can be cut."""
+		self.Elements.append(element)
+
+	def Initialize(self):
+		"""Prepare the per-element slots. Nothing is warmed yet."""
+		if self.Initialized:
+			return
+		self.Initialized = True
+		self.Pipelines = [None]*len(self.Elements)
+		self.Pools = [list() for e in self.Elements]
+
+	def Warm(self):
+		"""Warm the pipelines and pools of every element.
+
+		Cavity elements are never cut, so they get no resources.
+		"""
+		# Spawn the worker before the first cut needs it
+		if self.Async and not self.Worker:
+			self.Worker = NewWorkerPool()
+		for eid in xrange(len(self.Elements)):
+			self.WarmElement(eid)
+
+	def WarmElement(self, eid):
+		"""Build the pipeline and pool of an element, if not done yet."""
+		e = self.Elements[eid]
+		if self.Pipelines[eid] or e.is_cavity:
+			return
+		pipeline = CutPipeline()
+		pipeline.SetInputConnection(e.GetVisualizationModel().GetOutputPort())
+		self.Pipelines[eid] = pipeline
+		for i in xrange(self.PoolSize):
+			self.Pools[eid].append(self.NewPiece())
+
+	def Reset(self):
+		"""Drop every pipeline and pooled object."""
+		self.Initialized = False
+		self.Elements = list()
+		self.Pipelines = list()
+		self.Pools = list()
+		# Results would refer to the old elements
+		self.Pending = list()
+
+	def NewPiece(self):
+		"""Allocate a mapper/actor pair."""
+		self.Allocations += 1
+		mapper = vtk.vtkPolyDataMapper()
+		actor = vtk.vtkActor()
+		actor.SetMapper(mapper)
+		actor.GetProperty().BackfaceCullingOn()
+		return actor
+
+	def Acquire(self, eid):
+		"""Take a mapper/actor pair from the pool of an element."""
+		self.Acquisitions += 1
+		pool = self.Pools[eid]
+		if pool:
+			self.PoolHits += 1
+			return pool.pop()
+		return self.NewPiece()
+
+	def Release(self, eid, *actors):
+		"""Give pieces back to the pool of an element."""
+		for actor in actors:
+			self.ren.RemoveActor(actor)
+			# Engine reset while the pieces were still in use
+			if eid >= len(self.Pools):
+				continue
+			self.Releases += 1
+			actor.SetOrientation(0,0,0)
+			actor.SetPosition(0,0,0)
+			actor.GetProperty().SetOpacity(1)
+			self.Pools[eid].append(actor)
+
+	def Cut(self, eid, point, normal):
+		"""Split an element by the plane given.
+
+		Return both piece actors, already added to the renderer.
+		"""
+		self.WarmElement(eid)
+		pipeline = self.Pipelines[eid]
+		pipeline.Cut(point, normal)
+		self.Cuts += 1
+		return [self.AddPiece(eid, pipeline.GetOutput(i)) for i in range(2)]
+
+	def AddPiece(self, eid, pd):
+		"""Show a piece of an element with a pooled actor."""
+		va = self.Elements[eid].GetVisualizationModel().GetActor()
+		actor = self.Acquire(eid)
+		actor.GetMapper().SetInput(pd)
+		actor.SetUserMatrix(va.GetUserMatrix())
+		actor.SetTexture(va.GetTexture())
+		self.ren.AddActor(actor)
+		return actor
+
+	def CutAsync(self, eid, point, normal):
+		"""Queue the cut of an element in the worker process.
+
+		Return False if the element mesh has cells the worker cannot
+		get (vertices or lines), or if no worker can be started (see
+		NewWorkerPool). It should be cut with Cut then.
+		"""
+		vis = self.Elements[eid].GetVisualizationModel()
+		vis.Update()
+		try:
+			arrays = PolyDataToArrays(vis.GetOutput())
+		except ValueError:
+			return False
+		if not self.Worker:
+			self.Worker = NewWorkerPool()
+			if not self.Worker:
+				return False
+		result = self.Worker.apply_async(ComputeCut, (arrays, tuple(point), tuple(normal)))
+		self.Pending.append((eid, result))
+		return True
+
+	def IsPending(self, eid):
+		"""Check whether the cut of an element is being computed."""
+		for pending, result in self.Pending:
+			if pending == eid:
+				return True
+		return False
+
+	def CollectFinished(self):
+		"""Show the pieces of the asynchronous cuts already computed.
+
+		Return a list of (eid, [actor_1, actor_2]) tuples.
+		"""
+		finished = list()
+		pending = list()
+		for eid, result in self.Pending:
+			if not result.ready():
+				pending.append((eid, result))
+				continue
+			if not result.successful():
+				# The element is left uncut
+				continue
+			pieces = result.get()
+			self.Cuts += 1
+			actors = [self.AddPiece(eid, ArraysToPolyData(p)) for p in pieces]
+			finished.append((eid, actors))
+		self.Pending = pending
+		return finished
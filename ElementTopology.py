@@ -0,0 +1,208 @@
+"""Element topology module.
+
+Here is defined the class ElementTopology, which caches
+the correspondence between the collision and visualization
+models of a simulation element.
+"""
+
+import vtk
+import numpy
+from vtk.util import numpy_support
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def GatherRanges(offsets, values, ids):
+	"""Concatenate the CSR rows of the ids given.
+
+	Vectorized equivalent of:
+		concatenate([values[offsets[i]:offsets[i+1]] for i in ids])
+	"""
+	starts = offsets[ids]
+	lengths = offsets[ids + 1] - starts
+	total = lengths.sum()
+	if total == 0:
+		return numpy.zeros(0, values.dtype)
+	# Index of every gathered item inside values
+	shifts = numpy.repeat(starts - (numpy.cumsum(lengths) - lengths), lengths)
+	return values[numpy.arange(total) + shifts]
+
+def ParseCellArray(cells):
+	"""Convert a vtkCellArray into CSR form.
+
+	Return (offsets, connectivity) numpy arrays.
+	"""
+	n = cells.GetNumberOfCells()
+	if n == 0:
+		return numpy.zeros(1, numpy.int64), numpy.zeros(0, numpy.int64)
+	data = numpy_support.vtk_to_numpy(cells.GetData()).astype(numpy.int64)
+	size = data[0]
+	# Fast path: all cells have the same size (e.g. triangle meshes)
+	if data.size == n*(size + 1) and (data[::size + 1] == size).all():
+		offsets = numpy.arange(n + 1, dtype=numpy.int64)*size
+		connectivity = data.reshape(n, size + 1)[:,1:].ravel()
+		return offsets, connectivity
+	offsets = numpy.zeros(n + 1, numpy.int64)
+	mask = numpy.ones(data.size, numpy.bool_)
+	loc = 0
+	for i in xrange(n):
+		offsets[i + 1] = offsets[i] + data[loc]
+		mask[loc] = False
+		loc += data[loc] + 1
+	return offsets, data[mask]
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class ElementTopology:
+	"""Precomputed topology of an element.
+
+	Keep a table that maps collision model point IDs to
+	visualization model point IDs, so the mapping done on
+	every frame is a single array lookup.
+
+	Also keep the point-to-cell and cell-to-point adjacency
+	of the visualization model in compressed-sparse-row form,
+	which allows vectorized neighbour expansion.
+
+	The tables are only rebuilt when the geometry of any of
+	both models changes.
+
+	Usage:
+		topology = ElementTopology(element)
+		topology.Update()
+		vis_ids = topology.MapCollisionPoints(col_ids)
+		cell_ids = topology.GetCellRing(vis_ids, 1)
+	"""
+
+	def __init__(self, element):
+		"""Constructor."""
+		self.Element = element
+		self.PointMap = numpy.zeros(0, numpy.int32)
+		self.CellOffsets = numpy.zeros(1, numpy.int64)
+		self.CellPoints = numpy.zeros(0, numpy.int64)
+		self.PointOffsets = numpy.zeros(1, numpy.int64)
+		self.PointCells = numpy.zeros(0, numpy.int64)
+		self.PolyRange = (0, 0)
+		self.__vispd = None
+		self.__colpd = None
+		self.__geometry_time = None
+
+	def GetVisualizationPolyData(self):
+		"""Return the visualization polydata the topology refers to."""
+		return self.Element.GetVisualizationModel().GetInput()
+
+	def GetCollisionPolyData(self):
+		"""Return the collision polydata the topology refers to."""
+		return self.Element.GetCollisionModel().GetInput()
+
+	def GetGeometryTime(self, pd):
+		"""Return the modification time of the geometry of a polydata."""
+		points = pd.GetPoints()
+		if not points:
+			return 0
+		return max(points.GetMTime(), pd.GetPolys().GetMTime())
+
+	def NeedsRebuild(self):
+		"""Check whether the geometry of any model has changed."""
+		vispd = self.GetVisualizationPolyData()
+		colpd = self.GetCollisionPolyData()
+		if vispd is not self.__vispd or colpd is not self.__colpd:
+			return True
+		return self.__geometry_time != (self.GetGeometryTime(vispd), self.GetGeometryTime(colpd))
+
+	def Update(self):
+		"""Rebuild the tables if the geometry has changed.
+
+		Return True if the tables were rebuilt.
+		"""
+		if not self.NeedsRebuild():
+			return False
+		self.Build()
+		return True
+
+	def Build(self):
+		"""Build all the tables unconditionally."""
+		vispd = self.__vispd = self.GetVisualizationPolyData()
+		colpd = self.__colpd = self.GetCollisionPolyData()
+		self.__geometry_time = (self.GetGeometryTime(vispd), self.GetGeometryTime(colpd))
+		self.BuildPointMap(vispd, colpd)
+		self.BuildAdjacency(vispd)
+
+	def BuildPointMap(self, vispd, colpd):
+		"""Map every collision point to its closest visualization point."""
+		n = colpd.GetNumberOfPoints()
+		self.PointMap = numpy.zeros(n, numpy.int32)
+		if n == 0 or vispd.GetNumberOfPoints() == 0:
+			return
+
+		locator = vtk.vtkPointLocator()
+		locator.SetDataSet(vispd)
+		locator.BuildLocator()
+		for i in xrange(n):
+			self.PointMap[i] = locator.FindClosestPoint(colpd.GetPoint(i))
+
+	def BuildAdjacency(self, vispd):
+		"""Build the CSR point/cell adjacency of the visualization model.
+
+		Cell IDs follow the vtkPolyData ordering: verts, lines, polys, strips.
+		"""
+		offsets = [numpy.zeros(1, numpy.int64)]
+		connectivity = list()
+		base = 0
+		for cells in (vispd.GetVerts(), vispd.GetLines(), vispd.GetPolys(), vispd.GetStrips()):
+			o, c = ParseCellArray(cells)
+			offsets.append(o[1:] + base)
+			connectivity.append(c)
+			base += c.size
+		first = vispd.GetNumberOfVerts() + vispd.GetNumberOfLines()
+		self.PolyRange = (first, first + vispd.GetNumberOfPolys())
+		self.CellOffsets = numpy.concatenate(offsets)
+		self.CellPoints = numpy.concatenate(connectivity)
+
+		# Transpose cell->point into point->cell
+		num_points = vispd.GetNumberOfPoints()
+		num_cells = self.CellOffsets.size - 1
+		owners = numpy.repeat(numpy.arange(num_cells, dtype=numpy.int64), numpy.diff(self.CellOffsets))
+		order = numpy.argsort(self.CellPoints, kind='mergesort')
+		self.PointCells = owners[order]
+		counts = numpy.bincount(self.CellPoints, minlength=num_points)
+		self.PointOffsets = numpy.zeros(num_points + 1, numpy.int64)
+		numpy.cumsum(counts, out=self.PointOffsets[1:])
+
+	def GetNumberOfCells(self):
+		"""Return the number of cells of the visualization model."""
+		return self.CellOffsets.size - 1
+
+	def GetCellRing(self, vis_ids, depth = 1):
+		"""Return the cells around the visualization points given.
+
+		Depth 0 returns the cells using those points. Every extra
+		level adds the cells sharing a point with the previous ones.
+		Return a sorted array of unique cell IDs.
+		"""
+		vis_ids = numpy.asarray(vis_ids, numpy.int64)
+		num_cells = self.GetNumberOfCells()
+		if vis_ids.size == 0 or num_cells == 0:
+			return numpy.zeros(0, numpy.int64)
+
+		mask = numpy.zeros(num_cells, numpy.bool_)
+		front = numpy.unique(GatherRanges(self.PointOffsets, self.PointCells, vis_ids))
+		mask[front] = True
+		for i in xrange(depth):
+			points = numpy.unique(GatherRanges(self.CellOffsets, self.CellPoints, front))
+			cells = GatherRanges(self.PointOffsets, self.PointCells, points)
+			front = numpy.unique(cells[~mask[cells]])
+			if front.size == 0:
+				break
+			mask[front] = True
+		return numpy.flatnonzero(mask)
+
+	def GetPolyCells(self, cell_ids):
+		"""Return the cell IDs given that are polygons."""
+		first, end = self.PolyRange
+		cell_ids = numpy.asarray(cell_ids, numpy.int64)
+		return cell_ids[(cell_ids >= first) & (cell_ids < end)]
+
+	def MapCollisionPoints(self, col_ids):
+		"""Return the unique visualization point IDs of the collision points given."""
+		col_ids = numpy.asarray(col_ids, numpy.int32)
+		if col_ids.size == 0 or self.PointMap.size == 0:
+			return numpy.zeros(0, numpy.int32)
+		return numpy.unique(self.PointMap[col_ids])
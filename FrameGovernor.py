@@ -0,0 +1,82 @@
+"""Frame governor module.
+
+Here is defined the class FrameGovernor, which lowers
+the simulation quality when frames exceed their budget.
+"""
+
+import logging
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class FrameGovernor:
+	"""Keep frame times within a budget by switching quality levels.
+
+	Level 0 is full quality; every further level is cheaper. The
+	meaning of each level is up to the callback, which is called
+	with the new level whenever it changes.
+
+	Hysteresis: the quality drops one level after DegradeFrames
+	consecutive frames over budget, and rises one level after
+	RecoverFrames consecutive frames under RecoverRatio of the
+	budget. Frames in between reset both counters.
+
+	Every change is logged to the 'HysTrainer' logger.
+
+	Usage:
+		governor = FrameGovernor(0.04, ['full', 'cheap'], callback)
+		# On every frame
+		governor.AddFrame(seconds)
+	"""
+
+	def __init__(self, budget, levels, callback):
+		"""Constructor. Budget in seconds, levels is a list of names."""
+		self.Budget = budget
+		self.Levels = levels
+		self.Callback = callback
+		self.Level = 0
+		self.DegradeFrames = 3
+		self.RecoverFrames = 50
+		self.RecoverRatio = 0.6
+		self.Changes = 0
+		self.Logger = logging.getLogger('HysTrainer')
+		self.__over = 0
+		self.__under = 0
+
+	def SetBudget(self, budget):
+		"""Set the frame budget in seconds."""
+		self.Budget = budget
+
+	def AddFrame(self, seconds):
+		"""Account the duration of a frame, changing the level if needed."""
+		if seconds > self.Budget:
+			self.__over += 1
+			self.__under = 0
+			if self.__over >= self.DegradeFrames and self.Level < len(self.Levels) - 1:
+				self.SetLevel(self.Level + 1, seconds)
+		elif seconds < self.Budget*self.RecoverRatio:
+			self.__under += 1
+			self.__over = 0
+			if self.__under >= self.RecoverFrames and self.Level > 0:
+				self.SetLevel(self.Level - 1, seconds)
+		else:
+			self.__over = 0
+			self.__under = 0
+
+	def SetLevel(self, level, seconds = None):
+		"""Switch to the quality level given."""
+		self.__over = 0
+		self.__under = 0
+		if level == self.Level:
+			return
+		if seconds is None:
+			reason = 'forced'
+		else:
+			reason = 'frame %.1f ms, budget %.1f ms' % (seconds*1000.0, self.Budget*1000.0)
+		self.Logger.info('Quality level %d (%s) -> %d (%s): %s', self.Level,
+			self.Levels[self.Level], level, self.Levels[level], reason)
+		self.Level = level
+		self.Changes += 1
+		self.Callback(level)
+
+	def Reset(self):
+		"""Go back to full quality."""
+		self.SetLevel(0)
@@ -0,0 +1,167 @@
+"""Frame profiler module.
+
+Here are defined the classes RingBuffer and FrameProfiler,
+which record the time spent in every stage of the simulation loop.
+"""
+
+import vtk
+import numpy
+import json
+import timeit
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class RingBuffer:
+	"""Fixed-size buffer keeping the last values appended."""
+
+	def __init__(self, size):
+		"""Constructor."""
+		self.Values = numpy.zeros(size, numpy.float64)
+		self.Index = 0
+		self.Count = 0
+		self.Total = 0
+
+	def Append(self, value):
+		"""Add a value, overwriting the oldest one if full."""
+		self.Values[self.Index] = value
+		self.Index = (self.Index + 1) % self.Values.size
+		self.Count = min(self.Count + 1, self.Values.size)
+		self.Total += 1
+
+	def GetValues(self):
+		"""Return the values kept, oldest first."""
+		if self.Count < self.Values.size:
+			return self.Values[:self.Count]
+		return numpy.roll(self.Values, -self.Index)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class FrameProfiler:
+	"""Record the timings of the simulation loop stages.
+
+	Each stage keeps its last timings in a ring buffer, from
+	which rolling p50/p95/p99 are computed. Results can be shown
+	on screen and dumped to CSV or JSON.
+
+	When disabled, Measure just calls the stage.
+
+	Usage:
+		profiler = FrameProfiler()
+		profiler.Enable()
+		profiler.Measure('render', scenario.Render)
+		profiler.GetStatistics()['render']['p95']
+		profiler.Dump('timings.csv')
+	"""
+
+	Percentiles = (50, 95, 99)
+
+	def __init__(self, size = 512, clock = timeit.default_timer):
+		"""Constructor. Size is the number of frames kept per stage."""
+		self.Enabled = False
+		self.Size = size
+		self.Clock = clock
+		self.Stages = list()
+		self.Buffers = dict()
+		self.Overlay = None
+		self.OverlayPeriod = 25
+		self.__frames = 0
+
+	def Enable(self):
+		"""Start recording timings."""
+		self.Enabled = True
+
+	def Disable(self):
+		"""Stop recording timings."""
+		self.Enabled = False
+
+	def Clear(self):
+		"""Forget every timing recorded."""
+		self.Stages = list()
+		self.Buffers = dict()
+
+	def Measure(self, stage, func, *args):
+		"""Call a function, recording its duration under the stage given."""
+		if not self.Enabled:
+			return func(*args)
+		start = self.Clock()
+		result = func(*args)
+		self.Record(stage, self.Clock() - start)
+		return result
+
+	def Record(self, stage, seconds):
+		"""Record a duration of a stage."""
+		buf = self.Buffers.get(stage)
+		if buf is None:
+			buf = self.Buffers[stage] = RingBuffer(self.Size)
+			self.Stages.append(stage)
+		buf.Append(seconds)
+
+	def GetStatistics(self):
+		"""Return count, mean, percentiles and max of every stage, in ms."""
+		stats = dict()
+		for stage in self.Stages:
+			buf = self.Buffers[stage]
+			values = buf.GetValues()*1000.0
+			s = {'count': buf.Total, 'mean': float(values.mean()), 'max': float(values.max())}
+			for p, v in zip(self.Percentiles, numpy.percentile(values, self.Percentiles)):
+				s['p%d' % p] = float(v)
+			stats[stage] = s
+		return stats
+
+	def GetReport(self):
+		"""Return the statistics as a text table."""
+		lines = ['%-12s %7s %7s %7s %7s' % ('stage (ms)', 'p50', 'p95', 'p99', 'max')]
+		stats = self.GetStatistics()
+		for stage in self.Stages:
+			s = stats[stage]
+			lines.append('%-12s %7.2f %7.2f %7.2f %7.2f' % (stage, s['p50'], s['p95'], s['p99'], s['max']))
+		return '\n'.join(lines)
+
+	def Dump(self, filename, rates = None):
+		"""Write the statistics to a .json or .csv file.
+
+		The rate stage statistics given (see RateScheduler) are
+		written as well, under 'rates' or as a second table.
+		"""
+		stats = self.GetStatistics()
+		f = open(filename, 'w')
+		try:
+			if filename.lower().endswith('.json'):
+				if rates:
+					stats['rates'] = rates
+				json.dump(stats, f, indent = 1, sort_keys = True)
+			else:
+				columns = ['count', 'mean'] + ['p%d' % p for p in self.Percentiles] + ['max']
+				f.write(','.join(['stage'] + columns) + '\n')
+				for stage in self.Stages:
+					f.write(','.join([stage] + [str(stats[stage][c]) for c in columns]) + '\n')
+				if rates:
+					columns = ['period', 'runs', 'skipped', 'missed_deadlines', 'mean_drift', 'max_drift']
+					f.write('\n' + ','.join(['rate stage'] + columns) + '\n')
+					for stage in sorted(rates):
+						f.write(','.join([stage] + [str(rates[stage][c]) for c in columns]) + '\n')
+		finally:
+			f.close()
+
+	def ShowOverlay(self, ren):
+		"""Show the statistics on screen, over the renderer given."""
+		if self.Overlay:
+			return
+		self.Overlay = vtk.vtkTextActor()
+		self.Overlay.GetTextProperty().SetFontFamilyToCourier()
+		self.Overlay.GetTextProperty().SetFontSize(12)
+		self.Overlay.GetTextProperty().SetColor(0,1,0)
+		self.Overlay.SetDisplayPosition(10, 10)
+		self.OverlayRenderer = ren
+		ren.AddActor2D(self.Overlay)
+
+	def HideOverlay(self):
+		"""Remove the on-screen statistics."""
+		if self.Overlay:
+			self.OverlayRenderer.RemoveActor2D(self.Overlay)
+			self.Overlay = None
+			self.OverlayRenderer = None
+
+	def EndFrame(self):
+		"""Mark the end of a frame. Refresh the overlay from time to time."""
+		self.__frames += 1
+		if self.Overlay and self.__frames % self.OverlayPeriod == 0:
+			self.Overlay.SetInput(self.GetReport())
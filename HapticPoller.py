@@ -0,0 +1,126 @@
+"""Haptic polling module.
+
+Here are defined the classes HapticState and HapticPoller,
+which read the haptic device out of the GUI timer.
+"""
+
+import time
+import threading
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class HapticState:
+	"""Values read from the haptic device in a single poll."""
+
+	def __init__(self):
+		"""Constructor."""
+		self.Depth = 0.0
+		self.Roll = 0.0
+		self.Opening = 0.0
+		self.LeftPedal = 0
+		self.RightPedal = 0
+		self.Time = 0.0
+		self.Sequence = 0
+
+	def Read(self, device):
+		"""Read the current values of an already updated device."""
+		self.Depth = device.GetLeftToolDepth()
+		self.Roll = device.GetLeftToolRoll()
+		self.Opening = device.GetLeftToolOpening()
+		self.LeftPedal = device.GetLeftPedalState()
+		self.RightPedal = device.GetRightPedalState()
+		self.Time = time.time()
+
+	def Copy(self):
+		"""Return a copy of the state."""
+		state = HapticState()
+		state.Depth = self.Depth
+		state.Roll = self.Roll
+		state.Opening = self.Opening
+		state.LeftPedal = self.LeftPedal
+		state.RightPedal = self.RightPedal
+		state.Time = self.Time
+		state.Sequence = self.Sequence
+		return state
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class HapticPoller(threading.Thread):
+	"""Poll a haptic device at a fixed rate in its own thread.
+
+	The latest values are published into a double buffer. The
+	writer fills the back buffer and then swaps the front index.
+	Each buffer carries a sequence number that is odd while it is
+	being written, so readers retry instead of locking.
+
+	The device only needs UpdateDevice() and the getters used by
+	HapticState.Read, so any software device can be polled as well.
+
+	Usage:
+		poller = HapticPoller(device, rate = 1000)
+		poller.start()
+		state = poller.GetState()
+		poller.Stop()
+	"""
+
+	def __init__(self, device, rate = 500):
+		"""Constructor. Rate given in Hz."""
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.Device = device
+		self.Period = 1.0/rate
+		self.Polls = 0
+		self.Overruns = 0
+		self.__buffers = [HapticState(), HapticState()]
+		self.__front = 0
+		self.__running = False
+
+	def run(self):
+		"""Thread body. Poll the device until stopped."""
+		self.__running = True
+		next_time = time.time()
+		while self.__running:
+			self.Poll()
+			next_time += self.Period
+			delay = next_time - time.time()
+			if delay > 0:
+				time.sleep(delay)
+			else:
+				# Running late: do not try to catch up
+				self.Overruns += 1
+				next_time = time.time()
+
+	def Poll(self):
+		"""Read the device once and publish the values."""
+		self.Device.UpdateDevice()
+		back = self.__buffers[1 - self.__front]
+		sequence = back.Sequence + 1
+		back.Sequence = sequence # odd: being written
+		back.Read(self.Device)
+		back.Sequence = sequence + 1
+		self.__front = 1 - self.__front
+		self.Polls += 1
+
+	def GetState(self, retries = 100):
+		"""Return a consistent copy of the latest published state.
+
+		While the writer is busy, the reader yields and retries up to
+		the number of times given. Then the last copy read is returned.
+		"""
+		state = None
+		for i in range(retries):
+			buf = self.__buffers[self.__front]
+			sequence = buf.Sequence
+			if sequence % 2 == 0:
+				state = buf.Copy()
+				if buf.Sequence == sequence:
+					return state
+			# Let the writer finish
+			time.sleep(0)
+		if state is None:
+			state = self.__buffers[self.__front].Copy()
+		return state
+
+	def Stop(self):
+		"""Stop polling and wait for the thread to finish."""
+		self.__running = False
+		if self.is_alive() and threading.current_thread() is not self:
+			self.join()
@@ -0,0 +1,652 @@
+"""Headless vtkESQui stand-in module.
+
+Here are defined minimal versions of the vtkESQui classes used
+by HysTrainer: SRML reader, simulation, scenario, objects,
+elements, models and a naive collision detection. The headless
+scripts import it in place of vtkesqui on request (see StandIns),
+so scenarios can be loaded and benchmarked on any machine.
+"""
+
+import vtk
+import os
+import logging
+import numpy
+import xml.etree.ElementTree as ElementTree
+from vtk.util import numpy_support
+from TextureCache import TextureRegistry
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def ParseVector(text, default):
+	"""Parse a SRML vector attribute like '0.0 1.0 0.0'."""
+	if not text:
+		return default
+	return tuple([float(v) for v in text.split()])
+
+def ReadPolyData(filename):
+	"""Read a .vtp or .vtk file.
+
+	Missing files are replaced by a textured sphere, so scenarios
+	can be run without their data directory.
+	"""
+	if not os.path.exists(filename):
+		logging.getLogger('HysTrainer').warning('Missing mesh %s, using a sphere', filename)
+		source = vtk.vtkTexturedSphereSource()
+		source.SetRadius(0.5)
+		source.SetThetaResolution(32)
+		source.SetPhiResolution(16)
+	elif filename.lower().endswith('.vtp'):
+		source = vtk.vtkXMLPolyDataReader()
+		source.SetFileName(filename)
+	else:
+		source = vtk.vtkPolyDataReader()
+		source.SetFileName(filename)
+	source.Update()
+	return source.GetOutput()
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class EsquiObject:
+	"""Base class of the stand-in objects."""
+
+	def __init__(self):
+		self.Name = ''
+
+	def IsA(self, name):
+		"""Check whether the object is an instance of the class named."""
+		classes = [self.__class__]
+		while classes:
+			c = classes.pop()
+			if c.__name__ == name:
+				return True
+			classes.extend(c.__bases__)
+		return False
+
+	def SetName(self, name):
+		self.Name = name
+
+	def GetName(self):
+		return self.Name
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class vtkCollection(EsquiObject):
+	"""Traversable list of items."""
+
+	def __init__(self):
+		EsquiObject.__init__(self)
+		self.Items = list()
+		self.Index = 0
+
+	def AddItem(self, item):
+		self.Items.append(item)
+
+	def RemoveAllItems(self):
+		self.Items = list()
+		self.Index = 0
+
+	def GetNumberOfItems(self):
+		return len(self.Items)
+
+	def GetItem(self, i):
+		return self.Items[i]
+
+	def InitTraversal(self):
+		self.Index = 0
+
+	def GetNextItem(self):
+		"""Return the next item, or None at the end."""
+		if self.Index >= len(self.Items):
+			return None
+		self.Index += 1
+		return self.Items[self.Index - 1]
+
+	GetNextObject = GetNextItem
+	GetNextElement = GetNextItem
+	GetNextCollision = GetNextItem
+	GetNumberOfCollisions = GetNumberOfItems
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class vtkCollision(EsquiObject):
+	"""Contact of an organ point with a tool."""
+
+	def __init__(self, object_id = 0, element_id = 0, point_id = 0, point = (0,0,0)):
+		EsquiObject.__init__(self)
+		self.ObjectId = object_id
+		self.ElementId = element_id
+		self.PointId = point_id
+		self.Point = point
+
+	def GetObjectId(self):
+		return self.ObjectId
+
+	def GetElementId(self):
+		return self.ElementId
+
+	def GetPointId(self):
+		return self.PointId
+
+	def GetPoint(self):
+		return self.Point
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class vtkModel(EsquiObject):
+	"""Geometry of an element, with its actor.
+
+	The input is read from the file name on the first update,
+	unless it has been given with SetInput.
+	"""
+
+	def __init__(self):
+		EsquiObject.__init__(self)
+		self.FileName = ''
+		self.TextureFileName = ''
+		self.Color = (1.0, 1.0, 1.0)
+		self.Opacity = 1.0
+		self.Visibility = 1
+		self.Input = None
+		self.Producer = vtk.vtkTrivialProducer()
+		self.Mapper = vtk.vtkPolyDataMapper()
+		self.Actor = vtk.vtkActor()
+		self.Actor.SetMapper(self.Mapper)
+		self.Initialized = False
+
+	def SetFileName(self, filename):
+		self.FileName = filename
+
+	def GetFileName(self):
+		return self.FileName
+
+	def SetTextureFileName(self, filename):
+		self.TextureFileName = filename
+
+	def GetTextureFileName(self):
+		return self.TextureFileName
+
+	def SetColor(self, color):
+		self.Color = color
+
+	def SetOpacity(self, opacity):
+		self.Opacity = opacity
+
+	def SetVisibility(self, visibility):
+		self.Visibility = visibility
+
+	def GetVisibility(self):
+		return self.Visibility
+
+	def SetInput(self, polydata):
+		"""Use the polydata given instead of reading the file."""
+		self.Input = polydata
+		self.Producer.SetOutput(polydata)
+
+	def GetInput(self):
+		return self.Input
+
+	def GetOutput(self):
+		return self.Input
+
+	def GetOutputPort(self):
+		return self.Producer.GetOutputPort()
+
+	def GetActor(self):
+		return self.Actor
+
+	def Update(self):
+		"""Load the geometry and set up the actor, once."""
+		if self.Initialized:
+			return
+		self.Initialized = True
+		if not self.Input:
+			self.SetInput(ReadPolyData(self.FileName))
+		self.Mapper.SetInputConnection(self.GetOutputPort())
+		prop = self.Actor.GetProperty()
+		prop.SetColor(*self.Color)
+		prop.SetOpacity(self.Opacity)
+		self.Actor.SetVisibility(self.Visibility)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class vtkVisualizationModel(vtkModel):
+	"""Visible geometry of an element, textured if possible."""
+
+	def Update(self):
+		if self.Initialized:
+			return
+		vtkModel.Update(self)
+		texture = TextureRegistry.GetTexture(self.TextureFileName, self.Actor)
+		if texture:
+			self.Actor.SetTexture(texture)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class vtkCollisionModel(vtkModel):
+	"""Geometry of an element used for collision detection."""
+	pass
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class vtkScenarioElement(EsquiObject):
+	"""Rigid part of a scenario object.
+
+	The element transform is applied to its models through
+	a single user matrix, rebuilt on update when modified.
+	"""
+
+	def __init__(self):
+		EsquiObject.__init__(self)
+		self.Id = 0
+		self.ObjectId = 0
+		self.Position = (0.0, 0.0, 0.0)
+		self.Orientation = (0.0, 0.0, 0.0)
+		self.Origin = (0.0, 0.0, 0.0)
+		self.Scale = (1.0, 1.0, 1.0)
+		self.Enabled = True
+		self.VisualizationModel = None
+		self.CollisionModel = None
+		self.Matrix = vtk.vtkMatrix4x4()
+		self.Transform = vtk.vtkTransform()
+		self.Modified = True
+		self.__points = None
+		self.__points_time = -1
+
+	def SetId(self, i):
+		self.Id = i
+
+	def GetId(self):
+		return self.Id
+
+	def SetObjectId(self, i):
+		self.ObjectId = i
+
+	def GetObjectId(self):
+		return self.ObjectId
+
+	def SetPosition(self, position):
+		self.Position = tuple(position)
+		self.Modified = True
+
+	def GetPosition(self):
+		return self.Position
+
+	def SetOrientation(self, orientation):
+		self.Orientation = tuple(orientation)
+		self.Modified = True
+
+	def GetOrientation(self):
+		return self.Orientation
+
+	def SetOrigin(self, origin):
+		self.Origin = tuple(origin)
+		self.Modified = True
+
+	def SetScale(self, scale):
+		self.Scale = tuple(scale)
+		self.Modified = True
+
+	def SetVisualizationModel(self, model):
+		self.VisualizationModel = model
+
+	def GetVisualizationModel(self):
+		return self.VisualizationModel
+
+	def SetCollisionModel(self, model):
+		self.CollisionModel = model
+
+	def GetCollisionModel(self):
+		return self.CollisionModel
+
+	def GetModels(self):
+		"""Return the models in a list."""
+		return [m for m in (self.VisualizationModel, self.CollisionModel) if m]
+
+	def IsEnabled(self):
+		return self.Enabled
+
+	def Enable(self):
+		"""Take part in collisions again and show."""
+		self.Enabled = True
+		if self.VisualizationModel:
+			self.VisualizationModel.GetActor().SetVisibility(self.VisualizationModel.GetVisibility())
+
+	def Disable(self):
+		"""Leave collisions and hide."""
+		self.Enabled = False
+		if self.VisualizationModel:
+			self.VisualizationModel.GetActor().VisibilityOff()
+
+	def GetMatrix(self):
+		return self.Matrix
+
+	def Update(self):
+		"""Update the models and the transform."""
+		for m in self.GetModels():
+			m.Update()
+			m.GetActor().SetUserMatrix(self.Matrix)
+		if self.Modified:
+			self.UpdateMatrix()
+
+	def UpdateMatrix(self):
+		"""Rebuild the matrix as vtkProp3D does: T(p) T(o) Rz Rx Ry S T(-o)."""
+		t = self.Transform
+		o = self.Origin
+		r = self.Orientation
+		t.Identity()
+		t.Translate(self.Position)
+		t.Translate(o)
+		t.RotateZ(r[2])
+		t.RotateX(r[0])
+		t.RotateY(r[1])
+		t.Scale(self.Scale)
+		t.Translate(-o[0], -o[1], -o[2])
+		self.Matrix.DeepCopy(t.GetMatrix())
+		self.Modified = False
+
+	def GetCollisionPoints(self):
+		"""Return the world coordinates of the collision model points.
+
+		Cached until the element moves.
+		"""
+		mtime = self.Matrix.GetMTime()
+		if self.__points is None or self.__points_time != mtime:
+			pd = self.CollisionModel.GetInput()
+			local = numpy_support.vtk_to_numpy(pd.GetPoints().GetData())
+			m = numpy.array([[self.Matrix.GetElement(i, j) for j in range(4)] for i in range(3)])
+			self.__points = numpy.dot(local, m[:,:3].T) + m[:,3]
+			self.__points_time = mtime
+		return self.__points
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class vtkScenarioObject(EsquiObject):
+	"""Set of elements."""
+
+	def __init__(self):
+		EsquiObject.__init__(self)
+		self.Id = 0
+		self.Elements = vtkCollection()
+
+	def SetId(self, i):
+		"""Set the object ID, also on its elements."""
+		self.Id = i
+		for e in self.Elements.Items:
+			e.SetObjectId(i)
+
+	def GetId(self):
+		return self.Id
+
+	def AddElement(self, element):
+		element.SetObjectId(self.Id)
+		element.SetId(self.Elements.GetNumberOfItems())
+		self.Elements.AddItem(element)
+
+	def GetElements(self):
+		return self.Elements
+
+class vtkOrgan(vtkScenarioObject):
+	"""Organ object."""
+	pass
+
+class vtkTool(vtkScenarioObject):
+	"""Tool object."""
+	pass
+
+class vtkToolSingleChannel(vtkTool):
+	"""Tool of a single-channel endoscope."""
+
+	Camera = 0
+	Cauterizer = 1
+	Brush = 2
+	Cutter = 3
+	Models = {'Camera': Camera, 'Cauterizer': Cauterizer, 'Brush': Brush, 'Cutter': Cutter}
+
+	def __init__(self):
+		vtkTool.__init__(self)
+		self.ToolModel = vtkToolSingleChannel.Camera
+
+	def SetToolModel(self, model):
+		self.ToolModel = model
+
+	def GetToolModel(self):
+		return self.ToolModel
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class vtkScenario(EsquiObject):
+	"""Objects, camera and render window."""
+
+	def __init__(self):
+		EsquiObject.__init__(self)
+		self.Objects = vtkCollection()
+		self.Camera = vtk.vtkCamera()
+		self.Background = (1.0, 1.0, 1.0)
+		self.RenderWindow = None
+		self.Renderer = None
+		self.Initialized = False
+
+	def AddObject(self, o):
+		o.SetId(self.Objects.GetNumberOfItems())
+		self.Objects.AddItem(o)
+
+	def GetObjects(self):
+		return self.Objects
+
+	def GetCamera(self):
+		return self.Camera
+
+	def SetBackground(self, color):
+		self.Background = color
+
+	def SetRenderWindow(self, renWin):
+		"""Render through the first renderer of the window given."""
+		self.RenderWindow = renWin
+		self.Renderer = renWin.GetRenderers().GetFirstRenderer()
+		if not self.Renderer:
+			self.Renderer = vtk.vtkRenderer()
+			renWin.AddRenderer(self.Renderer)
+		self.Renderer.SetActiveCamera(self.Camera)
+		self.Renderer.SetBackground(*self.Background)
+
+	def GetRenderWindow(self):
+		return self.RenderWindow
+
+	def GetElements(self):
+		"""Return all elements in a list."""
+		return [e for o in self.Objects.Items for e in o.GetElements().Items]
+
+	def Initialize(self):
+		"""Update all elements and add their actors to the renderer."""
+		if self.Initialized:
+			return
+		self.Initialized = True
+		for e in self.GetElements():
+			e.Update()
+			for m in e.GetModels():
+				self.Renderer.AddActor(m.GetActor())
+
+	def Render(self):
+		self.RenderWindow.Render()
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class vtkSingleChannelInteractorStyle(vtk.vtkInteractorStyleTrackballCamera):
+	"""Interactor style of a single-channel endoscope."""
+
+	def SetScenario(self, scenario):
+		self.Scenario = scenario
+
+	def GetScenario(self):
+		return self.Scenario
+
+	def Initialize(self):
+		self.LensAngle = 0
+		self.ActiveTool = 0
+
+	def SetLensAngle(self, angle):
+		self.LensAngle = angle
+
+	def ChangeTool(self, tool_id):
+		self.ActiveTool = tool_id
+		return True
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class vtkSimulation(EsquiObject):
+	"""Scenario stepping and collision detection.
+
+	Collisions are detected naively: every organ collision point
+	inside the bounding box of a tool collision model collides.
+	"""
+
+	def __init__(self):
+		EsquiObject.__init__(self)
+		self.Scenario = None
+		self.InteractorStyle = None
+		self.HapticDevice = None
+		self.Interaction = False
+		self.Collisions = vtkCollection()
+
+	def SetScenario(self, scenario):
+		self.Scenario = scenario
+
+	def GetScenario(self):
+		return self.Scenario
+
+	def SetInteractorStyle(self, style):
+		self.InteractorStyle = style
+
+	def GetInteractorStyle(self):
+		return self.InteractorStyle
+
+	def SetHapticDevice(self, device):
+		self.HapticDevice = device
+
+	def GetHapticDevice(self):
+		return self.HapticDevice
+
+	def InteractionOn(self):
+		self.Interaction = True
+
+	def InteractionOff(self):
+		self.Interaction = False
+
+	def SetCollisionModeToSimple(self):
+		pass
+
+	def GetCollisions(self):
+		return self.Collisions
+
+	def Initialize(self):
+		self.Scenario.Initialize()
+
+	def Step(self):
+		"""Move the elements and detect collisions."""
+		for e in self.Scenario.GetElements():
+			e.Update()
+		self.DetectCollisions()
+
+	def DetectCollisions(self):
+		"""Collide organ points against tool bounding boxes."""
+		self.Collisions.RemoveAllItems()
+		organs = list()
+		boxes = list()
+		objects = self.Scenario.GetObjects()
+		for o in objects.Items:
+			if o.IsA('vtkToolSingleChannel') and o.GetToolModel() == vtkToolSingleChannel.Camera:
+				continue
+			for e in o.GetElements().Items:
+				if not e.IsEnabled() or not e.GetCollisionModel():
+					continue
+				if o.IsA('vtkOrgan'):
+					organs.append(e)
+				elif o.IsA('vtkTool'):
+					points = e.GetCollisionPoints()
+					boxes.append((points.min(0), points.max(0)))
+
+		for e in organs:
+			points = e.GetCollisionPoints()
+			for lo, hi in boxes:
+				inside = numpy.flatnonzero(numpy.all((points >= lo) & (points <= hi), axis = 1))
+				for i in inside:
+					self.Collisions.AddItem(vtkCollision(e.GetObjectId(), e.GetId(), int(i), tuple(points[i])))
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class vtkSRMLReader(EsquiObject):
+	"""Build a simulation from a SRML file.
+
+	Mesh and texture file names are relative to the DataPath,
+	which is looked up from the working directory first and then
+	from the SRML file directory.
+	"""
+
+	def __init__(self):
+		EsquiObject.__init__(self)
+		self.FileName = ''
+
+	def SetFileName(self, filename):
+		self.FileName = filename
+
+	def GetFileName(self):
+		return self.FileName
+
+	def ConstructSimulation(self):
+		"""Return the simulation, or None if the file is not valid."""
+		try:
+			root = ElementTree.parse(self.FileName).getroot()
+		except (IOError, ElementTree.ParseError):
+			return None
+		if root.tag != 'Simulation':
+			return None
+
+		path = root.get('DataPath', '')
+		if not os.path.isabs(path) and not os.path.isdir(path):
+			path = os.path.join(os.path.dirname(self.FileName), path)
+
+		sim = vtkSimulation()
+		sim.SetName(root.get('Name', ''))
+		scenario = vtkScenario()
+		sim.SetScenario(scenario)
+
+		node = root.find('Scenario')
+		if node is None:
+			return None
+		scenario.SetName(node.get('Name', ''))
+		env = node.find('Environment')
+		if env is not None:
+			scenario.SetBackground(ParseVector(env.get('Background'), (1.0, 1.0, 1.0)))
+			cam = env.find('Cameras/Camera')
+			if cam is not None:
+				camera = scenario.GetCamera()
+				camera.SetPosition(ParseVector(cam.get('Position'), (0.0, 0.0, 1.0)))
+				camera.SetFocalPoint(ParseVector(cam.get('FocalPoint'), (0.0, 0.0, 0.0)))
+				camera.SetViewAngle(float(cam.get('ViewAngle', 30)))
+
+		for onode in node.findall('Objects/Object'):
+			scenario.AddObject(self.ConstructObject(onode, path))
+		return sim
+
+	def ConstructObject(self, node, path):
+		"""Return the scenario object of an Object node."""
+		if node.get('Type') == 'Organ':
+			o = vtkOrgan()
+		elif node.get('Type') == 'Tool' and node.get('Class') == 'SingleChannel':
+			o = vtkToolSingleChannel()
+			o.SetToolModel(vtkToolSingleChannel.Models.get(node.get('Model'), vtkToolSingleChannel.Camera))
+		else:
+			o = vtkScenarioObject()
+		o.SetName(node.get('Name', ''))
+		for enode in node.findall('Elements/Element'):
+			e = vtkScenarioElement()
+			e.SetName(enode.get('Name', ''))
+			e.SetPosition(ParseVector(enode.get('Position'), (0.0, 0.0, 0.0)))
+			e.SetOrientation(ParseVector(enode.get('Orientation'), (0.0, 0.0, 0.0)))
+			e.SetOrigin(ParseVector(enode.get('Origin'), (0.0, 0.0, 0.0)))
+			e.SetScale(ParseVector(enode.get('Scale'), (1.0, 1.0, 1.0)))
+			for mnode in enode.findall('Models/Model'):
+				if mnode.get('Type') == 'Visualization':
+					m = vtkVisualizationModel()
+					e.SetVisualizationModel(m)
+				elif mnode.get('Type') == 'Collision':
+					m = vtkCollisionModel()
+					e.SetCollisionModel(m)
+				else:
+					continue
+				m.SetName(mnode.get('Name', ''))
+				m.SetFileName(os.path.join(path, mnode.get('FileName', '')))
+				if mnode.get('TextureFileName'):
+					m.SetTextureFileName(os.path.join(path, mnode.get('TextureFileName')))
+				m.SetColor(ParseVector(mnode.get('Color'), (1.0, 1.0, 1.0)))
+				m.SetOpacity(float(mnode.get('Opacity', 1.0)))
+				m.SetVisibility(int(mnode.get('Visibility', 1)))
+			o.AddElement(e)
+		return o
@@ -0,0 +1,221 @@
+"""Headless session module.
+
+Here is defined the class HeadlessSession, which sets up a
+simulation like the main frame does, but rendering offscreen
+and without any GUI.
+"""
+
+from common import *
+from SimulationInteractorStyle import *
+from timers import *
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class HeadlessSession:
+	"""Stand-in of SimulationFrame for offscreen runs.
+
+	It owns the render window, interactor, interactor style and
+	simulation timer, and implements the frame callbacks used by
+	them. Tool ids follow the main frame tool buttons: scenario
+	order, one tool per model, -1 for the camera.
+
+	Usage:
+		session = HeadlessSession()
+		if session.Load('examples/example-cut.srml'):
+			session.timer.SimulationLoop()
+		session.Close()
+	"""
+
+	tool_names = ('camera', 'cauterizer', 'brush', 'cutter')
+
+	def __init__(self, size = (640, 480)):
+		"""Constructor."""
+		self.Size = size
+		self.FileName = None
+		self.simulation = None
+		self.scenario = None
+		self.style = None
+		self.timer = None
+		self.iren = None
+		self.use_haptic = False
+		self.Running = False
+		self.Tools = list()
+		self.SelectedTool = -1
+		self.selected_lens = 0
+		self.lens_angles = (0, 30, 70)
+
+	def Load(self, filename, device = None):
+		"""Read the SRML file and initialize the simulation.
+
+		An optional software haptic device replaces the simulation one.
+		Return False if the file is not valid.
+		"""
+		reader = vtkesqui.vtkSRMLReader()
+		reader.SetFileName(filename)
+		sim = reader.ConstructSimulation()
+		if not sim:
+			return False
+		self.FileName = filename
+		self.simulation = sim
+		sim.InteractionOn()
+		self.scenario = sim.GetScenario()
+
+		# Offscreen rendering and an interactor without window
+		self.renWin = vtk.vtkRenderWindow()
+		self.renWin.SetOffScreenRendering(1)
+		self.renWin.SetSize(*self.Size)
+		self.ren = vtk.vtkRenderer()
+		self.renWin.AddRenderer(self.ren)
+		self.iren = vtk.vtkGenericRenderWindowInteractor()
+		self.iren.SetRenderWindow(self.renWin)
+		self.scenario.SetRenderWindow(self.renWin)
+
+		# Same set up as the main frame
+		self.timer = SimulationTimer()
+		self.timer.parent = self
+		self.timer.SetSimulation(sim)
+		self.timer.SetHapticDevice(device)
+		models = dict()
+		objects = self.scenario.GetObjects()
+		objects.InitTraversal()
+		o = objects.GetNextObject()
+		while o:
+			if o.IsA('vtkOrgan'):
+				self.timer.AddHighlightObject(o)
+			elif o.IsA('vtkToolSingleChannel') and o.GetToolModel() != vtkesqui.vtkToolSingleChannel.Camera:
+				if o.GetToolModel() not in models:
+					models[o.GetToolModel()] = o
+					self.Tools.append(o)
+			o = objects.GetNextObject()
+		self.timer.HighlightOn()
+
+		self.style = MyStyle(self)
+		self.style.SetScenario(self.scenario)
+		sim.SetInteractorStyle(self.style)
+		self.iren.SetInteractorStyle(self.style)
+		self.iren.Initialize()
+
+		self.use_haptic = self.timer.Initialize()
+		self.timer.CuttingOff()
+		if self.use_haptic:
+			self.StartTimer()
+		return True
+
+	def Close(self):
+		"""Release the simulation resources."""
+		if self.timer:
+			self.timer.Shutdown()
+			self.timer.Reset()
+		self.Running = False
+		self.iren = None
+		self.renWin = None
+
+	def StartTimer(self):
+		"""Mark the simulation as running. The owner calls the timer."""
+		self.Running = True
+
+	def GetToolName(self, tool_id):
+		"""Return the name of the tool with the id given."""
+		if tool_id < 0:
+			return 'camera'
+		model = self.Tools[tool_id].GetToolModel()
+		if model == vtkesqui.vtkToolSingleChannel.Cutter:
+			return 'cutter'
+		elif model == vtkesqui.vtkToolSingleChannel.Brush:
+			return 'brush'
+		return 'cauterizer'
+
+	def SelectTool(self, tool_id):
+		"""Select the tool with the ID given, or the camera if selected."""
+		if tool_id < 0 or tool_id >= len(self.Tools):
+			return
+		if not self.style.ChangeTool(tool_id):
+			return
+		if self.SelectedTool == tool_id:
+			self.SelectedTool = -1
+		else:
+			self.SelectedTool = tool_id
+		self.ApplyToolSelection()
+
+	def ApplyToolSelection(self):
+		"""Update haptic tools and cutting mode after a tool change."""
+		if self.use_haptic:
+			haptic = self.timer.haptic
+			haptic.GetTools().RemoveAllItems()
+			if self.SelectedTool >= 0:
+				haptic.AddTool(self.Tools[self.SelectedTool])
+		if self.GetToolName(self.SelectedTool) == 'cutter':
+			self.timer.CuttingOn()
+		else:
+			self.timer.CuttingOff()
+
+	def SelectPreviousTool(self):
+		"""Move the tool selection upwards, wrapping around."""
+		tool_id = self.SelectedTool - 1
+		if tool_id < -1:
+			tool_id = len(self.Tools) - 1
+		if self.style.ChangeTool(max(tool_id, 0)):
+			self.SelectedTool = tool_id
+			self.ApplyToolSelection()
+
+	def SelectNextTool(self):
+		"""Move the tool selection downwards, wrapping around."""
+		tool_id = self.SelectedTool + 1
+		if tool_id >= len(self.Tools):
+			tool_id = -1
+		if self.style.ChangeTool(max(tool_id, 0)):
+			self.SelectedTool = tool_id
+			self.ApplyToolSelection()
+
+	def OnToolButtonId(self, tool_id):
+		"""Press the tool button given by its position in tool_names."""
+		name = self.tool_names[tool_id]
+		for i in xrange(len(self.Tools)):
+			if self.GetToolName(i) == name:
+				if self.SelectedTool != i:
+					self.SelectTool(i)
+				return
+		if name == 'camera' and self.SelectedTool >= 0:
+			if self.style.ChangeTool(self.SelectedTool):
+				self.SelectedTool = -1
+				self.ApplyToolSelection()
+
+	def ChangeLens(self, angle):
+		"""Change lens inclination angle."""
+		if self.use_haptic:
+			self.timer.haptic.SetLensAngle(angle)
+		else:
+			self.style.SetLensAngle(angle)
+
+	def OnLensButton(self, lens_id):
+		"""Press the lens button given."""
+		self.ChangeLens(self.lens_angles[lens_id])
+		self.selected_lens = lens_id
+		self.StartTimer()
+
+	def SelectPreviousLens(self):
+		self.selected_lens = (self.selected_lens - 1) % len(self.lens_angles)
+
+	def SelectNextLens(self):
+		self.selected_lens = (self.selected_lens + 1) % len(self.lens_angles)
+
+	def ApplyLensSelection(self):
+		self.ChangeLens(self.lens_angles[self.selected_lens])
+
+	# GUI-only callbacks
+	def ShowExtractText(self):
+		pass
+
+	def ShowLenses(self):
+		pass
+
+	def ShowSimulation(self):
+		pass
+
+	def ShowToolWarning(self):
+		pass
+
+	def UpdateNail(self, depth):
+		pass
+
+	def AddToolInsertion(self, step):
+		pass
@@ -0,0 +1,42 @@
+"""Headless wx stand-in module.
+
+Provide the few wx pieces used out of the GUI (timer base
+class and CallAfter), so that simulation code can run on
+machines without wxPython or without a display.
+"""
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class Timer:
+	"""wx.Timer stand-in. It never fires: Notify must be called by the owner."""
+
+	def __init__(self):
+		self.Interval = -1
+		self.Running = False
+
+	def Start(self, milliseconds = -1, oneShot = False):
+		"""Mark the timer as running."""
+		if milliseconds > 0:
+			self.Interval = milliseconds
+		self.Running = True
+		return True
+
+	def Stop(self):
+		"""Mark the timer as stopped."""
+		self.Running = False
+
+	def IsRunning(self):
+		"""Check whether the timer has been started."""
+		return self.Running
+
+	def GetInterval(self):
+		"""Return the interval given on start."""
+		return self.Interval
+
+	def Notify(self):
+		"""Timer callback. To be implemented by subclasses."""
+		pass
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def CallAfter(func, *args, **kwargs):
+	"""There is no event loop: call right away."""
+	func(*args, **kwargs)
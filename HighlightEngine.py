@@ -0,0 +1,398 @@
+"""Highlight engine module.
+
+Here is defined the class HighlightEngine, which marks the
+cells of the elements touched by the tools.
+"""
+
+import vtk
+import numpy
+from vtk.util import numpy_support
+from ElementTopology import *
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class HighlightEngine:
+	"""Highlight registered elements on collisions.
+
+	Three modes are available:
+		Overlay: colliding cells are extracted into a translucent
+		         red actor drawn over each element.
+		Scalars: colliding cells are tinted in place through a cell
+		         colour array of the rendered polydata. Only the cells
+		         that changed since the last frame are written.
+		Batched: colliding cells of all elements are appended, in world
+		         coordinates, into a single polydata drawn by one actor.
+		         The actor is created on the first collision.
+
+	Every element keeps a signature of its last contact cell set and
+	transform, so the VTK work is skipped while neither changes.
+	Skipped and performed updates are counted for profiling.
+
+	Usage:
+		engine = HighlightEngine()
+		engine.SetRenderer(ren)
+		engine.AddElement(element)
+		engine.Initialize()
+		engine.Update(collision_snapshot)
+	"""
+
+	Overlay = 0
+	Scalars = 1
+	Batched = 2
+
+	ArrayName = 'HighlightColors'
+	BaseColor = (255, 255, 255)
+	HighlightColor = (255, 80, 80)
+
+	def __init__(self):
+		"""Constructor."""
+		self.Mode = HighlightEngine.Overlay
+		self.RingDepth = 1
+		self.Initialized = False
+		self.ren = None
+		self.EmptyPD = vtk.vtkPolyData()
+		self.Elements = list()
+		self.Topologies = list()
+		self.Signatures = list()
+		self.Updates = 0
+		self.SkippedUpdates = 0
+		# Overlay mode
+		self.Extractors = list()
+		self.GFilters = list()
+		self.Mappers = list()
+		self.Actors = list()
+		# Scalars mode
+		self.ColorArrays = list()
+		self.ColorViews = list()
+		self.Masks = list()
+		# Batched mode
+		self.Chunks = list()
+		self.BatchActor = None
+
+	def SetRenderer(self, ren):
+		"""Set the renderer overlays are added to."""
+		self.ren = ren
+
+	def SetModeToOverlay(self):
+		"""Highlight through one overlay actor per element."""
+		self.Mode = HighlightEngine.Overlay
+
+	def SetModeToScalars(self):
+		"""Highlight through in-place cell colours."""
+		self.Mode = HighlightEngine.Scalars
+
+	def SetModeToBatched(self):
+		"""Highlight through a single overlay actor shared by all elements."""
+		self.Mode = HighlightEngine.Batched
+
+	def SetRingDepth(self, depth):
+		"""Set the number of neighbour cell rings highlighted around a collision."""
+		self.RingDepth = max(0, int(depth))
+
+	def GetNumberOfUpdates(self):
+		"""Return the number of element highlight updates performed."""
+		return self.Updates
+
+	def GetNumberOfSkippedUpdates(self):
+		"""Return the number of element highlight updates skipped as unchanged."""
+		return self.SkippedUpdates
+
+	def ResetCounters(self):
+		"""Restart the update counters."""
+		self.Updates = 0
+		self.SkippedUpdates = 0
+
+	def AddElement(self, element):
+		"""Add an element to highlight on collision."""
+		self.Elements.append(element)
+
+	def Initialize(self):
+		"""Build the per-element highlight resources."""
+		if self.Initialized:
+			return
+		self.Initialized = True
+
+		for e in self.Elements:
+			# Collision to visualization point map
+			topology = ElementTopology(e)
+			topology.Build()
+			self.Topologies.append(topology)
+			self.Signatures.append(None)
+
+			if self.Mode == HighlightEngine.Overlay:
+				self.InitializeOverlay(e)
+			elif self.Mode == HighlightEngine.Scalars:
+				self.InitializeScalars(e, topology)
+			else:
+				self.Chunks.append(None)
+
+	def InitializeOverlay(self, e):
+		"""Create the extract/geometry/mapper chain of an element."""
+		vis = e.GetVisualizationModel()
+		extractor = vtk.vtkExtractCells()
+		extractor.SetInput(vis.GetInput())
+		gfilter = vtk.vtkGeometryFilter()
+		mapper = vtk.vtkPolyDataMapper()
+		actor = vtk.vtkActor()
+		actor.SetMapper(mapper)
+		actor.GetProperty().SetColor(1,0,0)
+		actor.GetProperty().SetOpacity(0.5)
+		if e.is_cavity:
+			actor.SetScale(0.99)
+		else:
+			actor.SetScale(1.01)
+		# Add to lists
+		self.Extractors.append(extractor)
+		self.GFilters.append(gfilter)
+		self.Mappers.append(mapper)
+		self.Actors.append(actor)
+		# Add to renderer
+		self.ren.AddActor(actor)
+
+	def InitializeScalars(self, e, topology):
+		"""Attach a cell colour array to the rendered polydata of an element."""
+		self.ColorArrays.append(None)
+		self.ColorViews.append(None)
+		self.Masks.append(None)
+		self.BuildColors(len(self.Topologies) - 1)
+
+		mapper = e.GetVisualizationModel().GetActor().GetMapper()
+		mapper.SetScalarModeToUseCellFieldData()
+		mapper.SelectColorArray(HighlightEngine.ArrayName)
+		mapper.SetColorModeToDefault()
+		mapper.ScalarVisibilityOn()
+
+	def BuildColors(self, eid):
+		"""(Re)create the cell colour array of an element."""
+		num_cells = self.Topologies[eid].GetNumberOfCells()
+		colors = vtk.vtkUnsignedCharArray()
+		colors.SetName(HighlightEngine.ArrayName)
+		colors.SetNumberOfComponents(3)
+		colors.SetNumberOfTuples(num_cells)
+		# Zero-copy view over the VTK buffer
+		view = numpy_support.vtk_to_numpy(colors)
+		view[:] = HighlightEngine.BaseColor
+		self.ColorArrays[eid] = colors
+		self.ColorViews[eid] = view
+		self.Masks[eid] = numpy.zeros(num_cells, numpy.bool_)
+		self.AttachColors(self.Elements[eid], colors)
+
+	def AttachColors(self, e, colors):
+		"""Make sure the colour array is on the rendered polydata.
+
+		The array is added again if the visualization model has
+		re-executed and produced a new output.
+		"""
+		vis = e.GetVisualizationModel()
+		vis.Update()
+		celldata = vis.GetOutput().GetCellData()
+		if celldata.GetArray(HighlightEngine.ArrayName) is not colors:
+			celldata.RemoveArray(HighlightEngine.ArrayName)
+			celldata.AddArray(colors)
+
+	def Reset(self):
+		"""Remove every highlight resource."""
+		for a in self.Actors:
+			self.ren.RemoveActor(a)
+		if self.BatchActor:
+			self.ren.RemoveActor(self.BatchActor)
+		for eid in xrange(len(self.ColorArrays)):
+			e = self.Elements[eid]
+			e.GetVisualizationModel().GetOutput().GetCellData().RemoveArray(HighlightEngine.ArrayName)
+			e.GetVisualizationModel().GetActor().GetMapper().ScalarVisibilityOff()
+
+		self.Initialized = False
+		self.Elements = list()
+		self.Topologies = list()
+		self.Signatures = list()
+		self.Extractors = list()
+		self.GFilters = list()
+		self.Mappers = list()
+		self.Actors = list()
+		self.ColorArrays = list()
+		self.ColorViews = list()
+		self.Masks = list()
+		self.Chunks = list()
+		self.BatchActor = None
+
+	def Update(self, collisions):
+		"""Highlight registered elements on collisions.
+
+		Working order:
+			1. Get ColPoints.
+			2. Map to VisPoints.
+			3. Get correspondant cells.
+			4. Get some neighbour cells.
+			5. Highlight them.
+		"""
+		batch_changed = False
+		for eid in xrange(len(self.Elements)):
+			e = self.Elements[eid]
+			if not e.IsEnabled():
+				# Cut elements leave the batch
+				if self.Mode == HighlightEngine.Batched and self.Chunks[eid] is not None:
+					self.Chunks[eid] = None
+					batch_changed = True
+				continue
+
+			# Get point IDs
+			pids = collisions.GetPointIds(e.GetObjectId(), e.GetId())
+
+			# Map to VisPoints. Table only rebuilt on geometry changes.
+			topology = self.Topologies[eid]
+			topology.Update()
+			visIds = topology.MapCollisionPoints(pids)
+
+			# Get cells and some neighbour rings of them
+			cellIds = topology.GetCellRing(visIds, self.RingDepth)
+
+			# Nothing to do if neither the cells nor the transform changed
+			signature = self.GetSignature(e, cellIds)
+			if signature == self.Signatures[eid]:
+				self.SkippedUpdates += 1
+				continue
+			self.Signatures[eid] = signature
+			self.Updates += 1
+
+			# Highlight them
+			if self.Mode == HighlightEngine.Overlay:
+				self.UpdateOverlay(eid, cellIds)
+			elif self.Mode == HighlightEngine.Scalars:
+				self.UpdateScalars(eid, cellIds)
+			else:
+				self.UpdateChunk(eid, cellIds)
+				batch_changed = True
+
+		if batch_changed:
+			self.UpdateBatch()
+
+	def GetTintedElements(self):
+		"""Return the elements whose own cells are tinted (Scalars mode)."""
+		if self.Mode != HighlightEngine.Scalars:
+			return list()
+		return [self.Elements[eid] for eid in xrange(len(self.Elements))
+			if self.Signatures[eid] and self.Signatures[eid][0] > 0]
+
+	def GetSignature(self, e, cellIds):
+		"""Return a cheap signature of a contact cell set and the element transform."""
+		actor = e.GetCollisionModel().GetActor()
+		matrix = actor.GetUserMatrix()
+		if matrix:
+			transform = tuple([matrix.GetElement(i, j) for i in xrange(4) for j in xrange(4)])
+		else:
+			transform = None
+		return (cellIds.size, hash(cellIds.tobytes()), actor.GetMTime(), transform)
+
+	def UpdateOverlay(self, eid, cellIds):
+		"""Extract the cells given into the overlay actor of an element."""
+		e = self.Elements[eid]
+		col = e.GetCollisionModel()
+		if cellIds.size == 0:
+			self.Mappers[eid].SetInput(self.EmptyPD)
+		else:
+			cids = vtk.vtkIdList()
+			cids.SetNumberOfIds(cellIds.size)
+			for i in xrange(cellIds.size):
+				cids.SetId(i, int(cellIds[i]))
+			self.Extractors[eid].SetCellList(cids)
+			self.Extractors[eid].Update()
+			self.GFilters[eid].SetInput(self.Extractors[eid].GetOutput())
+			self.GFilters[eid].Update()
+			self.Mappers[eid].SetInput(self.GFilters[eid].GetOutput())
+
+		self.Mappers[eid].Update()
+		self.Actors[eid].SetUserMatrix(col.GetActor().GetUserMatrix())
+
+	def UpdateScalars(self, eid, cellIds):
+		"""Tint the cells given, touching only the ones that changed."""
+		if self.Masks[eid].size != self.Topologies[eid].GetNumberOfCells():
+			self.BuildColors(eid)
+		mask = numpy.zeros(self.Masks[eid].size, numpy.bool_)
+		mask[cellIds] = True
+		changed = numpy.flatnonzero(mask != self.Masks[eid])
+		self.Masks[eid] = mask
+		self.AttachColors(self.Elements[eid], self.ColorArrays[eid])
+		if changed.size == 0:
+			return
+
+		view = self.ColorViews[eid]
+		view[changed] = HighlightEngine.BaseColor
+		view[changed[mask[changed]]] = HighlightEngine.HighlightColor
+		self.ColorArrays[eid].Modified()
+
+	def UpdateChunk(self, eid, cellIds):
+		"""Compute the world-space piece of the batch for an element.
+
+		The chunk is a (points, counts, connectivity) tuple, or None
+		if the element has no highlighted cells. Only polygons go
+		into the batch, which is drawn as polygons.
+		"""
+		cellIds = self.Topologies[eid].GetPolyCells(cellIds)
+		if cellIds.size == 0:
+			self.Chunks[eid] = None
+			return
+
+		e = self.Elements[eid]
+		topology = self.Topologies[eid]
+		vispd = topology.GetVisualizationPolyData()
+
+		# Cell connectivity renumbered over the points used
+		counts = numpy.diff(topology.CellOffsets)[cellIds]
+		pids = GatherRanges(topology.CellOffsets, topology.CellPoints, cellIds)
+		used, connectivity = numpy.unique(pids, return_inverse=True)
+
+		# Same placement as the overlay actor: user matrix and scale
+		points = numpy_support.vtk_to_numpy(vispd.GetPoints().GetData())[used]
+		if e.is_cavity:
+			points = points*0.99
+		else:
+			points = points*1.01
+		matrix = e.GetCollisionModel().GetActor().GetUserMatrix()
+		if matrix:
+			m = numpy.array([[matrix.GetElement(i, j) for j in xrange(4)] for i in xrange(4)])
+			points = numpy.dot(points, m[:3,:3].T) + m[:3,3]
+
+		self.Chunks[eid] = (points, counts, connectivity)
+
+	def UpdateBatch(self):
+		"""Rebuild the batched polydata from the element chunks."""
+		chunks = [c for c in self.Chunks if c is not None]
+		if not chunks:
+			if self.BatchActor:
+				self.BatchActor.GetMapper().SetInput(self.EmptyPD)
+			return
+
+		# Append all chunks, shifting point IDs
+		points = list()
+		cells = list()
+		num_cells = 0
+		base = 0
+		for p, counts, connectivity in chunks:
+			# Legacy cell array layout: n, id_0, ..., id_n-1, ...
+			starts = numpy.cumsum(counts + 1) - (counts + 1)
+			legacy = numpy.empty(connectivity.size + counts.size, numpy_support.ID_TYPE_CODE)
+			is_count = numpy.zeros(legacy.size, numpy.bool_)
+			is_count[starts] = True
+			legacy[is_count] = counts
+			legacy[~is_count] = connectivity + base
+			points.append(p)
+			cells.append(legacy)
+			num_cells += counts.size
+			base += p.shape[0]
+
+		vtk_points = vtk.vtkPoints()
+		vtk_points.SetData(numpy_support.numpy_to_vtk(numpy.concatenate(points), deep=1))
+		polys = vtk.vtkCellArray()
+		polys.SetCells(num_cells, numpy_support.numpy_to_vtkIdTypeArray(numpy.concatenate(cells), deep=1))
+		pd = vtk.vtkPolyData()
+		pd.SetPoints(vtk_points)
+		pd.SetPolys(polys)
+
+		# Created lazily on the first collision
+		if not self.BatchActor:
+			mapper = vtk.vtkPolyDataMapper()
+			self.BatchActor = actor = vtk.vtkActor()
+			actor.SetMapper(mapper)
+			actor.GetProperty().SetColor(1,0,0)
+			actor.GetProperty().SetOpacity(0.5)
+			self.ren.AddActor(actor)
+		self.BatchActor.GetMapper().SetInput(pd)
@@ -0,0 +1,295 @@
+"""Input recording module.
+
+Here are defined the classes InputRecorder and InputReplayer,
+which save the user inputs of a session into a compact binary
+log and feed them back through the same entry points.
+"""
+
+import os
+import time
+import struct
+import numpy
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Log layout: a header followed by fixed-size little-endian records.
+#   header: magic, record size, scene name length, tick period (s), scene name
+#   record: time (s), type, flags, keysym, x, y, 6 values
+# Version 1 logs have no tick period.
+LogMagic = b'HYSREC02'
+LogHeader = struct.Struct('<8sHHd')
+LogMagicV1 = b'HYSREC01'
+LogHeaderV1 = struct.Struct('<8sHH')
+LogRecord = struct.Struct('<dBB8shh6f')
+LogRecordType = numpy.dtype([('time', '<f8'), ('type', 'u1'), ('flags', 'u1'),
+	('keysym', 'S8'), ('x', '<i2'), ('y', '<i2'), ('values', '<f4', (6,))])
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class InputRecorder:
+	"""Append the inputs of a session to a binary log.
+
+	Records are packed in memory and written in blocks. Haptic
+	and camera records are only written when their values change.
+
+	The timer tick period is saved in the header, so sessions
+	are replayed with the step they were recorded with.
+
+	Usage:
+		recorder = InputRecorder('session.hrec', 'examples/example-cut.srml', period = 0.04)
+		recorder.RecordKey('z', shift, ctrl)
+		recorder.Close()
+	"""
+
+	# Record types
+	Key = 1
+	MouseMove = 2
+	LeftButtonPress = 3
+	LeftButtonRelease = 4
+	MouseWheelForward = 5
+	MouseWheelBackward = 6
+	Haptic = 7
+	Camera = 8
+	Lens = 9
+	Tool = 10
+
+	# Record flags
+	Shift = 1
+	Control = 2
+	LeftPedal = 4
+	RightPedal = 8
+
+	def __init__(self, filename, scene = '', buffer_records = 4096, clock = time.time, period = 0.0):
+		"""Constructor.
+
+		The scene is the SRML file of the session and the period the
+		timer tick period in seconds, 0 if unknown.
+		"""
+		new = not os.path.exists(filename) or os.path.getsize(filename) == 0
+		self.File = open(filename, 'ab')
+		if new:
+			scene = scene.encode('utf-8')
+			self.File.write(LogHeader.pack(LogMagic, LogRecord.size, len(scene), period) + scene)
+		self.Clock = clock
+		self.BufferRecords = buffer_records
+		self.Buffer = list()
+		self.Records = 0
+		self.__haptic = None
+		self.__camera_time = None
+
+	def Record(self, rtype, flags = 0, keysym = '', x = 0, y = 0, values = (0,0,0,0,0,0)):
+		"""Add a record stamped with the current time."""
+		self.Buffer.append(LogRecord.pack(self.Clock(), rtype, flags,
+			keysym.encode('ascii'), x, y, *values))
+		self.Records += 1
+		if len(self.Buffer) >= self.BufferRecords:
+			self.Flush()
+
+	def RecordKey(self, keysym, shift, ctrl, x = 0, y = 0):
+		"""Record a key press."""
+		flags = InputRecorder.Shift*bool(shift) | InputRecorder.Control*bool(ctrl)
+		self.Record(InputRecorder.Key, flags, (keysym or '')[:8], x, y)
+
+	def RecordMouse(self, rtype, x, y, shift, ctrl):
+		"""Record a mouse event of the type given (MouseMove, LeftButtonPress...)."""
+		flags = InputRecorder.Shift*bool(shift) | InputRecorder.Control*bool(ctrl)
+		self.Record(rtype, flags, '', x, y)
+
+	def RecordHaptic(self, state, insertion):
+		"""Record the haptic state given, if changed."""
+		flags = InputRecorder.LeftPedal*bool(state.LeftPedal) | \
+			InputRecorder.RightPedal*bool(state.RightPedal)
+		values = (state.Depth, state.Roll, state.Opening, insertion, 0, 0)
+		if (flags, values) != self.__haptic:
+			self.__haptic = (flags, values)
+			self.Record(InputRecorder.Haptic, flags, '', 0, 0, values)
+
+	def RecordCamera(self, camera):
+		"""Record the camera pose, if changed."""
+		mtime = camera.GetMTime()
+		if mtime != self.__camera_time:
+			self.__camera_time = mtime
+			self.Record(InputRecorder.Camera, values = camera.GetPosition() + camera.GetFocalPoint())
+
+	def RecordLens(self, lens_id):
+		"""Record the selection of a lens button."""
+		self.Record(InputRecorder.Lens, x = lens_id)
+
+	def RecordTool(self, tool_id):
+		"""Record the selection of a tool button."""
+		self.Record(InputRecorder.Tool, x = tool_id)
+
+	def Flush(self):
+		"""Write the buffered records."""
+		if self.Buffer:
+			self.File.write(b''.join(self.Buffer))
+			self.Buffer = list()
+		self.File.flush()
+
+	def Close(self):
+		"""Write the buffered records and close the log."""
+		if self.File:
+			self.Flush()
+			self.File.close()
+			self.File = None
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def ReadInputLog(filename):
+	"""Return the scene name, tick period and records array of a log.
+
+	The period is 0 for logs that do not have it.
+	"""
+	f = open(filename, 'rb')
+	try:
+		data = f.read()
+	finally:
+		f.close()
+	try:
+		if data[:len(LogMagicV1)] == LogMagicV1:
+			magic, size, length = LogHeaderV1.unpack_from(data)
+			period = 0.0
+			header = LogHeaderV1.size
+		else:
+			magic, size, length, period = LogHeader.unpack_from(data)
+			header = LogHeader.size
+	except struct.error:
+		magic = None
+	if magic not in (LogMagic, LogMagicV1) or size != LogRecordType.itemsize:
+		raise ValueError('Not a HysTrainer input log: %s' % filename)
+	start = header + length
+	scene = data[header:start].decode('utf-8')
+	count = (len(data) - start)//size
+	records = numpy.frombuffer(data, LogRecordType, count, start)
+	return scene, period, records
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class InputReplayer:
+	"""Feed a recorded session back into the application.
+
+	Key and mouse records are sent to the interactor as the wx
+	widget does, so they go through the interactor style. Haptic
+	and camera records are set on a software device, which the
+	timer polls as a real one. Lens and tool records call the
+	main frame button callbacks.
+
+	Usage:
+		replayer = InputReplayer('session.hrec')
+		replayer.SetInteractor(iren)
+		replayer.SetDevice(SoftwareSBM())
+		replayer.SetFrame(frame)
+		replayer.Start()
+		# On every tick
+		replayer.Feed()
+	"""
+
+	def __init__(self, filename, clock = time.time):
+		"""Constructor."""
+		self.FileName = filename
+		self.Scene, self.Period, self.Records = ReadInputLog(filename)
+		self.Clock = clock
+		self.Interactor = None
+		self.Device = None
+		self.Frame = None
+		self.Index = 0
+		self.StartTime = 0
+		self.FirstTime = 0
+		if self.Records.size:
+			self.FirstTime = self.Records['time'][0]
+
+	def SetInteractor(self, iren):
+		self.Interactor = iren
+
+	def SetDevice(self, device):
+		self.Device = device
+
+	def SetFrame(self, frame):
+		self.Frame = frame
+
+	def GetScene(self):
+		"""Return the SRML file of the session."""
+		return self.Scene
+
+	def GetTickPeriod(self):
+		"""Return the timer tick period of the session in seconds, 0 if unknown."""
+		return self.Period
+
+	def GetDuration(self):
+		"""Return the session duration in seconds."""
+		if not self.Records.size:
+			return 0.0
+		return float(self.Records['time'][-1] - self.FirstTime)
+
+	def UsesHaptic(self):
+		"""Check whether the session was driven by the haptic device."""
+		return bool(numpy.any(self.Records['type'] == InputRecorder.Haptic))
+
+	def IsFinished(self):
+		"""Check whether all records have been fed."""
+		return self.Index >= self.Records.size
+
+	def Start(self):
+		"""Replay from the beginning, in real time from now."""
+		self.Index = 0
+		self.StartTime = self.Clock()
+
+	def Feed(self, elapsed = None):
+		"""Dispatch the records up to the session time given.
+
+		By default, the real time elapsed since Start.
+		Return the number of records dispatched.
+		"""
+		if elapsed is None:
+			elapsed = self.Clock() - self.StartTime
+		times = self.Records['time']
+		end = numpy.searchsorted(times, self.FirstTime + elapsed, 'right')
+		start = self.Index
+		for i in xrange(start, end):
+			self.Dispatch(self.Records[i])
+		self.Index = max(start, end)
+		return self.Index - start
+
+	def Dispatch(self, record):
+		"""Send a record to its entry point."""
+		rtype = int(record['type'])
+		flags = int(record['flags'])
+		if rtype == InputRecorder.Haptic or rtype == InputRecorder.Camera:
+			if not self.Device:
+				return
+			v = record['values']
+			if rtype == InputRecorder.Haptic:
+				self.Device.SetLeftToolDepth(float(v[0]))
+				self.Device.SetLeftToolRoll(float(v[1]))
+				self.Device.SetLeftToolOpening(float(v[2]))
+				self.Device.SetToolInsertion(float(v[3]))
+				self.Device.SetLeftPedalState(int(bool(flags & InputRecorder.LeftPedal)))
+				self.Device.SetRightPedalState(int(bool(flags & InputRecorder.RightPedal)))
+			else:
+				self.Device.SetCameraPose(v[:3], v[3:])
+		elif rtype == InputRecorder.Lens:
+			if self.Frame:
+				self.Frame.OnLensButton(int(record['x']))
+		elif rtype == InputRecorder.Tool:
+			if self.Frame:
+				self.Frame.OnToolButtonId(int(record['x']))
+		elif self.Interactor:
+			iren = self.Interactor
+			x = int(record['x'])
+			y = int(record['y'])
+			ctrl = int(bool(flags & InputRecorder.Control))
+			shift = int(bool(flags & InputRecorder.Shift))
+			if rtype == InputRecorder.Key:
+				keysym = record['keysym'].decode('ascii')
+				key = keysym if len(keysym) == 1 else chr(0)
+				iren.SetEventInformation(x, y, ctrl, shift, key, 0, keysym)
+				iren.KeyPressEvent()
+				iren.CharEvent()
+			else:
+				iren.SetEventInformation(x, y, ctrl, shift)
+				if rtype == InputRecorder.MouseMove:
+					iren.MouseMoveEvent()
+				elif rtype == InputRecorder.LeftButtonPress:
+					iren.LeftButtonPressEvent()
+				elif rtype == InputRecorder.LeftButtonRelease:
+					iren.LeftButtonReleaseEvent()
+				elif rtype == InputRecorder.MouseWheelForward:
+					iren.MouseWheelForwardEvent()
+				elif rtype == InputRecorder.MouseWheelBackward:
+					iren.MouseWheelBackwardEvent()
@@ -88,7 +88,10 @@ class LensDisk:
 		return [self.diskActor, self.triangleActor]
 	
 	def Update(self):
-		"""Update the lens position."""
+		"""Update the lens position.
+
+		Return True if the lens has moved.
+		"""
 
 		# Set new position
 		p0 = self.p
@@ -106,6 +109,8 @@ class LensDisk:
 
 			self.p = p1
 			self.d = d1
+			return True
+		return False
 
 	def Rotate(self, angle):
 		"""Rotate the lens."""
@@ -0,0 +1,141 @@
+"""Level of detail module.
+
+Here is defined the class LevelOfDetail, which renders the
+elements with decimated meshes while they look small.
+"""
+
+from common import *
+import math
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def Decimate(pd, reduction):
+	"""Return a polydata with a fraction of the triangles removed.
+
+	Points are not moved, so the remaining ones keep their
+	normals and texture coordinates.
+	"""
+	triangles = vtk.vtkTriangleFilter()
+	triangles.SetInput(pd)
+	decimate = vtk.vtkDecimatePro()
+	decimate.SetInputConnection(triangles.GetOutputPort())
+	decimate.SetTargetReduction(reduction)
+	decimate.PreserveTopologyOn()
+	decimate.Update()
+	return decimate.GetOutput()
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class LevelOfDetail:
+	"""Switch the mesh rendered for each element by its size on screen.
+
+	Level 0 is the full mesh. Further levels are decimated from
+	it when the element is added, and cached on disk if a mesh
+	cache is given. Small meshes get no levels.
+
+	On update, the size of every element is estimated as the
+	fraction of the view its bounding sphere covers. Below each
+	of the ScreenSizes, the next level is rendered. Elements the
+	camera is inside of are always rendered in full.
+
+	Only the input of the element actor mapper is switched. The
+	visualization model output stays at full resolution, so
+	collisions, highlight overlays and cuts work on it as before.
+	Elements whose cells are tinted in place by the highlighter
+	must be given as pinned, so they are rendered in full.
+
+	Usage:
+		lod = LevelOfDetail(MeshCache())
+		lod.AddElement(element)
+		# Before every render
+		lod.Update(camera, pinned)
+		...
+		lod.Reset()
+	"""
+
+	def __init__(self, cache = None, reductions = (0.5, 0.8)):
+		"""Constructor. Reductions is the triangle fraction removed per level."""
+		self.Cache = cache
+		self.Reductions = reductions
+		self.ScreenSizes = (0.3, 0.1)
+		self.MinPolys = 1000
+		self.Elements = list()
+		self.Levels = list()
+		self.FullInputs = list()
+		self.Current = list()
+		self.Switches = 0
+
+	def AddElement(self, e):
+		"""Add an element and build its levels."""
+		vis = e.GetVisualizationModel()
+		vis.Update()
+		pd = vis.GetOutput()
+		levels = [pd]
+		if pd.GetNumberOfPolys() >= self.MinPolys:
+			for reduction in self.Reductions:
+				level = None
+				if self.Cache and vis.GetFileName():
+					build = lambda filename, r=reduction: Decimate(pd, r)
+					level = self.Cache.Read(vis.GetFileName(), 'decimate-%g' % reduction, build)
+				if level is None:
+					level = Decimate(pd, reduction)
+				levels.append(level)
+		self.Elements.append(e)
+		self.Levels.append(levels)
+		self.FullInputs.append(vis.GetActor().GetMapper().GetInputConnection(0, 0))
+		self.Current.append(0)
+
+	def GetLevel(self, camera, e):
+		"""Return the level an element should be rendered with."""
+		b = e.GetVisualizationModel().GetActor().GetBounds()
+		center = [(b[2*i] + b[2*i+1])/2.0 for i in xrange(3)]
+		radius = math.sqrt(sum([(b[2*i+1] - b[2*i])**2 for i in xrange(3)]))/2.0
+		eye = camera.GetPosition()
+		distance = math.sqrt(sum([(eye[i] - center[i])**2 for i in xrange(3)]))
+		if distance <= radius:
+			return 0
+		size = radius/(distance*math.tan(math.radians(camera.GetViewAngle())/2.0))
+		level = 0
+		for limit in self.ScreenSizes:
+			if size >= limit:
+				break
+			level += 1
+		return level
+
+	def Update(self, camera, pinned = ()):
+		"""Switch the level of every element for the camera given."""
+		for eid in xrange(len(self.Elements)):
+			levels = self.Levels[eid]
+			if len(levels) == 1:
+				continue
+			e = self.Elements[eid]
+			level = 0
+			if e.IsEnabled() and e not in pinned:
+				level = min(self.GetLevel(camera, e), len(levels) - 1)
+			if level != self.Current[eid]:
+				self.SetLevel(eid, level)
+
+	def SetLevel(self, eid, level):
+		"""Render an element with the level given."""
+		mapper = self.Elements[eid].GetVisualizationModel().GetActor().GetMapper()
+		if level == 0 and self.FullInputs[eid]:
+			mapper.SetInputConnection(self.FullInputs[eid])
+		else:
+			mapper.SetInput(self.Levels[eid][level])
+		self.Current[eid] = level
+		self.Switches += 1
+
+	def GetStatistics(self):
+		"""Return the number of elements at each level and the switches done."""
+		counts = [0]*(len(self.Reductions) + 1)
+		for level in self.Current:
+			counts[level] += 1
+		return {'levels': counts, 'switches': self.Switches}
+
+	def Reset(self):
+		"""Render every element in full and forget them."""
+		for eid in xrange(len(self.Elements)):
+			if self.Current[eid]:
+				self.SetLevel(eid, 0)
+		self.Elements = list()
+		self.Levels = list()
+		self.FullInputs = list()
+		self.Current = list()
@@ -0,0 +1,268 @@
+"""Mesh cache module.
+
+Here is defined the class MeshCache, which keeps the meshes
+of the scenarios as raw arrays that can be mapped in memory.
+"""
+
+from common import *
+from CuttingEngine import PolyDataToArrays
+from vtk.util import numpy_support
+import json
+import shutil
+import hashlib
+import threading
+import numpy
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def HashFile(filename, block = 1 << 20):
+	"""Return the SHA-1 hex digest of a file contents."""
+	h = hashlib.sha1()
+	f = open(filename, 'rb')
+	try:
+		data = f.read(block)
+		while data:
+			h.update(data)
+			data = f.read(block)
+	finally:
+		f.close()
+	return h.hexdigest()
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class MeshCache:
+	"""Cache of polygonal meshes read from VTK files.
+
+	Every mesh file gets a directory named after its absolute
+	path, holding the points, polygons, normals and texture
+	coordinates as .npy files, and an index with the file mtime,
+	size and content hash. If mtime and size have changed but the
+	contents have not, the entry is still used.
+
+	Cached arrays are mapped copy-on-write and wrapped by the
+	polydata without copies. VTK does not own them, so mapped
+	arrays are kept alive, and shared by the models of the same
+	file, while the cache lives.
+
+	Meshes derived from a file, like decimated levels, are cached
+	under a tag and validated against the file they come from.
+
+	The cache size is capped. The least recently used entries are
+	evicted when a new mesh is stored. Entries mapped by this cache
+	are in use, so they are not evicted.
+
+	Usage:
+		cache = MeshCache()
+		pd = cache.Read('examples/Scenario/Organs/uterus.vtp')
+		if pd:
+			model.SetInput(pd)
+	"""
+
+	Arrays = ('points', 'polys', 'normals', 'tcoords')
+
+	def __init__(self, directory = None, max_bytes = 256 << 20):
+		"""Constructor.
+
+		By default, the directory is HYSTRAINER_MESH_CACHE or
+		.hystrainer/meshes in the user home.
+		"""
+		if not directory:
+			directory = os.environ.get('HYSTRAINER_MESH_CACHE') or \
+				os.path.join(os.path.expanduser('~'), '.hystrainer', 'meshes')
+		self.Directory = directory
+		self.MaxBytes = max_bytes
+		self.Mapped = dict()
+		self.MappedEntries = dict()
+		self.Hits = 0
+		self.Misses = 0
+		self.Evictions = 0
+		self.__lock = threading.Lock()
+
+	def GetEntryDirectory(self, filename, tag = ''):
+		"""Return the directory of the cache entry of a mesh file."""
+		name = os.path.abspath(filename)
+		if tag:
+			name += '\0' + tag
+		key = hashlib.sha1(name.encode('utf-8')).hexdigest()
+		return os.path.join(self.Directory, key)
+
+	def Read(self, filename, tag = '', build = None):
+		"""Return the polydata of a mesh file, from the cache if possible.
+
+		For a derived mesh, give its tag and a function returning
+		it as build(filename). Return None if the file cannot be
+		cached (missing file, unknown format or cells other than
+		polygons).
+		"""
+		if not os.path.isfile(filename):
+			return None
+		with self.__lock:
+			arrays = self.Lookup(filename, tag)
+			if arrays is None:
+				self.Misses += 1
+				if build:
+					pd = build(filename)
+				else:
+					pd = self.Parse(filename)
+				if not pd or not self.Store(filename, pd, tag):
+					return pd
+				arrays = self.Lookup(filename, tag)
+				if arrays is None:
+					return pd
+			else:
+				self.Hits += 1
+		return self.BuildPolyData(arrays)
+
+	def Lookup(self, filename, tag = ''):
+		"""Return the mapped arrays of a valid entry, or None."""
+		st = os.stat(filename)
+		key = (os.path.abspath(filename), tag, st.st_mtime, st.st_size)
+		entry = self.GetEntryDirectory(filename, tag)
+		index = os.path.join(entry, 'index.json')
+		if key in self.Mapped:
+			self.Touch(index)
+			return self.Mapped[key]
+		if not os.path.exists(index):
+			return None
+		try:
+			f = open(index)
+			try:
+				meta = json.load(f)
+			finally:
+				f.close()
+			if (meta['mtime'], meta['size']) != (st.st_mtime, st.st_size):
+				if meta['sha1'] != HashFile(filename):
+					return None
+				# Same contents: refresh the entry stamp
+				meta['mtime'] = st.st_mtime
+				meta['size'] = st.st_size
+				self.WriteIndex(entry, meta)
+			arrays = {'num_polys': meta['num_polys']}
+			for name in meta['arrays']:
+				arrays[name] = numpy.load(os.path.join(entry, name + '.npy'), mmap_mode = 'c')
+		except (IOError, OSError, ValueError, KeyError):
+			return None
+		self.Touch(index)
+		self.Mapped[key] = arrays
+		self.MappedEntries[entry] = key
+		return arrays
+
+	def Touch(self, index):
+		"""Mark an entry as used. Least recently used goes first on eviction."""
+		try:
+			os.utime(index, None)
+		except OSError:
+			pass
+
+	def Parse(self, filename):
+		"""Read a mesh file with VTK. Return None if unknown format."""
+		ext = os.path.splitext(filename)[1].lower()
+		if ext == '.vtp':
+			reader = vtk.vtkXMLPolyDataReader()
+		elif ext == '.vtk':
+			reader = vtk.vtkPolyDataReader()
+		else:
+			return None
+		reader.SetFileName(filename)
+		reader.Update()
+		return reader.GetOutput()
+
+	def Store(self, filename, pd, tag = ''):
+		"""Save the arrays of a polydata. Return False if not cacheable."""
+		if pd.GetNumberOfVerts() or pd.GetNumberOfLines() or pd.GetNumberOfStrips():
+			return False
+		arrays = PolyDataToArrays(pd)
+		# Connectivity saved with the VTK id type, so it maps as is
+		arrays['polys'] = arrays['polys'].astype(numpy_support.ID_TYPE_CODE)
+		st = os.stat(filename)
+		meta = {'file': os.path.abspath(filename),
+			'tag': tag,
+			'mtime': st.st_mtime,
+			'size': st.st_size,
+			'sha1': HashFile(filename),
+			'num_polys': int(arrays['num_polys']),
+			'arrays': [name for name in MeshCache.Arrays if name in arrays]}
+		entry = self.GetEntryDirectory(filename, tag)
+		try:
+			if os.path.isdir(entry):
+				shutil.rmtree(entry)
+			os.makedirs(entry)
+			for name in meta['arrays']:
+				numpy.save(os.path.join(entry, name + '.npy'), numpy.ascontiguousarray(arrays[name]))
+			self.WriteIndex(entry, meta)
+		except (IOError, OSError):
+			shutil.rmtree(entry, True)
+			return False
+		self.Evict(entry)
+		return True
+
+	def WriteIndex(self, entry, meta):
+		"""Write the index of an entry."""
+		f = open(os.path.join(entry, 'index.json'), 'w')
+		try:
+			json.dump(meta, f)
+		finally:
+			f.close()
+
+	def GetEntries(self):
+		"""Return (last use, bytes, directory) of every entry."""
+		entries = list()
+		if not os.path.isdir(self.Directory):
+			return entries
+		for name in os.listdir(self.Directory):
+			entry = os.path.join(self.Directory, name)
+			index = os.path.join(entry, 'index.json')
+			if not os.path.exists(index):
+				continue
+			size = sum([os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry)])
+			entries.append((os.path.getmtime(index), size, entry))
+		return entries
+
+	def GetSize(self):
+		"""Return the size of the cache in bytes."""
+		return sum([size for used, size, entry in self.GetEntries()])
+
+	def Evict(self, keep = None):
+		"""Remove least recently used entries until below the size cap."""
+		entries = self.GetEntries()
+		entries.sort()
+		total = sum([size for used, size, entry in entries])
+		for used, size, entry in entries:
+			if total <= self.MaxBytes:
+				break
+			if entry == keep:
+				continue
+			# Mapped files can't be deleted on Windows, and VTK uses them
+			if entry in self.MappedEntries or not self.Delete(entry):
+				continue
+			total -= size
+			self.Evictions += 1
+
+	def Delete(self, entry):
+		"""Delete an entry directory. Return False if it failed.
+
+		The index goes last, so an entry partly deleted is still
+		listed and evicted again later.
+		"""
+		try:
+			for name in os.listdir(entry):
+				if name != 'index.json':
+					os.remove(os.path.join(entry, name))
+			os.remove(os.path.join(entry, 'index.json'))
+			os.rmdir(entry)
+		except OSError:
+			return False
+		return True
+
+	def BuildPolyData(self, arrays):
+		"""Wrap mapped arrays into a new polydata, without copies."""
+		pd = vtk.vtkPolyData()
+		points = vtk.vtkPoints()
+		points.SetData(numpy_support.numpy_to_vtk(arrays['points']))
+		pd.SetPoints(points)
+		polys = vtk.vtkCellArray()
+		polys.SetCells(arrays['num_polys'], numpy_support.numpy_to_vtkIdTypeArray(arrays['polys']))
+		pd.SetPolys(polys)
+		if 'normals' in arrays:
+			pd.GetPointData().SetNormals(numpy_support.numpy_to_vtk(arrays['normals']))
+		if 'tcoords' in arrays:
+			pd.GetPointData().SetTCoords(numpy_support.numpy_to_vtk(arrays['tcoords']))
+		return pd
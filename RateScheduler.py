@@ -0,0 +1,192 @@
+"""Rate scheduler module.
+
+Here is defined the class RateScheduler, which runs every
+simulation stage at its own fixed rate.
+"""
+
+import time
+import xml.etree.ElementTree as ElementTree
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def RateToPeriod(rate):
+	"""Convert a SRML rate into a period in seconds.
+
+	SRML rates are periods, not frequencies, in milliseconds, so
+	RenderRate='40' is a 40 ms step, as the fixed timer ran before.
+	Periods in seconds need the 's' suffix, like '0.04s'. An 'ms'
+	suffix is accepted as well.
+	"""
+	text = str(rate).strip().lower()
+	if text.endswith('ms'):
+		period = float(text[:-2])/1000.0
+	elif text.endswith('s'):
+		period = float(text[:-1])
+	else:
+		period = float(text)/1000.0
+	if period <= 0:
+		raise ValueError('Invalid rate: %s' % rate)
+	return period
+
+def ReadSRMLRates(filename, default = 40):
+	"""Return (render, simulation, haptic) periods in seconds of a SRML file.
+
+	Missing or invalid rates take the default rate (milliseconds,
+	see RateToPeriod).
+	"""
+	try:
+		root = ElementTree.parse(filename).getroot()
+	except (IOError, ElementTree.ParseError):
+		root = None
+	periods = list()
+	for name in ('RenderRate', 'SimulationRate', 'HapticRate'):
+		try:
+			periods.append(RateToPeriod(root.get(name)))
+		except (AttributeError, TypeError, ValueError):
+			periods.append(RateToPeriod(default))
+	return tuple(periods)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class RateStage:
+	"""A callback run with a fixed timestep.
+
+	Ticks rarely come exactly on time. A stage due within the jitter
+	tolerance runs on the current tick, and its schedule follows the
+	tick, so timer jitter is not taken as lateness. Drift is measured
+	against the tick the stage runs on.
+	"""
+
+	def __init__(self, name, period, callback, max_catchup = 1, tolerance = None):
+		"""Constructor.
+
+		max_catchup is the maximum number of runs in a single tick
+		when the stage falls behind. Beyond that, frames are skipped.
+		tolerance is the jitter allowed in seconds, by default a
+		quarter of the period.
+		"""
+		self.Name = name
+		self.Period = float(period)
+		self.Callback = callback
+		self.MaxCatchUp = max(1, int(max_catchup))
+		if tolerance is None:
+			tolerance = self.Period/4
+		self.Tolerance = float(tolerance)
+		self.Restart()
+
+	def Restart(self):
+		"""Forget the timing history."""
+		self.NextTime = None
+		self.Runs = 0
+		self.Skipped = 0
+		self.MissedDeadlines = 0
+		self.DriftSum = 0.0
+		self.MaxDrift = 0.0
+
+	def Tick(self, now, tolerance = None):
+		"""Run the stage as many times as needed to reach the time given.
+
+		The tolerance given overrides the stage one for this tick.
+		"""
+		if self.NextTime is None:
+			self.NextTime = now
+		if tolerance is None:
+			tolerance = self.Tolerance
+		runs = 0
+		while self.NextTime - tolerance <= now and runs < self.MaxCatchUp:
+			# How far the tick is from the stage schedule
+			drift = now - self.NextTime
+			self.DriftSum += abs(drift)
+			self.MaxDrift = max(self.MaxDrift, abs(drift))
+			if drift >= self.Period:
+				self.MissedDeadlines += 1
+			self.Callback()
+			if abs(drift) <= tolerance:
+				# Jitter: keep in phase with the ticks
+				self.NextTime = now + self.Period
+			else:
+				self.NextTime += self.Period
+			self.Runs += 1
+			runs += 1
+
+		# Too far behind: skip the frames that can't be caught up
+		if self.NextTime + tolerance < now:
+			skipped = int((now - self.NextTime)/self.Period) + 1
+			self.NextTime += skipped*self.Period
+			self.Skipped += skipped
+
+	def GetStatistics(self):
+		"""Return the timing counters of the stage in a dictionary."""
+		mean_drift = 0.0
+		if self.Runs:
+			mean_drift = self.DriftSum/self.Runs
+		return {'period': self.Period,
+		        'runs': self.Runs,
+		        'skipped': self.Skipped,
+		        'missed_deadlines': self.MissedDeadlines,
+		        'mean_drift': mean_drift,
+		        'max_drift': self.MaxDrift}
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class RateScheduler:
+	"""Multi-rate fixed-timestep scheduler.
+
+	Every stage runs at its own rate whenever the scheduler is
+	ticked. The caller should tick it at least as fast as the
+	fastest stage (see GetTickPeriod).
+
+	Usage:
+		scheduler = RateScheduler()
+		scheduler.AddStage('haptic', 0.005, poll, max_catchup = 4)
+		scheduler.AddStage('render', 0.04, render)
+		# On every timer tick
+		scheduler.Tick()
+	"""
+
+	def __init__(self, clock = time.time):
+		"""Constructor. The clock returns the current time in seconds."""
+		self.Clock = clock
+		self.Stages = list()
+
+	def SetClock(self, clock):
+		"""Set the function used to get the current time."""
+		self.Clock = clock
+
+	def AddStage(self, name, period, callback, max_catchup = 1, tolerance = None):
+		"""Add a stage. Stages run in the order they were added."""
+		stage = RateStage(name, period, callback, max_catchup, tolerance)
+		self.Stages.append(stage)
+		return stage
+
+	def GetStage(self, name):
+		"""Return the stage with the name given, or None."""
+		for s in self.Stages:
+			if s.Name == name:
+				return s
+		return None
+
+	def GetTickPeriod(self):
+		"""Return the period of the fastest stage in seconds."""
+		if not self.Stages:
+			return 0.04
+		return min([s.Period for s in self.Stages])
+
+	def Restart(self):
+		"""Restart all stages, e.g. after the timer has been stopped."""
+		for s in self.Stages:
+			s.Restart()
+
+	def Tick(self, now = None):
+		"""Run every stage that is due."""
+		if now is None:
+			now = self.Clock()
+		# Never run a stage earlier than half a tick: the next tick
+		# would be closer to its schedule.
+		half_tick = self.GetTickPeriod()/2
+		for s in self.Stages:
+			s.Tick(now, min(s.Tolerance, half_tick))
+
+	def GetStatistics(self):
+		"""Return the statistics of every stage, indexed by name."""
+		stats = dict()
+		for s in self.Stages:
+			stats[s.Name] = s.GetStatistics()
+		return stats
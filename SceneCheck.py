@@ -0,0 +1,90 @@
+"""Scene check module.
+
+Here are defined the rules a HysTrainer scenario must meet,
+shared by the main frame and the command-line validator.
+"""
+
+# No GUI imports: the validator runs without wx
+import vtk
+import vtkesqui
+import os
+from TextureCache import TextureRegistry
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Check results
+SceneOK = 0
+UnknownObject = -1
+BadCameraTools = -2
+BadTexture = -3
+BadMesh = -4
+
+SceneMessages = {
+	UnknownObject: 'Unknow object found.',
+	BadCameraTools: 'Invalid number of camera tools.',
+	BadTexture: 'Missing or unreadable texture in at least one element.',
+	BadMesh: 'Missing or unreadable mesh in at least one element.'}
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def IsReadableMesh(filename):
+	"""Check whether a mesh file exists and VTK can read it."""
+	if not filename or not os.path.isfile(filename):
+		return False
+	ext = os.path.splitext(filename)[1].lower()
+	if ext == '.vtp':
+		return bool(vtk.vtkXMLPolyDataReader().CanReadFile(filename))
+	elif ext == '.vtk':
+		reader = vtk.vtkPolyDataReader()
+		reader.SetFileName(filename)
+		return bool(reader.IsFilePolyData())
+	return False
+
+def FindSceneProblems(scenario, meshes = False):
+	"""Return the problems of a scenario as (code, object, file) tuples.
+
+	Only organs and single-channel tools are allowed, with exactly
+	one camera tool. Elements of any other object need a readable
+	texture. If asked to, element meshes are checked as well.
+	"""
+	problems = list()
+	objects = scenario.GetObjects()
+	objects.InitTraversal()
+	o = objects.GetNextObject()
+	nCamTools = 0
+	while o:
+		current_is_cam_tool = False
+		if o.IsA('vtkToolSingleChannel'):
+			if o.GetToolModel() == vtkesqui.vtkToolSingleChannel.Camera:
+				current_is_cam_tool = True
+				nCamTools += 1
+		elif not o.IsA('vtkOrgan'):
+			problems.append((UnknownObject, o.GetName(), None))
+		elements = o.GetElements()
+		elements.InitTraversal()
+		e = elements.GetNextElement()
+		while e:
+			vis = e.GetVisualizationModel()
+			# Does it have valid textures? Win32: Should it require it also for invisible objects?
+			if not current_is_cam_tool:
+				tfn = vis.GetTextureFileName()
+				if not TextureRegistry.IsValid(tfn):
+					problems.append((BadTexture, o.GetName(), tfn))
+			if meshes:
+				for model in (vis, e.GetCollisionModel()):
+					if model and not IsReadableMesh(model.GetFileName()):
+						problems.append((BadMesh, o.GetName(), model.GetFileName()))
+			e = elements.GetNextElement()
+		o = objects.GetNextObject()
+	if nCamTools != 1:
+		problems.append((BadCameraTools, None, None))
+	return problems
+
+def CheckScene(scenario):
+	"""Check that the scenario meets the requirements.
+
+	Return SceneOK or the code of the first problem found
+	(see FindSceneProblems).
+	"""
+	problems = FindSceneProblems(scenario)
+	if problems:
+		return problems[0][0]
+	return SceneOK
@@ -8,6 +8,14 @@ from ButtonContainer import *
 from SimulationInteractorStyle import *
 from SimulationRenderWindowInteractor import *
 from timers import *
+from InputRecorder import *
+from SoftwareSBM import *
+from SyntheticSBM import *
+from SimulationLoader import *
+from MeshCache import *
+from TextureCache import *
+from SceneCheck import *
+import time
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 class SimulationFrame(wx.Frame):
@@ -30,7 +38,7 @@ class SimulationFrame(wx.Frame):
 
 		# GUI Elements
 		sttBox = wx.StaticBox(self, -1, "Tool Selector")
-		loadButton = wx.Button(self, -1, 'Load Simulation')
+		loadButton = self.loadButton = wx.Button(self, -1, 'Load Simulation')
 		self.fnDisplay = wx.StaticText(self, -1, 'No simulation loaded', style=wx.ALIGN_CENTRE | wx.ST_NO_AUTORESIZE)
 		exitButton = wx.Button(self, -1, 'Exit')
 		self.widget = SimulationRWI(self, -1)
@@ -110,6 +118,7 @@ class SimulationFrame(wx.Frame):
 		self.tool_buttons.AddButton(cutter_button, 'cutter', vtkesqui.vtkToolSingleChannel.Cutter)
 		cutter_button.Hide()
 
+		self.tool_names = ('camera', 'cauterizer', 'brush', 'cutter')
 		self.tool_models = (vtkesqui.vtkToolSingleChannel.Cauterizer,
 		                    vtkesqui.vtkToolSingleChannel.Brush,
 		                    vtkesqui.vtkToolSingleChannel.Cutter)
@@ -157,11 +166,16 @@ class SimulationFrame(wx.Frame):
 		# Set simulation timer (includes collision highlighter)
 		self.timer = SimulationTimer()
 		self.timer.parent = self
+		self.widget.SetLock(self.timer.GetLock())
 		
 		# Set simulation references
 		self.scenario = None
 		self.style = None
 		self.simulation = None
+		self.simulation_file = None
+		self.loader = None
+		self.mesh_cache = MeshCache()
+		self.use_lod = os.environ.get('HYSTRAINER_LOD', '1') != '0'
 
 		# Bindings
 		self.Bind(wx.EVT_CLOSE, self.OnClose)
@@ -191,9 +205,25 @@ class SimulationFrame(wx.Frame):
 		self.Center()
 		self.Show()
 		self.Update()
+
+		# Drive the simulation with a synthetic haptic device if asked to
+		if os.environ.get('HYSTRAINER_SYNTHETIC_SBM'):
+			self.timer.SetHapticDevice(SyntheticSBM())
+
+		# Replay a recorded session if asked to. Replays are never recorded.
+		self.record_dir = os.environ.get('HYSTRAINER_RECORD')
+		replay = os.environ.get('HYSTRAINER_REPLAY')
+		if replay:
+			if self.record_dir:
+				sys.stderr.write('HYSTRAINER_RECORD ignored while replaying %s\n' % replay)
+				self.record_dir = None
+			wx.CallAfter(self.ReplaySession, replay)
 	
 	def OnLoadButton(self, event):
-		"""Manage the SRML load."""
+		"""Manage the SRML load. Cancel it if already loading."""
+		if self.loader:
+			self.CancelLoading()
+			return
 
 		# First stop the timer
 		self.timer.Stop()
@@ -206,8 +236,110 @@ class SimulationFrame(wx.Frame):
 				self.ShowSimulation()
 				self.StartTimer()
 			return
+
+		self.StartLoading(dialog.GetPath())
+
+	def StartLoading(self, filename):
+		"""Load the SRML file given in the background.
+
+		The current simulation keeps running until the new one is
+		swapped in. Progress is shown in the insertion gauge.
+		"""
+		loader = self.loader = SimulationLoader(filename, CheckScene)
+		loader.SetMeshCache(self.mesh_cache)
+		if self.use_lod:
+			loader.LevelOfDetailOn()
+		loader.SetProgressCallback(lambda stage, fraction, l=loader: \
+			wx.CallAfter(self.OnLoadProgress, l, stage, fraction))
+		loader.SetDoneCallback(lambda l: wx.CallAfter(self.OnLoadFinished, l))
+		self.loadButton.SetLabel('Cancel loading')
+		self.inGauge.SetValue(0)
+		if self.simulation:
+			self.StartTimer()
+		loader.start()
+
+	def CancelLoading(self):
+		"""Cancel the background load, if any."""
+		if not self.loader:
+			return
+		self.loader.Cancel()
+		self.loader = None
+		self.loadButton.SetLabel('Load Simulation')
+		self.inGauge.SetValue(0)
+		if self.simulation:
+			self.fnDisplay.SetLabel(os.path.basename(self.simulation_file))
 		else:
-			self.HideAll()
+			self.fnDisplay.SetLabel('No simulation loaded')
+
+	def OnLoadProgress(self, loader, stage, fraction):
+		"""Show the progress of the background load."""
+		if loader is not self.loader:
+			return
+		stage_id = SimulationLoader.Stages.index(stage)
+		progress = (stage_id + fraction)/len(SimulationLoader.Stages)
+		self.inGauge.SetValue(int(progress*self.inGauge.GetRange()))
+		self.fnDisplay.SetLabel('Loading %s: %s' % (os.path.basename(loader.FileName), stage))
+
+	def OnLoadFinished(self, loader):
+		"""Swap in the simulation loaded in the background."""
+		if loader is not self.loader:
+			return
+		self.loader = None
+		self.loadButton.SetLabel('Load Simulation')
+		self.inGauge.SetValue(0)
+		self.SwapSimulation(loader)
+
+	def LoadSimulation(self, filename):
+		"""Load the SRML file given and set the simulation up.
+
+		Return False if the file could not be loaded.
+		"""
+		self.CancelLoading()
+		loader = SimulationLoader(filename, CheckScene)
+		loader.SetMeshCache(self.mesh_cache)
+		if self.use_lod:
+			loader.LevelOfDetailOn()
+		loader.Load()
+		return self.SwapSimulation(loader)
+
+	def SwapSimulation(self, loader):
+		"""Replace the current simulation by the one loaded.
+
+		If the loader failed, the current simulation is kept.
+		Return False if the simulation could not be loaded.
+		"""
+		filename = loader.FileName
+		sim = loader.Simulation
+
+		# No worker may step the scene while it is swapped
+		self.timer.StopSimulation()
+
+		# Check if valid simulation was returned
+		if loader.Error:
+			self.timer.Stop()
+			dialog = wx.MessageDialog(self, loader.Error, \
+				"Bad SRML file", wx.OK)
+			dialog.ShowModal()
+			self.RestoreSimulation()
+			return False
+		
+
+		# Check if the scene matches the requirements
+		check_val = loader.CheckValue
+		if check_val:
+			self.timer.Stop()
+			msg = "Bad scene configuration."
+			if check_val in SceneMessages:
+				msg += "\n" + SceneMessages[check_val]
+			dialog = wx.MessageDialog(self, msg, \
+				"Bad scene", wx.OK)
+			dialog.ShowModal()
+			self.RestoreSimulation()
+			return False
+		
+
+		self.timer.Stop()
+		self.HideAll()
 		
 
 		# Reset the wxTimer
@@ -228,37 +360,7 @@ class SimulationFrame(wx.Frame):
 		self.scenario = None
 		self.style = None
 		self.simulation = None
-		
-		# Read the SRML file
-		reader = vtkesqui.vtkSRMLReader()
-		reader.SetFileName(dialog.GetPath())
-		sim = reader.ConstructSimulation()
-		
-
-		# Check if valid simulation was returned
-		if not sim:
-			dialog = wx.MessageDialog(self, "The SMRL file seems to be bad constructed.", \
-				"Bad SRML file", wx.OK)
-			dialog.ShowModal()
-			self.UpdateToolSelector()
-			return
-		
-
-		# Check if the scene matches the requirements
-		check_val = self.CheckScene(sim.GetScenario())
-		if check_val:
-			msg = "Bad scene configuration."
-			if check_val == -1:
-				msg += "\nUnknow object found."
-			elif check_val == -2:
-				msg += "\nInvalid number of camera tools."
-			elif check_val == -3:
-				msg += "\nMissing texture in at least one element."
-			dialog = wx.MessageDialog(self, msg, \
-				"Bad scene", wx.OK)
-			dialog.ShowModal()
-			self.UpdateToolSelector()
-			return
+		self.simulation_file = filename
 		
 
 		# Set up simulation
@@ -273,6 +375,8 @@ class SimulationFrame(wx.Frame):
 
 		# Set the wxTimer correctly
 		self.timer.SetSimulation(self.simulation)
+		self.timer.SetRates(*ReadSRMLRates(filename))
+		self.timer.SetLevelOfDetail(loader.LevelOfDetail)
 
 		self.AddHighlightObjects()
 
@@ -287,7 +391,7 @@ class SimulationFrame(wx.Frame):
 		self.LocateNail()
 		
 		# Set SRML title
-		self.fnDisplay.SetLabel(dialog.GetFilename())
+		self.fnDisplay.SetLabel(os.path.basename(filename))
 		
 
 		# Set Interactor Style
@@ -299,6 +403,13 @@ class SimulationFrame(wx.Frame):
 		# Initialize the timer
 		self.use_haptic = self.timer.Initialize()
 		self.timer.CuttingOff()
+
+		# Save the session inputs if asked to
+		if self.record_dir:
+			name = os.path.splitext(os.path.basename(filename))[0]
+			name += time.strftime('-%Y%m%d-%H%M%S.hrec')
+			self.timer.StartRecording(os.path.join(self.record_dir, name), filename)
+
 		if self.use_haptic:
 			self.selected_lens = 0
 			button = self.lens_buttons[0]
@@ -306,45 +417,45 @@ class SimulationFrame(wx.Frame):
 			self.StartTimer()
 		else:
 			self.ShowLenses()
+		return True
+
+	def RestoreSimulation(self):
+		"""Go on with the current simulation after a failed load."""
+		if self.simulation:
+			self.fnDisplay.SetLabel(os.path.basename(self.simulation_file))
+			self.ShowSimulation()
+			self.StartTimer()
+		else:
+			self.fnDisplay.SetLabel('No simulation loaded')
+			self.UpdateToolSelector()
+
+	def ReplaySession(self, filename):
+		"""Load the scene of a recorded session and replay its inputs.
+
+		Haptic sessions are replayed through a software device.
+		"""
+		replayer = InputReplayer(filename)
+		device = None
+		if replayer.UsesHaptic():
+			device = SoftwareSBM()
+			replayer.SetDevice(device)
+		self.timer.SetHapticDevice(device)
+		if not self.LoadSimulation(replayer.GetScene()):
+			return
+		replayer.SetInteractor(self.style.GetInteractor())
+		replayer.SetFrame(self)
+		self.timer.StartReplay(replayer)
 	
 	def CheckScene(self, scenario):
 		"""Check that the SRML meets the requirements.
 
-		Check that there are only organs and single-channel tools.
-		Also checks that there is only a camera tool.
-		Return values:
+		See SceneCheck for the rules. Return values:
 			 0 if OK
 			-1 if unknow object
 			-2 if invalid number of camera tools
-			-3 if element without texture.
+			-3 if element without a readable texture.
 		"""
-		# Check that there are only organs and single-channel tools
-		objects = scenario.GetObjects()
-		objects.InitTraversal()
-		o = objects.GetNextObject()
-		nCamTools = 0
-		while o:
-			current_is_cam_tool = False
-			if o.IsA('vtkToolSingleChannel'):
-				if o.GetToolModel() == vtkesqui.vtkToolSingleChannel.Camera:
-					current_is_cam_tool = True
-					nCamTools += 1
-			elif not o.IsA('vtkOrgan'):
-				return -1
-			# Does it have valid textures? Win32: Should it require it also for invisible objects?
-			if not current_is_cam_tool:
-				elements = o.GetElements()
-				elements.InitTraversal()
-				e = elements.GetNextElement()
-				while e:
-					tfn = e.GetVisualizationModel().GetTextureFileName()
-					if not tfn or tfn == '' or not os.path.exists(tfn):
-						return -3
-					e = elements.GetNextElement()
-			o = objects.GetNextObject()
-		if nCamTools != 1:
-			return -2
-		return 0
+		return CheckScene(scenario)
 
 	def UpdateToolSelector(self):
 		"""Refresh the toolbar.
@@ -397,7 +508,7 @@ class SimulationFrame(wx.Frame):
 			self.tool_buttons.SelectButtonById(tool_id)
 
 		if self.use_haptic:
-			haptic = self.simulation.GetHapticDevice()
+			haptic = self.timer.haptic
 			haptic.GetTools().RemoveAllItems()
 			if self.tool_buttons.GetSelectedButtonName() != 'camera':
 				haptic.AddTool(self.tool_buttons.GetSelectedButton().Tool)
@@ -460,11 +571,11 @@ class SimulationFrame(wx.Frame):
 		msg.m_display = wx.StaticText(msg, -1, 'You must extract the tool first', style=wx.ALIGN_CENTRE | wx.ST_NO_AUTORESIZE)
 		msg.m_sizer.Add(msg.m_display, 0, wx.EXPAND | wx.ALL, border = 30)
 		msg.SetSizer(msg.m_sizer)
-		msg.m_timer = DialogHidingTimer(msg)
 		msg.Fit()
 		msg.CenterOnParent()
 		msg.Show()
-		msg.m_timer.StartHiding()
+		msg.hiding_timer = DialogHidingTimer(msg)
+		msg.hiding_timer.StartHiding()
 	
 	def AddHighlightObjects(self):
 		"""Set the organs to be highlighted when colided."""
@@ -482,7 +593,7 @@ class SimulationFrame(wx.Frame):
 			return
 
 		if self.timer.use_haptic:
-			haptic = self.simulation.GetHapticDevice()
+			haptic = self.timer.haptic
 			haptic.SetLensAngle(angle)
 		else:
 			self.style.SetLensAngle(angle)
@@ -509,44 +620,32 @@ class SimulationFrame(wx.Frame):
 				o = objects.GetNextObject()
 
 
-	def OnLens0(self, event):
-		"""0-degree-lens button callback."""
-		self.ChangeLens(0)
+	def OnLensButton(self, lens_id):
+		"""Generic lens button callback function."""
+		if self.timer.Recorder:
+			self.timer.Recorder.RecordLens(lens_id)
+		self.ChangeLens(self.lens_buttons[lens_id].angle)
 		self.ShowSimulation()
-		if self.timer.use_haptic and self.selected_lens != 0:
+		if self.timer.use_haptic and self.selected_lens != lens_id:
 			prev_button = self.lens_buttons[self.selected_lens]
 			prev_button.SetBitmapLabel(prev_button.default_img)
-			self.selected_lens = 0
+			self.selected_lens = lens_id
 			button = self.lens_buttons[self.selected_lens]
 			button.SetBitmapLabel(button.selected_img)
 		else:
 			self.StartTimer()
 
+	def OnLens0(self, event):
+		"""0-degree-lens button callback."""
+		self.OnLensButton(0)
+
 	def OnLens30(self, event):
 		"""30-degree-lens button callback."""
-		self.ChangeLens(30)
-		self.ShowSimulation()
-		if self.timer.use_haptic and self.selected_lens != 1:
-			prev_button = self.lens_buttons[self.selected_lens]
-			prev_button.SetBitmapLabel(prev_button.default_img)
-			self.selected_lens = 1
-			button = self.lens_buttons[self.selected_lens]
-			button.SetBitmapLabel(button.selected_img)
-		else:
-			self.StartTimer()
+		self.OnLensButton(1)
 
 	def OnLens70(self, event):
 		"""70-degree-lens button callback."""
-		self.ChangeLens(70)
-		self.ShowSimulation()
-		if self.timer.use_haptic and self.selected_lens != 2:
-			prev_button = self.lens_buttons[self.selected_lens]
-			prev_button.SetBitmapLabel(prev_button.default_img)
-			self.selected_lens = 2
-			button = self.lens_buttons[self.selected_lens]
-			button.SetBitmapLabel(button.selected_img)
-		else:
-			self.StartTimer()
+		self.OnLensButton(2)
 
 	def SelectPreviousLens(self):
 		"""Move the lens selection to the left.
@@ -593,7 +692,7 @@ class SimulationFrame(wx.Frame):
 				tool_id = 0
 				
 		if self.use_haptic:
-			self.simulation.GetHapticDevice().UpdateScenario()
+			self.timer.haptic.UpdateScenario()
 
 		if not self.style.ChangeTool(tool_id):
 			self.ShowToolWarning()
@@ -602,7 +701,7 @@ class SimulationFrame(wx.Frame):
 			self.tool_buttons.SelectButtonById(button_id)
 			
 		if self.use_haptic:
-			haptic = self.simulation.GetHapticDevice()
+			haptic = self.timer.haptic
 			haptic.GetTools().RemoveAllItems()
 			if self.tool_buttons.GetSelectedButtonName() != 'camera':
 				haptic.AddTool(self.tool_buttons.GetSelectedButton().Tool)
@@ -627,7 +726,7 @@ class SimulationFrame(wx.Frame):
 			button_id = tool_id = button_id + 1
 
 		if self.use_haptic:
-			self.simulation.GetHapticDevice().UpdateScenario()
+			self.timer.haptic.UpdateScenario()
 			
 		if not self.style.ChangeTool(tool_id):
 			self.ShowToolWarning()
@@ -636,7 +735,7 @@ class SimulationFrame(wx.Frame):
 			self.tool_buttons.SelectButtonById(button_id)
 			
 		if self.use_haptic:
-			haptic = self.simulation.GetHapticDevice()
+			haptic = self.timer.haptic
 			haptic.GetTools().RemoveAllItems()
 			if self.tool_buttons.GetSelectedButtonName() != 'camera':
 				haptic.AddTool(self.tool_buttons.GetSelectedButton().Tool)
@@ -647,6 +746,8 @@ class SimulationFrame(wx.Frame):
 
 	def OnCameraButton(self, event):
 		"""Camera button callback function."""
+		if self.timer.Recorder:
+			self.timer.Recorder.RecordTool(0)
 		if self.tool_buttons.GetSelectedButtonName() == 'camera':
 			return
 
@@ -658,15 +759,24 @@ class SimulationFrame(wx.Frame):
 		self.timer.CuttingOff()
 
 		if self.use_haptic:
-			haptic = self.simulation.GetHapticDevice()
+			haptic = self.timer.haptic
 			haptic.GetTools().RemoveAllItems()
 
 		# In order to mantain control of insertion gauge
 		self.tool_depth = 0
 		self.inGauge.SetValue(0)
 
+	def OnToolButtonId(self, tool_id):
+		"""Press the tool button given by its position in tool_names."""
+		if tool_id == 0:
+			self.OnCameraButton(None)
+		else:
+			self.OnToolButton(self.tool_names[tool_id])
+
 	def OnToolButton(self, button_name):
 		"""Generic tool button callback function."""
+		if self.timer.Recorder:
+			self.timer.Recorder.RecordTool(self.tool_names.index(button_name))
 		if button_name == self.tool_buttons.GetSelectedButtonName():
 			return
 
@@ -682,7 +792,7 @@ class SimulationFrame(wx.Frame):
 			self.timer.CuttingOff()
 
 		if self.use_haptic:
-			haptic = self.simulation.GetHapticDevice()
+			haptic = self.timer.haptic
 			haptic.GetTools().RemoveAllItems()
 			haptic.AddTool(self.tool_buttons.GetSelectedButton().Tool)
 
@@ -704,8 +814,9 @@ class SimulationFrame(wx.Frame):
 	
 	def OnClose(self, event):
 		"""Close event callback function."""
-		# Stop timer
-		self.timer.Stop()
+		# Stop timer and its workers
+		self.CancelLoading()
+		self.timer.Shutdown()
 		# Delete all objects
 		self.renWin.InvokeEvent("DeleteAllObjects")
 		# Finally exit. Previous actions were only preventively made.
@@ -730,8 +841,7 @@ class SimulationFrame(wx.Frame):
 
 	def StartTimer(self):
 		"""Start the simulation timer."""
-		self.timer.Start(40, wx.TIMER_CONTINUOUS)
-		#self.timer.StartSimulation()
+		self.timer.Start(self.timer.GetTickPeriod(), wx.TIMER_CONTINUOUS)
 
 	def UpdateNail(self, opening):
 		"""Update the nail extraction."""
@@ -6,7 +6,8 @@ of the lens disk, among other tasks.
 
 from common import *
 from LensDisk import *
-from timers import NailMovingTimer
+from AnimationScheduler import NailMoveTrack
+from InputRecorder import InputRecorder
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 baseSCIS = vtkesqui.vtkSingleChannelInteractorStyle
@@ -49,8 +50,16 @@ class MyStyle(baseSCIS):
 		baseSCIS.SetLensAngle(self, angle)
 		self.Lens.Update()
 
+	def RecordEvent(self, rtype):
+		"""Save the current mouse event, if recording."""
+		recorder = self.parent.timer.Recorder
+		if recorder:
+			x, y = self.iren.GetEventPosition()
+			recorder.RecordMouse(rtype, x, y, self.iren.GetShiftKey(), self.iren.GetControlKey())
+
 	def LensLeftButtonPress(self, obj, evt):
 		"""Additional LeftButtonPressEvent callback function."""
+		self.RecordEvent(InputRecorder.LeftButtonPress)
 		if self.parent.timer.Initialized and self.parent.timer.use_haptic:
 			return
 
@@ -59,6 +68,7 @@ class MyStyle(baseSCIS):
 
 	def LensLeftButtonRelease(self, obj, evt):
 		"""Additional LeftButtonReleaseEvent callback function."""
+		self.RecordEvent(InputRecorder.LeftButtonRelease)
 		if self.parent.timer.Initialized and self.parent.timer.use_haptic:
 			return
 
@@ -71,6 +81,10 @@ class MyStyle(baseSCIS):
 		Add some control on key events.
 		"""
 		key = self.iren.GetKeySym()
+		recorder = self.parent.timer.Recorder
+		if recorder:
+			x, y = self.iren.GetEventPosition()
+			recorder.RecordKey(key, self.iren.GetShiftKey(), self.iren.GetControlKey(), x, y)
 
 		# Tool change through GUI control
 		try:
@@ -97,8 +111,13 @@ class MyStyle(baseSCIS):
 			elif key == 'x':
 				self.Lens.Rotate(-1)
 			elif key == 'a':
-				self.timer = timer = NailMovingTimer(self.parent)
-				timer.StartMoving()
+				self.parent.timer.Animations.Add(NailMoveTrack(self.parent))
+			elif key == 'i':
+				timer = self.parent.timer
+				if timer.Profiler.Overlay:
+					timer.HideProfilerOverlay()
+				else:
+					timer.ShowProfilerOverlay()
 			elif key == 'Prior':
 				if self.iren.GetShiftKey():
 					self.parent.AddToolInsertion(1)
@@ -110,6 +129,7 @@ class MyStyle(baseSCIS):
 
 	def LensMouseMove(self, obj, evt):
 		"""Additional MouseMoveEvent callback function."""
+		self.RecordEvent(InputRecorder.MouseMove)
 		if self.parent.timer.Initialized and self.parent.timer.use_haptic:
 			return
 
@@ -125,6 +145,7 @@ class MyStyle(baseSCIS):
 
 	def LensMouseWheelForward(self, obj, evt):
 		"""Additional MouseWheelForwardEvent callback function."""
+		self.RecordEvent(InputRecorder.MouseWheelForward)
 		if self.parent.timer.Initialized and self.parent.timer.use_haptic:
 			return
 
@@ -135,6 +156,7 @@ class MyStyle(baseSCIS):
 
 	def LensMouseWheelBackward(self, obj, evt):
 		"""Additional MouseWheelBackwardEvent callback function."""
+		self.RecordEvent(InputRecorder.MouseWheelBackward)
 		if self.parent.timer.Initialized and self.parent.timer.use_haptic:
 			return
 
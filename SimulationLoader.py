@@ -0,0 +1,203 @@
+"""Simulation loading module.
+
+Here is defined the class SimulationLoader, which reads a SRML
+simulation out of the GUI thread.
+"""
+
+from common import *
+from TextureCache import TextureRegistry
+from LevelOfDetail import *
+import threading
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class SimulationLoader(threading.Thread):
+	"""Read a SRML simulation and its data in its own thread.
+
+	Loading goes through these stages:
+		parse     build the simulation from the SRML file
+		check     validate the scene with the check function given,
+		          so bad scenes fail before any mesh is read
+		textures  decode the textures of every element, shared by
+		          the elements that use the same file (see TextureCache)
+		meshes    read the models of every element, from the mesh
+		          cache if one is set (see MeshCache)
+		lod       decimate the organ meshes, if enabled (see LevelOfDetail)
+	Progress is reported per stage, as a fraction between 0 and 1.
+	The simulation is not attached to any window, so the caller
+	swaps it in on the GUI thread once loaded.
+
+	Callbacks and the check function are called from the loader
+	thread, so the check must not touch the GUI (see SceneCheck).
+	GUI callbacks should be wrapped with wx.CallAfter. A cancelled loader stops
+	at the next element and never calls the done callback. Otherwise
+	the done callback is always called, with Error set if loading
+	raised.
+
+	Usage:
+		loader = SimulationLoader('examples/example-cut.srml', CheckScene)
+		loader.SetProgressCallback(lambda stage, fraction: ...)
+		loader.SetDoneCallback(lambda loader: wx.CallAfter(...))
+		loader.start()
+		...
+		if loader.Error or loader.CheckValue:
+			...
+		sim = loader.Simulation
+
+	Load() does the same in the calling thread.
+	"""
+
+	Stages = ('parse', 'check', 'textures', 'meshes', 'lod')
+
+	def __init__(self, filename, check = None):
+		"""Constructor. Check returns 0 if the scenario given is valid."""
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.FileName = filename
+		self.Check = check
+		self.MeshCache = None
+		self.LevelOfDetail = None
+		self.BuildLevels = False
+		self.ProgressCallback = None
+		self.DoneCallback = None
+		self.Simulation = None
+		self.Error = None
+		self.CheckValue = 0
+		self.Stage = None
+		self.Cancelled = False
+		self.TextureUsers = list()
+
+	def SetMeshCache(self, cache):
+		"""Read the element models through the mesh cache given."""
+		self.MeshCache = cache
+
+	def LevelOfDetailOn(self):
+		"""Build the levels of detail of the organs."""
+		self.BuildLevels = True
+
+	def LevelOfDetailOff(self):
+		"""Render every element with its full mesh."""
+		self.BuildLevels = False
+
+	def SetProgressCallback(self, callback):
+		"""Set the function called as callback(stage, fraction)."""
+		self.ProgressCallback = callback
+
+	def SetDoneCallback(self, callback):
+		"""Set the function called as callback(loader) when loaded."""
+		self.DoneCallback = callback
+
+	def Cancel(self):
+		"""Stop loading as soon as possible."""
+		self.Cancelled = True
+
+	def run(self):
+		"""Thread body."""
+		try:
+			self.Load()
+		except Exception as e:
+			self.Simulation = None
+			self.Error = 'The simulation could not be loaded (%s): %s' % (self.Stage, e)
+		if self.DoneCallback and not self.Cancelled:
+			self.DoneCallback(self)
+
+	def Progress(self, stage, fraction):
+		"""Report the progress of a stage."""
+		self.Stage = stage
+		if self.ProgressCallback:
+			self.ProgressCallback(stage, fraction)
+
+	def Load(self):
+		"""Load the simulation. Return True if loaded and valid.
+
+		If loading fails, is cancelled or raises, the textures taken
+		for the elements are released.
+		"""
+		self.TextureUsers = list()
+		loaded = False
+		try:
+			loaded = self.LoadStages()
+		finally:
+			if not loaded:
+				for user in self.TextureUsers:
+					TextureRegistry.Release(user)
+				self.TextureUsers = list()
+		return loaded
+
+	def LoadStages(self):
+		"""Go through the loading stages. Return True if loaded and valid."""
+		self.Progress('parse', 0.0)
+		reader = vtkesqui.vtkSRMLReader()
+		reader.SetFileName(self.FileName)
+		sim = reader.ConstructSimulation()
+		if not sim:
+			self.Error = 'The SMRL file seems to be bad constructed.'
+			return False
+		self.Progress('parse', 1.0)
+
+		if self.Check:
+			self.CheckValue = self.Check(sim.GetScenario())
+			self.Progress('check', 1.0)
+			if self.CheckValue:
+				return False
+
+		# Elements to read
+		elements = list()
+		organs = list()
+		objects = sim.GetScenario().GetObjects()
+		objects.InitTraversal()
+		o = objects.GetNextObject()
+		while o:
+			collection = o.GetElements()
+			collection.InitTraversal()
+			e = collection.GetNextElement()
+			while e:
+				elements.append(e)
+				organs.append(o.IsA('vtkOrgan'))
+				e = collection.GetNextElement()
+			o = objects.GetNextObject()
+
+		# Textures go first, so the models find them decoded
+		n = float(max(1, len(elements)))
+		textures = list()
+		for i in xrange(len(elements)):
+			if self.Cancelled:
+				return False
+			vis = elements[i].GetVisualizationModel()
+			self.TextureUsers.append(vis.GetActor())
+			texture = TextureRegistry.GetTexture(vis.GetTextureFileName(), vis.GetActor())
+			if texture:
+				vis.GetActor().SetTexture(texture)
+			textures.append(texture)
+			self.Progress('textures', (i + 1)/n)
+
+		for i in xrange(len(elements)):
+			if self.Cancelled:
+				return False
+			e = elements[i]
+			for model in (e.GetVisualizationModel(), e.GetCollisionModel()):
+				if not model:
+					continue
+				if self.MeshCache and model.GetFileName():
+					pd = self.MeshCache.Read(model.GetFileName())
+					if pd:
+						model.SetInput(pd)
+				model.Update()
+			# The model may set up its actor texture on update
+			if textures[i]:
+				e.GetVisualizationModel().GetActor().SetTexture(textures[i])
+			self.Progress('meshes', (i + 1)/n)
+
+		if self.BuildLevels:
+			lod = LevelOfDetail(self.MeshCache)
+			for i in xrange(len(elements)):
+				if self.Cancelled:
+					return False
+				if organs[i]:
+					lod.AddElement(elements[i])
+				self.Progress('lod', (i + 1)/n)
+			self.LevelOfDetail = lod
+
+		if self.Cancelled:
+			return False
+		self.Simulation = sim
+		return True
@@ -2,6 +2,7 @@
 
 from common import *
 import vtk.wx.wxVTKRenderWindowInteractor as wxRWI
+import threading
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 baseRWI = wxRWI.wxVTKRenderWindowInteractor
@@ -16,6 +17,42 @@ class SimulationRWI(baseRWI):
 		"""
 		baseRWI.__init__(self, parent, id)
 		self.scenario = None
+		# Replaced by the simulation lock (see SetLock)
+		self.lock = threading.RLock()
+
+	def SetLock(self, lock):
+		"""Render and handle events holding the lock given.
+
+		Usage: widget.SetLock(timer.GetLock())
+		Keeps paint, resize and interaction renders out of the
+		simulation worker steps (see SimulationTimer).
+		"""
+		self.lock = lock
+
+	def Render(self):
+		"""Render holding the lock. Paint events render through here."""
+		with self.lock:
+			baseRWI.Render(self)
+
+	def OnButtonDown(self, event):
+		with self.lock:
+			baseRWI.OnButtonDown(self, event)
+
+	def OnButtonUp(self, event):
+		with self.lock:
+			baseRWI.OnButtonUp(self, event)
+
+	def OnMotion(self, event):
+		with self.lock:
+			baseRWI.OnMotion(self, event)
+
+	def OnMouseWheel(self, event):
+		with self.lock:
+			baseRWI.OnMouseWheel(self, event)
+
+	def OnKeyUp(self, event):
+		with self.lock:
+			baseRWI.OnKeyUp(self, event)
 
 	def OnKeyDown(self, event):
 		"""Handle the wx.EVT_KEY_DOWN event for wxVTKRenderWindowInteractor.
@@ -31,7 +68,7 @@ class SimulationRWI(baseRWI):
 		if keycode >= 65 and keycode <= 90: # Convert caps
 			keycode = keycode + 32
 		
-		allowed = range(ord('0'),ord('9')) + [ord('a'), ord('c'), ord('q'), ord('z'), ord('x'), \
+		allowed = range(ord('0'),ord('9')) + [ord('a'), ord('c'), ord('i'), ord('q'), ord('z'), ord('x'), \
 			wx.WXK_LEFT, wx.WXK_RIGHT, wx.WXK_UP, wx.WXK_DOWN, wx.WXK_PAGEUP, wx.WXK_PAGEDOWN]
 		
 		# Only process allowed keys
@@ -62,20 +99,22 @@ class SimulationRWI(baseRWI):
 										 ctrl, shift, key, 0,
 										 keysym)
 
-		self._Iren.KeyPressEvent()
-		self._Iren.CharEvent()
+		with self.lock:
+			self._Iren.KeyPressEvent()
+			self._Iren.CharEvent()
 	
 	def OnSize(self, event):
 		"""Handle the wx.EVT_SIZE event.
 
 		Communicate the size change to the scenario.
 		"""
-		if (self.scenario):
-			try:
-				width, height = event.GetSize()
-			except:
-				width = event.GetSize().width
-				height = event.GetSize().height
-			self.scenario.SetWindowSize(width, height)
-			
-		baseRWI.OnSize(self, event)
+		with self.lock:
+			if (self.scenario):
+				try:
+					width, height = event.GetSize()
+				except:
+					width = event.GetSize().width
+					height = event.GetSize().height
+				self.scenario.SetWindowSize(width, height)
+				
+			baseRWI.OnSize(self, event)
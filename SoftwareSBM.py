@@ -0,0 +1,181 @@
+"""Software haptic device module.
+
+Here is defined the class SoftwareSBM, a stand-in for the
+vtkSBM (Simball 4D) haptic device driven by software.
+"""
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class ToolCollection:
+	"""Traversable list of the tools of a device, like vtkCollection."""
+
+	def __init__(self):
+		self.Items = list()
+		self.Index = 0
+
+	def AddItem(self, item):
+		self.Items.append(item)
+
+	def RemoveAllItems(self):
+		self.Items = list()
+		self.Index = 0
+
+	def GetNumberOfItems(self):
+		return len(self.Items)
+
+	def GetItem(self, i):
+		return self.Items[i]
+
+	def InitTraversal(self):
+		self.Index = 0
+
+	def GetNextItem(self):
+		"""Return the next item, or None at the end."""
+		if self.Index >= len(self.Items):
+			return None
+		self.Index += 1
+		return self.Items[self.Index - 1]
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class SoftwareSBM:
+	"""Haptic device with the vtkSBM interface used by HysTrainer.
+
+	Its values are set from code instead of being read from
+	hardware. UpdateDevice is the hook where subclasses produce
+	new values. UpdateScenario places the camera at the pose
+	set, if any, and moves the tools added: depth plus insertion
+	push them along the view direction, roll turns them about it,
+	and opening is set on tools with jaws.
+
+	Usage:
+		device = SoftwareSBM()
+		device.SetLeftToolDepth(0.5)
+		timer.SetHapticDevice(device)
+	"""
+
+	def __init__(self):
+		"""Constructor."""
+		self.Depth = 0.0
+		self.Roll = 0.0
+		self.Opening = 0.0
+		self.Insertion = 0.0
+		self.LeftPedal = 0
+		self.RightPedal = 0
+		self.LensAngle = 0
+		self.CameraPose = None
+		self.Camera = None
+		self.CameraObject = None
+		self.SingleChannel = False
+		self.Tools = ToolCollection()
+		self.Reach = 6.0
+		self.RestPoses = dict()
+		self.Updates = 0
+
+	def IsA(self, name):
+		"""Pass for a vtkSBM device."""
+		return name in ('SoftwareSBM', 'vtkSBM', 'vtkHaptic')
+
+	def Init(self):
+		"""Connect the device. Return 1 on success, as vtkSBM does."""
+		return 1
+
+	def UpdateDevice(self):
+		"""Read the device. To be extended by subclasses."""
+		self.Updates += 1
+
+	def UpdateScenario(self):
+		"""Move the scenario camera to the pose set, then the tools."""
+		if self.Camera and self.CameraPose:
+			position, focal_point = self.CameraPose
+			self.Camera.SetPosition(position)
+			self.Camera.SetFocalPoint(focal_point)
+		if not self.Camera:
+			return
+		d = self.Camera.GetDirectionOfProjection()
+		depth = self.Reach*(self.Depth + self.Insertion)
+		self.Tools.InitTraversal()
+		tool = self.Tools.GetNextItem()
+		while tool:
+			for e, p, o in self.RestPoses[tool]:
+				e.SetPosition((p[0] + depth*d[0], p[1] + depth*d[1], p[2] + depth*d[2]))
+				e.SetOrientation((o[0], o[1], o[2] + self.Roll))
+			if hasattr(tool, 'SetOpening'):
+				tool.SetOpening(self.Opening)
+			tool = self.Tools.GetNextItem()
+
+	def SetCameraPose(self, position, focal_point):
+		"""Set the camera pose applied on the next scenario update."""
+		self.CameraPose = (tuple(position), tuple(focal_point))
+
+	def SetCamera(self, camera):
+		self.Camera = camera
+
+	def GetCamera(self):
+		return self.Camera
+
+	def SetCameraObject(self, o):
+		self.CameraObject = o
+
+	def GetCameraObject(self):
+		return self.CameraObject
+
+	def SetSingleChannel(self, single):
+		self.SingleChannel = single
+
+	def SetLensAngle(self, angle):
+		self.LensAngle = angle
+
+	def GetTools(self):
+		return self.Tools
+
+	def AddTool(self, tool):
+		"""Add a tool moved by the device.
+
+		Its element poses when first added are the rest poses,
+		with the tool extracted.
+		"""
+		if tool not in self.RestPoses:
+			poses = list()
+			elements = tool.GetElements()
+			elements.InitTraversal()
+			e = elements.GetNextElement()
+			while e:
+				poses.append((e, tuple(e.GetPosition()), tuple(e.GetOrientation())))
+				e = elements.GetNextElement()
+			self.RestPoses[tool] = poses
+		self.Tools.AddItem(tool)
+
+	def SetLeftToolDepth(self, depth):
+		self.Depth = depth
+
+	def GetLeftToolDepth(self):
+		return self.Depth
+
+	def SetLeftToolRoll(self, roll):
+		self.Roll = roll
+
+	def GetLeftToolRoll(self):
+		return self.Roll
+
+	def SetLeftToolOpening(self, opening):
+		self.Opening = opening
+
+	def GetLeftToolOpening(self):
+		return self.Opening
+
+	def SetToolInsertion(self, insertion):
+		self.Insertion = insertion
+
+	def GetToolInsertion(self):
+		return self.Insertion
+
+	def SetLeftPedalState(self, state):
+		self.LeftPedal = state
+
+	def GetLeftPedalState(self):
+		return self.LeftPedal
+
+	def SetRightPedalState(self, state):
+		self.RightPedal = state
+
+	def GetRightPedalState(self):
+		return self.RightPedal
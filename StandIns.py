@@ -0,0 +1,27 @@
+"""Headless stand-ins module.
+
+Here is defined the function InstallStandIns, which makes the
+local stand-ins of vtkesqui and wx (see HeadlessEsqui and
+HeadlessWx) be imported in place of the real packages.
+"""
+
+import sys
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def InstallStandIns():
+	"""Import the stand-ins as vtkesqui and wx.
+
+	Must be called before common is imported. The real packages
+	are never tried, so a broken install does not go unnoticed
+	on the GUI path and the stand-ins are only used on request.
+
+	Usage:
+		from StandIns import *
+		if '--headless' in sys.argv:
+			InstallStandIns()
+		from common import *
+	"""
+	import HeadlessEsqui
+	import HeadlessWx
+	sys.modules['vtkesqui'] = HeadlessEsqui
+	sys.modules['wx'] = HeadlessWx
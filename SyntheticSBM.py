@@ -0,0 +1,151 @@
+"""Synthetic haptic device module.
+
+Here are defined the class SyntheticSBM, a software vtkSBM
+that follows synthetic trajectories, and the trajectories it
+can be configured with.
+"""
+
+from SoftwareSBM import *
+import math
+import random
+import time
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class Trajectory:
+	"""Base class of synthetic values. Value(t) gives the value at t seconds."""
+
+	def Value(self, t):
+		return 0.0
+
+class Constant(Trajectory):
+	"""Fixed value."""
+
+	def __init__(self, value):
+		self.Constant = value
+
+	def Value(self, t):
+		return self.Constant
+
+class Sine(Trajectory):
+	"""Sine wave of the mean, amplitude and period given."""
+
+	def __init__(self, mean, amplitude, period, phase = 0.0):
+		self.Mean = mean
+		self.Amplitude = amplitude
+		self.Period = float(period)
+		self.Phase = phase
+
+	def Value(self, t):
+		return self.Mean + self.Amplitude*math.sin(2*math.pi*(t/self.Period + self.Phase))
+
+class Pulse(Trajectory):
+	"""Square wave. High from start to end seconds of every period."""
+
+	def __init__(self, period, start, end, high = 1, low = 0):
+		self.Period = float(period)
+		self.Start = start
+		self.End = end
+		self.High = high
+		self.Low = low
+
+	def Value(self, t):
+		if self.Start <= t % self.Period < self.End:
+			return self.High
+		return self.Low
+
+class RandomWalk(Trajectory):
+	"""Bounded random walk. Speed is the maximum change per second."""
+
+	def __init__(self, low, high, speed, seed = None):
+		self.Low = low
+		self.High = high
+		self.Speed = speed
+		self.Random = random.Random(seed)
+		self.Current = (low + high)/2.0
+		self.Time = None
+
+	def Value(self, t):
+		if self.Time is not None:
+			step = self.Speed*(t - self.Time)
+			self.Current += self.Random.uniform(-step, step)
+			self.Current = min(self.High, max(self.Low, self.Current))
+		self.Time = t
+		return self.Current
+
+class Gate(Trajectory):
+	"""Value of a trajectory while the gate one is not zero, otherwise 0."""
+
+	def __init__(self, trajectory, gate):
+		self.Trajectory = trajectory
+		self.Gate = gate
+
+	def Value(self, t):
+		if self.Gate.Value(t):
+			return self.Trajectory.Value(t)
+		return 0.0
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class SyntheticSBM(SoftwareSBM):
+	"""Software vtkSBM whose values follow synthetic trajectories.
+
+	Every UpdateDevice evaluates the trajectory of each channel
+	(depth, roll, opening, left and right pedals) at the time
+	elapsed since Init, so it can be polled at any rate.
+
+	The default trajectories loop every 10 seconds: the tool is
+	extracted for the first and last second, so the timer goes
+	through lens and tool selection, and inserted in between.
+	Opening sweeps across the selection threshold and pedals
+	click at different rates.
+
+	Usage:
+		device = SyntheticSBM()
+		device.SetTrajectory('Roll', Sine(0, 90, 2.0))
+		timer.SetHapticDevice(device)
+		timer.SetHapticPollingRate(2000)
+	"""
+
+	Channels = ('Depth', 'Roll', 'Opening', 'LeftPedal', 'RightPedal')
+
+	def __init__(self, clock = time.time):
+		"""Constructor."""
+		SoftwareSBM.__init__(self)
+		self.Clock = clock
+		self.StartTime = clock()
+		self.Trajectories = {
+			'Depth': Gate(Sine(0.5, 0.3, 2.0), Pulse(10, 1, 9)),
+			'Roll': Sine(0, 45, 3.0),
+			'Opening': Sine(0.5, 0.5, 1.5),
+			'LeftPedal': Pulse(0.8, 0, 0.2),
+			'RightPedal': Pulse(1.3, 0, 0.2)}
+
+	def IsA(self, name):
+		"""Pass for a vtkSBM device."""
+		return name == 'SyntheticSBM' or SoftwareSBM.IsA(self, name)
+
+	def SetClock(self, clock):
+		"""Set the function returning the current time."""
+		self.Clock = clock
+		self.StartTime = clock()
+
+	def SetTrajectory(self, channel, trajectory):
+		"""Set the trajectory of a channel. See Channels."""
+		if channel not in SyntheticSBM.Channels:
+			raise ValueError('Unknown channel: %s' % channel)
+		self.Trajectories[channel] = trajectory
+
+	def Init(self):
+		"""Connect the device. Trajectories start now."""
+		self.StartTime = self.Clock()
+		return SoftwareSBM.Init(self)
+
+	def UpdateDevice(self):
+		"""Set the values of every channel at the current time."""
+		SoftwareSBM.UpdateDevice(self)
+		t = self.Clock() - self.StartTime
+		trajectories = self.Trajectories
+		self.Depth = trajectories['Depth'].Value(t)
+		self.Roll = trajectories['Roll'].Value(t)
+		self.Opening = trajectories['Opening'].Value(t)
+		self.LeftPedal = int(bool(trajectories['LeftPedal'].Value(t)))
+		self.RightPedal = int(bool(trajectories['RightPedal'].Value(t)))
@@ -0,0 +1,126 @@
+"""Texture cache module.
+
+Here is defined the class TextureCache, a registry of the
+textures shared by the scenario elements, and TextureRegistry,
+the instance shared by the whole process.
+"""
+
+import vtk
+import os
+import threading
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class TextureCache:
+	"""Registry of textures decoded once and shared by all elements.
+
+	Textures are keyed by absolute file name. The validity of
+	every file is checked once per mtime and size, so a file
+	changed on disk is checked and decoded again.
+
+	Users are the objects given on request, usually the element
+	actors, and each one is counted once. Textures left without
+	users on release are dropped. Clear forgets everything.
+
+	Usage:
+		if TextureRegistry.IsValid(filename):
+			actor.SetTexture(TextureRegistry.GetTexture(filename, actor))
+		print(TextureRegistry.GetReport())
+		...
+		TextureRegistry.Release(actor)
+	"""
+
+	def __init__(self):
+		"""Constructor."""
+		self.Textures = dict()
+		self.Users = dict()
+		self.Valid = dict()
+		self.__lock = threading.RLock()
+
+	def GetKey(self, filename):
+		return os.path.abspath(filename)
+
+	def GetStamp(self, key):
+		"""Return the mtime and size of a file, None if missing."""
+		try:
+			st = os.stat(key)
+		except OSError:
+			return None
+		return (st.st_mtime, st.st_size)
+
+	def IsValid(self, filename):
+		"""Check whether the file exists and is a readable image."""
+		if not filename:
+			return False
+		key = self.GetKey(filename)
+		stamp = self.GetStamp(key)
+		with self.__lock:
+			if key not in self.Valid or self.Valid[key][0] != stamp:
+				valid = False
+				if stamp and os.path.isfile(key):
+					reader = vtk.vtkImageReader2Factory.CreateImageReader2(key)
+					valid = bool(reader)
+				self.Valid[key] = (stamp, valid)
+				# Changed on disk: decode it again on the next request
+				self.Textures.pop(key, None)
+			return self.Valid[key][1]
+
+	def GetTexture(self, filename, user = None):
+		"""Return the shared texture of an image file, None if not valid.
+
+		The image is decoded on the first request. The user given,
+		if any, is added to the users of the texture.
+		"""
+		if not self.IsValid(filename):
+			return None
+		key = self.GetKey(filename)
+		with self.__lock:
+			if key not in self.Textures:
+				reader = vtk.vtkImageReader2Factory.CreateImageReader2(key)
+				reader.SetFileName(key)
+				reader.Update()
+				texture = vtk.vtkTexture()
+				texture.SetInputConnection(reader.GetOutputPort())
+				texture.InterpolateOn()
+				self.Textures[key] = texture
+				self.Users.setdefault(key, set())
+			if user is not None:
+				self.Users[key].add(user)
+			return self.Textures[key]
+
+	def Release(self, user):
+		"""Remove a user from every texture. Drop the textures left unused."""
+		with self.__lock:
+			for key in list(self.Users.keys()):
+				users = self.Users[key]
+				users.discard(user)
+				if not users:
+					del self.Users[key]
+					self.Textures.pop(key, None)
+
+	def GetMemoryUsage(self):
+		"""Return a dictionary with the image bytes of every texture."""
+		usage = dict()
+		with self.__lock:
+			for key, texture in self.Textures.items():
+				image = texture.GetInput()
+				usage[key] = image.GetActualMemorySize()*1024 if image else 0
+		return usage
+
+	def GetReport(self):
+		"""Return users and memory of every texture as a text table."""
+		usage = self.GetMemoryUsage()
+		lines = ['%-40s %6s %10s' % ('texture', 'users', 'KiB')]
+		users = dict([(key, len(self.Users.get(key, ()))) for key in usage])
+		for key in sorted(usage):
+			lines.append('%-40s %6d %10d' % (os.path.basename(key), users[key], usage[key]//1024))
+		lines.append('%-40s %6d %10d' % ('total', sum(users.values()), sum(usage.values())//1024))
+		return '\n'.join(lines)
+
+	def Clear(self):
+		"""Forget all textures and file checks."""
+		with self.__lock:
+			self.Textures = dict()
+			self.Users = dict()
+			self.Valid = dict()
+
+TextureRegistry = TextureCache()
@@ -0,0 +1,260 @@
+"""HysTrainer headless benchmark.
+
+Load SRML scenarios without building the GUI, render them
+offscreen and drive the simulation loop for a number of frames
+with scripted camera and tool motion. Report the throughput
+and the latency percentiles of every loop stage.
+
+Usage:
+	python benchmark.py [-n FRAMES] [--size 640x480] [--cut] [--async-cut] [--threaded] [--render-on-demand] [--governor [MS]] [--rates] [--lod] [--highlight MODE] [--ring-depth N] [--haptic HZ] [--headless] [--json FILE] examples/*.srml
+
+With --haptic, a synthetic haptic device (see SyntheticSBM) is
+polled at the rate given, 0 to poll it from the timer, and the
+whole timer state machine is run instead of the simulation loop.
+
+Simulation timer options, like --highlight, set the same
+HYSTRAINER_* environment variables the application reads.
+With --threaded, the simulation is stepped by the timer worker
+thread while the frames are paced timer ticks. Renders are queued
+with wx.CallAfter, so they need the wx stand-in (--headless) or a
+running wx event loop.
+
+On machines without GPU or display, use a VTK built with
+offscreen support and Mesa software rendering (--software).
+With --headless, vtkesqui and wx are replaced by local stand-ins,
+for machines where they are not installed (see StandIns).
+"""
+
+import sys
+from StandIns import *
+# Stand-ins have to be installed before common is imported
+if '--headless' in sys.argv:
+	InstallStandIns()
+
+from common import *
+from HeadlessSession import *
+from SyntheticSBM import *
+from LevelOfDetail import *
+from MeshCache import *
+from CuttingEngine import StartWorkerPool
+import math
+import json
+import argparse
+import timeit
+import time
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class BenchmarkRunner(HeadlessSession):
+	"""Run a SRML scenario headless with scripted motion.
+
+	The camera sways sideways while the tools go in and out
+	along the view direction, so collisions, highlights and
+	cuts are exercised.
+
+	Usage:
+		runner = BenchmarkRunner()
+		if runner.Load('examples/example-cut.srml', cutting = True):
+			result = runner.Run(300)
+		runner.Close()
+	"""
+
+	def __init__(self, size = (640, 480)):
+		"""Constructor."""
+		HeadlessSession.__init__(self, size)
+		self.Period = 100
+		self.Reach = 6.0
+		self.Sway = 0.5
+		self.Elements = list()
+		self.Paced = False
+
+	def Load(self, filename, cutting = False, haptic_rate = None, lod = False):
+		"""Read the SRML file and initialize the simulation.
+
+		If a haptic rate is given, a synthetic device is polled at
+		that rate. Organs are rendered with levels of detail if
+		asked to. Return False if the file is not valid.
+		"""
+		device = None
+		if haptic_rate is not None:
+			device = SyntheticSBM()
+		if not HeadlessSession.Load(self, filename, device):
+			return False
+		if device:
+			self.timer.SetHapticPollingRate(haptic_rate)
+			self.timer.StartHapticPoller()
+		for tool in self.Tools:
+			elements = tool.GetElements()
+			elements.InitTraversal()
+			e = elements.GetNextElement()
+			while e:
+				self.Elements.append((e, e.GetPosition()))
+				e = elements.GetNextElement()
+		if cutting:
+			self.timer.CuttingOn()
+		if lod:
+			levels = LevelOfDetail(MeshCache())
+			objects = self.scenario.GetObjects()
+			objects.InitTraversal()
+			o = objects.GetNextObject()
+			while o:
+				if o.IsA('vtkOrgan'):
+					elements = o.GetElements()
+					elements.InitTraversal()
+					e = elements.GetNextElement()
+					while e:
+						levels.AddElement(e)
+						e = elements.GetNextElement()
+				o = objects.GetNextObject()
+			self.timer.SetLevelOfDetail(levels)
+		self.timer.Profiler.Clear()
+		self.timer.ProfilingOn()
+		return True
+
+	def Script(self, frame):
+		"""Move camera and tools for the frame given."""
+		phase = 2*math.pi*frame/self.Period
+		camera = self.scenario.GetCamera()
+		camera.Azimuth(self.Sway*math.cos(phase))
+		depth = self.Reach*(1 - math.cos(phase))/2
+		d = camera.GetDirectionOfProjection()
+		for e, p in self.Elements:
+			e.SetPosition((p[0] + depth*d[0], p[1] + depth*d[1], p[2] + depth*d[2]))
+
+	def UseSceneRates(self):
+		"""Run the stages at the rates of the SRML file, as the app does.
+
+		Frames are then timer ticks, paced at the tick period, and
+		the rate stage statistics are reported.
+		"""
+		self.timer.SetRates(*ReadSRMLRates(self.FileName))
+		self.Paced = True
+
+	def Run(self, frames):
+		"""Run the simulation loop for some frames. Return the statistics."""
+		clock = timeit.default_timer
+		profiler = self.timer.Profiler
+		period = self.timer.GetTickPeriod()/1000.0
+		threaded = self.timer.Threaded
+		if threaded:
+			self.timer.StartSimulation()
+		start = clock()
+		for i in xrange(frames):
+			# The worker thread may be stepping the scene
+			with self.timer.GetLock():
+				self.Script(i)
+			t0 = clock()
+			if threaded:
+				with self.timer.GetLock():
+					self.timer.StateMachine()
+			elif self.use_haptic or self.Paced:
+				self.timer.StateMachine()
+			else:
+				self.timer.SimulationLoop()
+			profiler.Record('frame', clock() - t0)
+			if self.Paced or threaded:
+				delay = start + (i + 1)*period - clock()
+				if delay > 0:
+					time.sleep(delay)
+		seconds = clock() - start
+		if threaded:
+			self.timer.StopSimulation()
+
+		result = {'file': self.FileName,
+			'frames': frames,
+			'seconds': seconds,
+			'fps': frames/seconds,
+			'renders': self.timer.Renders,
+			'skipped_renders': self.timer.GetNumberOfSkippedRenders(),
+			'rates': self.timer.GetRateStatistics(),
+			'stages': profiler.GetStatistics()}
+		if self.timer.Governor:
+			result['quality_level'] = self.timer.Governor.Level
+			result['quality_changes'] = self.timer.Governor.Changes
+		if self.timer.LevelOfDetail:
+			result['lod'] = self.timer.LevelOfDetail.GetStatistics()
+		if self.use_haptic:
+			result['haptic_updates'] = self.timer.haptic.Updates
+			if self.timer.Poller:
+				result['haptic_overruns'] = self.timer.Poller.Overruns
+		return result
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def main(argv):
+	"""Benchmark the SRML files given in the command line."""
+	parser = argparse.ArgumentParser(description = 'Headless HysTrainer benchmark.')
+	parser.add_argument('files', nargs = '+', metavar = 'SRML')
+	parser.add_argument('-n', '--frames', type = int, default = 300, help = 'frames per scenario')
+	parser.add_argument('--size', default = '640x480', help = 'render size, WxH')
+	parser.add_argument('--cut', action = 'store_true', help = 'enable cutting')
+	parser.add_argument('--rates', action = 'store_true',
+		help = 'run the stages at the scene rates, paced at the timer tick')
+	parser.add_argument('--lod', action = 'store_true', help = 'render organs with levels of detail')
+	parser.add_argument('--async-cut', action = 'store_true',
+		help = 'compute cuts in a worker process (HYSTRAINER_ASYNC_CUT)')
+	parser.add_argument('--threaded', action = 'store_true',
+		help = 'step the simulation on a worker thread (HYSTRAINER_THREADED)')
+	parser.add_argument('--render-on-demand', action = 'store_true',
+		help = 'only render when the scene changes (HYSTRAINER_RENDER_ON_DEMAND)')
+	parser.add_argument('--governor', nargs = '?', const = '', metavar = 'MS',
+		help = 'lower the quality over the frame budget, by default the render period (HYSTRAINER_GOVERNOR)')
+	parser.add_argument('--highlight', choices = ('overlay', 'scalars', 'batched'),
+		help = 'collision highlight mode (HYSTRAINER_HIGHLIGHT_MODE)')
+	parser.add_argument('--ring-depth', type = int, metavar = 'N',
+		help = 'neighbour cell rings highlighted around collisions (HYSTRAINER_RING_DEPTH)')
+	parser.add_argument('--haptic', type = int, metavar = 'HZ',
+		help = 'drive a synthetic haptic device polled at HZ, 0 from the timer')
+	parser.add_argument('--software', action = 'store_true', help = 'force Mesa software rendering')
+	parser.add_argument('--headless', action = 'store_true',
+		help = 'use the local stand-ins of vtkesqui and wx (see StandIns)')
+	parser.add_argument('--json', metavar = 'FILE', help = 'write the results to a JSON file')
+	args = parser.parse_args(argv)
+
+	if args.software:
+		os.environ['LIBGL_ALWAYS_SOFTWARE'] = '1'
+	# Timer options are read from the environment, as in the app
+	if args.highlight:
+		os.environ['HYSTRAINER_HIGHLIGHT_MODE'] = args.highlight
+	if args.async_cut:
+		os.environ['HYSTRAINER_ASYNC_CUT'] = '1'
+		StartWorkerPool()
+	if args.threaded:
+		os.environ['HYSTRAINER_THREADED'] = '1'
+	if args.render_on_demand:
+		os.environ['HYSTRAINER_RENDER_ON_DEMAND'] = '1'
+	if args.governor is not None:
+		os.environ['HYSTRAINER_GOVERNOR'] = '1'
+		if args.governor:
+			os.environ['HYSTRAINER_FRAME_BUDGET'] = args.governor
+	if args.ring_depth is not None:
+		os.environ['HYSTRAINER_RING_DEPTH'] = str(args.ring_depth)
+	size = tuple([int(v) for v in args.size.lower().split('x')])
+
+	results = list()
+	failed = 0
+	for filename in args.files:
+		runner = BenchmarkRunner(size)
+		try:
+			if not runner.Load(filename, args.cut, args.haptic, args.lod):
+				sys.stderr.write('%s: bad SRML file\n' % filename)
+				failed += 1
+				continue
+			if args.rates:
+				runner.UseSceneRates()
+			result = runner.Run(args.frames)
+			report = runner.timer.Profiler.GetReport()
+		finally:
+			runner.Close()
+		results.append(result)
+		sys.stdout.write('%s: %d frames in %.2f s, %.1f fps\n%s\n\n' % (filename,
+			result['frames'], result['seconds'], result['fps'], report))
+
+	if args.json:
+		f = open(args.json, 'w')
+		try:
+			json.dump(results, f, indent = 1, sort_keys = True)
+		finally:
+			f.close()
+	return 1 if failed else 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
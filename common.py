@@ -4,4 +4,4 @@ import vtk
 import vtkesqui
 import wx
 import os
-import sys
\ No newline at end of file
+import sys
@@ -49,8 +49,21 @@ POSSIBILITY OF SUCH DAMAGE.
 
 from common import *
 from SimulationApp import *
+from CuttingEngine import StartWorkerPool
+import multiprocessing
+import logging
 
 if __name__ == '__main__':
+	# Needed by the cutting worker process in frozen apps
+	multiprocessing.freeze_support()
+
+	# The cut worker may be forked, so it goes before any window
+	if os.environ.get('HYSTRAINER_ASYNC_CUT', '0') != '0':
+		StartWorkerPool()
+
+	# Quality changes of the frame governor, among others
+	logging.basicConfig(level = logging.INFO, format = '%(asctime)s %(name)s: %(message)s')
+
 	# Redirect vtk errors to txt in stead of pop-up window
 	""" NOT DESIRED IN FINAL APP
 	if os.name == 'nt':
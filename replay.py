@@ -0,0 +1,182 @@
+"""HysTrainer batch replay.
+
+Replay recorded sessions (see InputRecorder) headless and as
+fast as possible. The simulation is stepped with a fixed
+simulated time step instead of the wall-clock timer, inputs
+are fed from the log at their simulated time and rendering is
+subsampled or skipped. By default the step is the timer tick
+period saved in the log, and the stages run at the rates of
+the scene (see RateScheduler) on the simulated clock.
+
+Usage:
+	python replay.py [--dt SECONDS] [--render-every 10] [--headless] [--json FILE] LOG_OR_DIR...
+
+Directories are searched for *.hrec logs. Scenes are loaded
+from the path saved in the log, or from --scenes DIR. With
+--headless, the local stand-ins of vtkesqui and wx are used.
+"""
+
+import sys
+from StandIns import *
+# Stand-ins have to be installed before common is imported
+if '--headless' in sys.argv:
+	InstallStandIns()
+
+from common import *
+from HeadlessSession import *
+from InputRecorder import *
+from SoftwareSBM import *
+import glob
+import math
+import json
+import argparse
+import timeit
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class SimulatedClock:
+	"""Clock advanced by hand."""
+
+	def __init__(self):
+		self.Time = 0.0
+
+	def __call__(self):
+		return self.Time
+
+	def Advance(self, dt):
+		self.Time += dt
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class SessionReplay(HeadlessSession):
+	"""Replay a recorded session with a simulated clock.
+
+	Usage:
+		replay = SessionReplay('session.hrec')
+		if replay.Load():
+			result = replay.Run()
+		replay.Close()
+	"""
+
+	def __init__(self, filename, size = (320, 240), scenes = None):
+		"""Constructor. Scenes is a directory to look SRML files up."""
+		HeadlessSession.__init__(self, size)
+		self.LogFileName = filename
+		self.Replayer = InputReplayer(filename)
+		self.Scene = self.Replayer.GetScene()
+		if scenes:
+			self.Scene = os.path.join(scenes, os.path.basename(self.Scene))
+		self.Clock = SimulatedClock()
+
+	def Load(self):
+		"""Load the scene of the session. Return False if not valid."""
+		device = None
+		if self.Replayer.UsesHaptic():
+			device = SoftwareSBM()
+		if not HeadlessSession.Load(self, self.Scene, device):
+			return False
+		self.Replayer.SetInteractor(self.iren)
+		self.Replayer.SetDevice(device)
+		self.Replayer.SetFrame(self)
+		self.timer.SetRates(*ReadSRMLRates(self.Scene))
+		self.timer.Scheduler.SetClock(self.Clock)
+		self.timer.Animations.SetClock(self.Clock)
+		self.timer.Profiler.Clear()
+		self.timer.ProfilingOn()
+		return True
+
+	def Run(self, dt = None, render_interval = 10):
+		"""Replay the whole session. Return the statistics.
+
+		dt is the simulated time step in seconds, by default the
+		tick period of the session. One of every render_interval
+		steps is rendered, none if 0.
+		"""
+		timer = self.timer
+		if not dt:
+			dt = self.Replayer.GetTickPeriod() or timer.GetTickPeriod()/1000.0
+		timer.SetRenderInterval(render_interval)
+		duration = self.Replayer.GetDuration()
+		steps = int(math.ceil(duration/dt)) + 1
+		clock = timeit.default_timer
+		start = clock()
+		for i in xrange(steps):
+			self.Replayer.Feed(self.Clock())
+			if self.Running:
+				timer.StateMachine()
+			self.Clock.Advance(dt)
+		seconds = clock() - start
+
+		return {'file': self.LogFileName,
+			'scene': self.Scene,
+			'duration': duration,
+			'steps': steps,
+			'dt': dt,
+			'seconds': seconds,
+			'speedup': duration/seconds if seconds else 0.0,
+			'records': int(self.Replayer.Records.size),
+			'renders': timer.Renders,
+			'rates': timer.GetRateStatistics(),
+			'throttled_renders': timer.GetNumberOfThrottledRenders(),
+			'stages': timer.Profiler.GetStatistics()}
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def FindLogs(paths):
+	"""Return the logs given, expanding directories."""
+	logs = list()
+	for path in paths:
+		if os.path.isdir(path):
+			logs.extend(sorted(glob.glob(os.path.join(path, '*.hrec'))))
+		else:
+			logs.append(path)
+	return logs
+
+def main(argv):
+	"""Replay the logs given in the command line."""
+	parser = argparse.ArgumentParser(description = 'Faster than real time HysTrainer replay.')
+	parser.add_argument('paths', nargs = '+', metavar = 'LOG_OR_DIR')
+	parser.add_argument('--dt', type = float,
+		help = 'simulated time step in seconds, by default the one recorded')
+	parser.add_argument('--render-every', type = int, default = 10, metavar = 'N',
+		help = 'render one of every N steps, 0 to never render')
+	parser.add_argument('--size', default = '320x240', help = 'render size, WxH')
+	parser.add_argument('--scenes', metavar = 'DIR', help = 'directory of the SRML files')
+	parser.add_argument('--software', action = 'store_true', help = 'force Mesa software rendering')
+	parser.add_argument('--headless', action = 'store_true',
+		help = 'use the local stand-ins of vtkesqui and wx (see StandIns)')
+	parser.add_argument('--json', metavar = 'FILE', help = 'write the results to a JSON file')
+	args = parser.parse_args(argv)
+
+	if args.software:
+		os.environ['LIBGL_ALWAYS_SOFTWARE'] = '1'
+	size = tuple([int(v) for v in args.size.lower().split('x')])
+
+	results = list()
+	failed = 0
+	for filename in FindLogs(args.paths):
+		try:
+			replay = SessionReplay(filename, size, args.scenes)
+		except (IOError, ValueError) as e:
+			sys.stderr.write('%s: %s\n' % (filename, e))
+			failed += 1
+			continue
+		try:
+			if not replay.Load():
+				sys.stderr.write('%s: cannot load %s\n' % (filename, replay.Scene))
+				failed += 1
+				continue
+			result = replay.Run(args.dt, args.render_every)
+		finally:
+			replay.Close()
+		results.append(result)
+		sys.stdout.write('%s: %.1f s replayed in %.2f s (x%.0f), %d steps, %d renders\n' % (filename,
+			result['duration'], result['seconds'], result['speedup'], result['steps'], result['renders']))
+
+	if args.json:
+		f = open(args.json, 'w')
+		try:
+			json.dump(results, f, indent = 1, sort_keys = True)
+		finally:
+			f.close()
+	return 1 if failed else 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,90 @@
+"""Tests of the haptic polling thread.
+
+Run with:
+	python -m unittest discover tests
+"""
+
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from HapticPoller import *
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class MockDevice:
+	"""Haptic device whose values change on every update."""
+
+	def __init__(self):
+		"""Constructor."""
+		self.Updates = 0
+		self.Lock = threading.Lock()
+
+	def UpdateDevice(self):
+		with self.Lock:
+			self.Updates += 1
+
+	def GetLeftToolDepth(self):
+		return float(self.Updates)
+
+	def GetLeftToolRoll(self):
+		return 2.0*self.Updates
+
+	def GetLeftToolOpening(self):
+		return 0.5
+
+	def GetLeftPedalState(self):
+		return self.Updates % 2
+
+	def GetRightPedalState(self):
+		return 1
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class HapticPollerTest(unittest.TestCase):
+
+	def testPollingRate(self):
+		device = MockDevice()
+		poller = HapticPoller(device, rate = 200)
+		start = time.time()
+		poller.start()
+		time.sleep(0.5)
+		poller.Stop()
+		elapsed = time.time() - start
+		expected = 200*elapsed
+		self.assertEqual(poller.Polls, device.Updates)
+		self.assertTrue(0.5*expected <= poller.Polls <= 1.1*expected + 1,
+			'%d polls in %.3f s' % (poller.Polls, elapsed))
+
+	def testPublishedState(self):
+		device = MockDevice()
+		poller = HapticPoller(device, rate = 1000)
+		self.assertEqual(poller.GetState().Sequence, 0)
+		poller.start()
+		time.sleep(0.1)
+		poller.Stop()
+		state = poller.GetState()
+		self.assertEqual(state.Sequence % 2, 0)
+		self.assertEqual(state.Depth, float(device.Updates))
+		self.assertEqual(state.Roll, 2.0*device.Updates)
+		self.assertEqual(state.Opening, 0.5)
+		self.assertEqual(state.LeftPedal, device.Updates % 2)
+		self.assertEqual(state.RightPedal, 1)
+
+	def testConsistentReads(self):
+		device = MockDevice()
+		poller = HapticPoller(device, rate = 5000)
+		poller.start()
+		try:
+			end = time.time() + 0.2
+			while time.time() < end:
+				state = poller.GetState()
+				# Values of a single poll are never mixed
+				self.assertEqual(state.Roll, 2.0*state.Depth)
+		finally:
+			poller.Stop()
+
+if __name__ == '__main__':
+	unittest.main()
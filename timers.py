@@ -1,51 +1,34 @@
 """Timers module
 
 Here are defined all timers involved in the simulation
-process.
+process. Animations are driven by the simulation timer
+through an AnimationScheduler.
 """
 
 from common import *
+from CollisionSnapshot import *
+from HighlightEngine import *
+from CuttingEngine import *
+from AnimationScheduler import *
+from RateScheduler import *
+from HapticPoller import *
+from FrameProfiler import *
+from FrameGovernor import *
+from InputRecorder import *
+from LevelOfDetail import *
+from TextureCache import TextureRegistry
+import os
 import time
+import timeit
 import threading
 
-# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-class NailMovingTimer(wx.Timer):
-	"""Animate the nail when key 'A' pressed."""
-
-	def __init__(self, frame, period = 2):
-		"""Constructor.
-
-		Usage in main frame constructor:
-		nail_timer = NailMovingTimer(self)
-		nail_timer.StartMoving()
-
-		Better leave the default period.
-		"""
-		wx.Timer.__init__(self)
-		self.frame = frame
-		self.count = 0
-		self.delta = -0.1
-		self.nail_depth = 0
-
-	def Notify(self):
-		"""Callback function."""
-		if self.count == 20:
-			self.Stop()
-			return
-		elif self.count == 10:
-			self.delta = -self.delta
-		
-		self.nail_depth += self.delta
-		self.frame.UpdateNail(self.nail_depth)
-		self.count += 1
-
-	def StartMoving(self):
-		"""Timer firing method."""
-		self.Start(100, wx.TIMER_CONTINUOUS)
-
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 class DialogHidingTimer(wx.Timer):
-	"""Hide a dialog after some seconds."""
+	"""Hide a dialog after some seconds.
+
+	It has its own one-shot timer, so dialogs are hidden even while
+	the simulation timer is stopped (e.g. on the lens selection).
+	"""
 
 	def __init__(self, frame, period = 2):
 		"""Constructor.
@@ -68,50 +51,6 @@ class DialogHidingTimer(wx.Timer):
 		"""Timer firing method."""
 		self.Start(self.period, wx.TIMER_ONE_SHOT)
 
-# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-class CutDisapearTimer(wx.Timer):
-	"""Animate two element parts while fading them out."""
-
-	def __init__(self, renderer, actor_1, actor_2, period = 3):
-		"""Constructor.
-
-		Usage:
-		cut_timer = CutDisapearTimer(renderer, actor_upper_part, actor_downer_part)
-		cut_timer.StartDisapearing()
-
-		Better use default timing.
-		"""
-		wx.Timer.__init__(self)
-		self.ren = renderer
-		self.actor_1 = actor_1
-		self.actor_2 = actor_2
-		self.count = int(period*10)
-		self.period = period
-		self.opacity_step = 1/float(self.count)
-		self.opacity = 1
-		self.rotation_step = 90/float(self.count)
-		self.translation_step = 1/float(self.count)
-
-	def Notify(self):
-		"""Callback function.
-
-		Make a split & hide effect between two parts.
-		"""
-		self.actor_1.RotateZ(self.rotation_step)
-		self.actor_1.AddPosition(0,self.translation_step,0)
-		self.actor_1.GetProperty().SetOpacity(self.opacity)
-		self.actor_2.GetProperty().SetOpacity(self.opacity)
-		self.opacity -= self.opacity_step
-		self.count -= 1
-		if self.count <= 0:
-			self.Stop()
-			self.ren.RemoveActor(self.actor_1)
-			self.ren.RemoveActor(self.actor_2)
-
-	def StartDisapearing(self):
-		"""Timer firing method."""
-		self.Start(100, wx.TIMER_CONTINUOUS)
-
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 class SimulationTimer(wx.Timer):
 	"""Main simulation timer.
@@ -136,14 +75,71 @@ class SimulationTimer(wx.Timer):
 		self.Scenario = None
 		
 		# Internal Attributes
-		self.EmptyPD = vtk.vtkPolyData()
+		self.Collisions = CollisionSnapshot()
+		self.Highlighter = HighlightEngine()
+		self.Cutter = CuttingEngine()
+		self.Animations = AnimationScheduler()
+		self.Scheduler = None
+		self.HapticState = HapticState()
+		self.HapticRate = 0
+		self.HapticDevice = None
+		self.haptic = None
+		self.LevelOfDetail = None
+		self.Poller = None
+		self.Recorder = None
+		self.Replayer = None
+		self.Profiler = FrameProfiler()
+		self.ProfileFile = os.environ.get('HYSTRAINER_PROFILE')
+		if self.ProfileFile:
+			self.Profiler.Enable()
+		self.CutAnimationPeriod = 3
+		self.CutAnimationScale = 1.0
+		self.RingDepth = 1
+		self.DeferCuts = False
+		self.DeferredCuts = list()
+		self.PendingCuts = set()
+		self.Governor = None
 		self.Elements = list()
-		self.Extractors = list()
-		self.GFilters = list()
-		self.Mappers = list()
-		self.Actors = list()
 		self.ren = None
-		self.__timer = None
+		self.Threaded = False
+		self.RenderOnDemand = False
+		self.DefaultBudget = True
+		self.RenderInterval = 1
+		self.RenderRequested = True
+		self.RenderSteps = 0
+		self.Renders = 0
+		self.SkippedRenders = 0
+		self.ThrottledRenders = 0
+		self.WatchedActors = list()
+		self.__scene_signature = None
+		self.__thread = None
+		self.__stop = None
+		self.__render_pending = False
+		self.__lock = threading.RLock()
+		self.__work = 0.0
+		self.__render_steps = 0
+
+		# Highlight mode: overlay (default), scalars or batched
+		mode = os.environ.get('HYSTRAINER_HIGHLIGHT_MODE', 'overlay').lower()
+		if mode == 'scalars':
+			self.SetHighlightModeToScalars()
+		elif mode == 'batched':
+			self.SetHighlightModeToBatched()
+		depth = os.environ.get('HYSTRAINER_RING_DEPTH')
+		if depth:
+			self.SetHighlightRingDepth(int(depth))
+		if os.environ.get('HYSTRAINER_ASYNC_CUT', '0') != '0':
+			self.AsyncCuttingOn()
+		if os.environ.get('HYSTRAINER_THREADED', '0') != '0':
+			self.ThreadedSimulationOn()
+		if os.environ.get('HYSTRAINER_RENDER_ON_DEMAND', '0') != '0':
+			self.RenderOnDemandOn()
+		# Frame budget in milliseconds, by default the render period
+		if os.environ.get('HYSTRAINER_GOVERNOR', '0') != '0':
+			budget = os.environ.get('HYSTRAINER_FRAME_BUDGET')
+			if budget:
+				budget = RateToPeriod(budget)
+			self.GovernorOn(budget or None)
 	
 	def HighlightOn(self):
 		"""Turn collision highlighting ON."""
@@ -153,13 +149,46 @@ class SimulationTimer(wx.Timer):
 		"""Turn collision highlighting OFF."""
 		self.Highlight = False
 
+	def SetHighlightRingDepth(self, depth):
+		"""Set the number of neighbour cell rings highlighted around a collision."""
+		self.RingDepth = depth
+		if self.Governor:
+			self.ApplyQualityLevel(self.Governor.Level)
+		else:
+			self.Highlighter.SetRingDepth(depth)
+
+	def SetHighlightModeToOverlay(self):
+		"""Highlight collisions through one overlay actor per element."""
+		self.Highlighter.SetModeToOverlay()
+
+	def SetHighlightModeToScalars(self):
+		"""Highlight collisions by tinting the cells in place."""
+		self.Highlighter.SetModeToScalars()
+
+	def SetHighlightModeToBatched(self):
+		"""Highlight collisions of all elements through a single overlay actor."""
+		self.Highlighter.SetModeToBatched()
+
 	def CuttingOn(self):
-		"""Turn cutting effect on collision ON."""
+		"""Turn cutting effect on collision ON.
+
+		Cutting resources are only built once cutting is enabled.
+		"""
 		self.cutting = True
+		if self.Initialized:
+			self.Cutter.Warm()
 
 	def CuttingOff(self):
 		"""Turn cutting effect on collision OFF."""
 		self.cutting = False
+
+	def AsyncCuttingOn(self):
+		"""Compute cut geometry in a worker process, off the render tick."""
+		self.Cutter.AsyncOn()
+
+	def AsyncCuttingOff(self):
+		"""Compute cut geometry synchronously in the simulation loop."""
+		self.Cutter.AsyncOff()
 	
 	def AddHighlightObject(self, obj):
 		"""Add an object to highlight on collision."""
@@ -186,15 +215,26 @@ class SimulationTimer(wx.Timer):
 	def Reset(self):
 		"""Reset the timer to an initial state."""
 
-		# Remove actors
-		for a in self.Actors:
-			self.ren.RemoveActor(a)
+		self.StopSimulation()
+		self.StopHapticPoller()
+		self.StopRecording()
+		self.StopReplay()
+		self.Profiler.HideOverlay()
+		if self.LevelOfDetail:
+			self.LevelOfDetail.Reset()
+			self.LevelOfDetail = None
+
+		# Finish animations and remove highlights and cutting resources
+		self.Animations.FinishAll()
+		self.Highlighter.Reset()
+		self.Cutter.Reset()
 		
 		# Restore flags
 		self.Initialized = False
 		self.Highlight = False
 		
 		# Restore all external attributes
+		self.ReleaseTextures()
 		self.Scenario = None
 		del self.Simulation
 		self.Simulation = None
@@ -202,15 +242,279 @@ class SimulationTimer(wx.Timer):
 		# Restore all internal attributes
 		del self.Elements
 		self.Elements = list()
-		del self.Extractors
-		self.Extractors = list()
-		del self.GFilters
-		self.GFilters = list()
-		del self.Mappers
-		self.Mappers = list()
-		del self.Actors
-		self.Actors = list()
+		self.WatchedActors = list()
+		self.__scene_signature = None
+		self.RenderRequested = True
+		self.Collisions.Clear()
+		self.DeferredCuts = list()
+		self.PendingCuts = set()
+		if self.Governor:
+			self.Governor.Reset()
 	
+	def ReleaseTextures(self):
+		"""Give back the shared textures of the scenario elements."""
+		if not self.Scenario:
+			return
+		objects = self.Scenario.GetObjects()
+		objects.InitTraversal()
+		o = objects.GetNextObject()
+		while o:
+			elements = o.GetElements()
+			elements.InitTraversal()
+			e = elements.GetNextElement()
+			while e:
+				TextureRegistry.Release(e.GetVisualizationModel().GetActor())
+				e = elements.GetNextElement()
+			o = objects.GetNextObject()
+
+	def SetRates(self, render, simulation, haptic):
+		"""Run render, simulation and haptic stages at their own periods.
+
+		Periods given in seconds. Fast stages may catch up missed
+		steps; rendering always skips to the latest state.
+		"""
+		self.Scheduler = scheduler = RateScheduler()
+		scheduler.AddStage('haptic', haptic, self.HapticStep, max_catchup = 4)
+		scheduler.AddStage('simulation', simulation, self.SimulationStep, max_catchup = 2)
+		scheduler.AddStage('render', render, self.RenderStep)
+		if self.Governor and self.DefaultBudget:
+			self.Governor.SetBudget(render)
+
+	def GetRateStatistics(self):
+		"""Return the timing statistics of every rate stage, empty without rates."""
+		if not self.Scheduler:
+			return dict()
+		return self.Scheduler.GetStatistics()
+
+	def GetTickPeriod(self):
+		"""Return the timer period in milliseconds."""
+		if self.Scheduler:
+			return max(1, int(round(self.Scheduler.GetTickPeriod()*1000)))
+		return 40
+
+	def RenderOnDemandOn(self):
+		"""Only render when something visible has changed."""
+		self.RenderOnDemand = True
+		self.RequestRender()
+
+	def RenderOnDemandOff(self):
+		"""Render on every render step."""
+		self.RenderOnDemand = False
+
+	def RequestRender(self):
+		"""Force the next render step to render."""
+		self.RenderRequested = True
+
+	def SetRenderInterval(self, interval):
+		"""Render only one of every interval render steps. 0 never renders.
+
+		Meant for offline replays, where frames are not watched.
+		"""
+		self.RenderInterval = interval
+
+	def GetNumberOfSkippedRenders(self):
+		"""Return the number of renders skipped because nothing changed."""
+		return self.SkippedRenders
+
+	def GetNumberOfThrottledRenders(self):
+		"""Return the number of renders left out by the render interval."""
+		return self.ThrottledRenders
+
+	def ThreadedSimulationOn(self):
+		"""Step the simulation on a worker thread when the timer starts."""
+		self.Threaded = True
+
+	def ThreadedSimulationOff(self):
+		"""Step the simulation from the wx timer."""
+		self.Threaded = False
+
+	def Start(self, *args):
+		"""Start the wx timer, restarting the stage schedule.
+
+		In threaded mode the simulation worker is started as well.
+		"""
+		if self.Scheduler:
+			self.Scheduler.Restart()
+		if self.Threaded:
+			self.StartSimulation()
+		return wx.Timer.Start(self, *args)
+
+	def Stop(self):
+		"""Stop the wx timer and the simulation worker."""
+		self.StopSimulation()
+		return wx.Timer.Stop(self)
+
+	def ProfilingOn(self, filename = None):
+		"""Record the timings of every loop stage.
+
+		If a .csv or .json filename is given, the statistics are
+		written there on shutdown. Also enabled by setting the
+		HYSTRAINER_PROFILE environment variable to that filename.
+		"""
+		if filename:
+			self.ProfileFile = filename
+		self.Profiler.Enable()
+
+	def ProfilingOff(self):
+		"""Stop recording stage timings."""
+		self.Profiler.Disable()
+
+	def ShowProfilerOverlay(self):
+		"""Show the stage timings on screen. Turns profiling ON."""
+		self.Profiler.Enable()
+		if self.ren:
+			self.Profiler.ShowOverlay(self.ren)
+
+	def HideProfilerOverlay(self):
+		"""Remove the stage timings from screen."""
+		self.Profiler.HideOverlay()
+
+	QualityLevels = ['full', 'no highlight ring', 'deferred cuts', 'fast cut fade']
+
+	def GovernorOn(self, budget = None):
+		"""Lower the quality when frames exceed the budget (seconds).
+
+		By default the budget is the render period, and follows later
+		SetRates calls. Quality levels,
+		each one including the previous ones:
+			1. Highlight only the colliding cells, without neighbour rings.
+			2. Defer cuts to the next tick, one cut per tick.
+			3. Halve the cut fade animation.
+		"""
+		self.DefaultBudget = budget is None
+		if budget is None:
+			budget = 0.04
+			if self.Scheduler:
+				budget = self.Scheduler.GetStage('render').Period
+		if self.Governor:
+			self.Governor.SetBudget(budget)
+		else:
+			self.Governor = FrameGovernor(budget, self.QualityLevels, self.ApplyQualityLevel)
+		self.__work = 0.0
+
+	def GovernorOff(self):
+		"""Stop adapting the quality and go back to full quality."""
+		if self.Governor:
+			self.Governor.Reset()
+			self.Governor = None
+
+	def ApplyQualityLevel(self, level):
+		"""Set the costly simulation knobs for the quality level given."""
+		if level >= 1:
+			self.Highlighter.SetRingDepth(0)
+		else:
+			self.Highlighter.SetRingDepth(self.RingDepth)
+		self.DeferCuts = level >= 2
+		if level >= 3:
+			self.CutAnimationScale = 0.5
+		else:
+			self.CutAnimationScale = 1.0
+
+	def AccountWork(self, start, frame):
+		"""Add the time since start to the current frame.
+
+		When the frame is complete its time is handed to the governor.
+		"""
+		self.__work += timeit.default_timer() - start
+		if frame:
+			self.Governor.AddFrame(self.__work)
+			self.__work = 0.0
+
+	def SetHapticPollingRate(self, rate):
+		"""Poll the haptic device in its own thread at the rate given (Hz).
+
+		A rate of 0 polls the device from the simulation timer.
+		Takes effect on the next initialization.
+		"""
+		self.HapticRate = rate
+
+	def SetLevelOfDetail(self, lod):
+		"""Switch the element meshes by their size on screen before rendering.
+
+		See LevelOfDetail. The timer resets it with the simulation.
+		"""
+		self.LevelOfDetail = lod
+
+	def UpdateLevelOfDetail(self):
+		"""Level of detail stage. Tinted elements are rendered in full."""
+		self.LevelOfDetail.Update(self.Scenario.GetCamera(), self.Highlighter.GetTintedElements())
+
+	def SetHapticDevice(self, device):
+		"""Use the device given instead of the simulation one.
+
+		Meant for software devices (see SoftwareSBM). Takes effect
+		on the next initialization.
+		"""
+		self.HapticDevice = device
+
+	def StartRecording(self, filename, scene = ''):
+		"""Save the user inputs into the log given (see InputRecorder).
+
+		Return False while replaying, as the replayed inputs would
+		be recorded back.
+		"""
+		if self.Replayer:
+			return False
+		self.StopRecording()
+		self.Recorder = InputRecorder(filename, scene, period = self.GetTickPeriod()/1000.0)
+		return True
+
+	def StopRecording(self):
+		"""Stop saving the user inputs."""
+		if self.Recorder:
+			self.Recorder.Close()
+			self.Recorder = None
+
+	def StartReplay(self, replayer):
+		"""Feed the session of the replayer given on every tick.
+
+		Return False while recording (see StartRecording).
+		"""
+		if self.Recorder:
+			return False
+		self.Replayer = replayer
+		replayer.Start()
+		return True
+
+	def StopReplay(self):
+		"""Stop feeding a recorded session."""
+		self.Replayer = None
+
+	def StartHapticPoller(self):
+		"""Start the haptic polling thread, if enabled."""
+		self.StopHapticPoller()
+		if self.use_haptic and self.HapticRate > 0:
+			self.Poller = HapticPoller(self.haptic, self.HapticRate)
+			self.Poller.start()
+
+	def StopHapticPoller(self):
+		"""Stop the haptic polling thread, if running."""
+		if self.Poller:
+			self.Poller.Stop()
+			self.Poller = None
+
+	def PollHaptic(self):
+		"""Get the latest haptic state.
+
+		Read from the polling thread buffer if running, otherwise
+		update the device right now.
+		"""
+		if self.Poller:
+			self.HapticState = self.Poller.GetState()
+		else:
+			self.haptic.UpdateDevice()
+			self.HapticState.Read(self.haptic)
+		if self.Recorder:
+			self.Recorder.RecordHaptic(self.HapticState, self.haptic.GetToolInsertion())
+
+	def Shutdown(self):
+		"""Release resources that outlive a simulation (workers, threads)."""
+		self.Stop()
+		self.StopHapticPoller()
+		self.Cutter.Close()
+		if self.ProfileFile and self.Profiler.Stages:
+			self.Profiler.Dump(self.ProfileFile, self.GetRateStatistics())
+
 	def Initialize(self):
 		"""Initialize timer and check haptic interaction."""
 		if self.Initialized:
@@ -221,33 +525,24 @@ class SimulationTimer(wx.Timer):
 		# Set tools
 		for e in self.Elements:
 			e.Update()
-			vis = e.GetVisualizationModel()
-			# Create and set
-			extractor = vtk.vtkExtractCells()
-			extractor.SetInput(vis.GetInput())
-			gfilter = vtk.vtkGeometryFilter()
-			mapper = vtk.vtkPolyDataMapper()
-			actor = vtk.vtkActor()
-			actor.SetMapper(mapper)
-			actor.GetProperty().SetColor(1,0,0)
-			actor.GetProperty().SetOpacity(0.5)
-			# Add to lists
-			self.Extractors.append(extractor)
-			self.GFilters.append(gfilter)
-			self.Mappers.append(mapper)
-			self.Actors.append(actor)
-			# Add to renderer
-			self.ren.AddActor(actor)
+			self.Highlighter.AddElement(e)
+			self.Cutter.AddElement(e)
 			# Identify cavity objects
 			if e.GetName().find('cavity') >= 0:
 				e.is_cavity = True
 			else:
 				e.is_cavity = False
+		self.Highlighter.SetRenderer(self.ren)
+		self.Highlighter.Initialize()
+		self.Cutter.SetRenderer(self.ren)
+		self.Cutter.Initialize()
+		if self.cutting:
+			self.Cutter.Warm()
 
 		# Haptic use. Camera and camera volume.
 		self.use_haptic = False
 		try:
-			self.haptic = self.Simulation.GetHapticDevice()
+			self.haptic = self.HapticDevice or self.Simulation.GetHapticDevice()
 			if self.haptic and self.haptic.IsA('vtkSBM'):
 				self.use_haptic = True
 				# Set haptic attributes
@@ -284,8 +579,23 @@ class SimulationTimer(wx.Timer):
 		self.Lens = self.style.Lens
 		self.Lens.LastRoll = 0
 
+		# Actors whose changes require a new render
+		self.WatchedActors = list(self.Lens.GetActors())
+		objects = self.Scenario.GetObjects()
+		objects.InitTraversal()
+		o = objects.GetNextObject()
+		while o:
+			elements = o.GetElements()
+			elements.InitTraversal()
+			e = elements.GetNextElement()
+			while e:
+				self.WatchedActors.append(e.GetVisualizationModel().GetActor())
+				e = elements.GetNextElement()
+			o = objects.GetNextObject()
+
 		if self.use_haptic:
 			self.state = 1 # Wait for haptic extraction
+			self.StartHapticPoller()
 		else:
 			self.state = 0 # Start simulation
 
@@ -295,44 +605,244 @@ class SimulationTimer(wx.Timer):
 		"""Update scenario from haptic data."""
 		if self.use_haptic:
 			self.haptic.UpdateScenario()
-			Roll = self.haptic.GetLeftToolRoll()
-			self.Lens.Rotate(Roll - self.Lens.LastRoll)
-			self.Lens.Update()
+			if self.Recorder:
+				self.Recorder.RecordCamera(self.Scenario.GetCamera())
+			Roll = self.HapticState.Roll
+			if Roll != self.Lens.LastRoll:
+				self.Lens.Rotate(Roll - self.Lens.LastRoll)
+				self.RequestRender()
+			if self.Lens.Update():
+				self.RequestRender()
 			self.Lens.LastRoll = Roll
 
+	def Animate(self):
+		"""Advance all running animations."""
+		self.Animations.Advance()
+
+	def HapticStep(self):
+		"""Haptic stage: poll the device and move the scenario."""
+		measure = self.Profiler.Measure
+		if self.use_haptic:
+			measure('poll', self.PollHaptic)
+		measure('interact', self.Interact)
+
+	def SimulationStep(self):
+		"""Simulation stage: step, cut, highlight and animate."""
+		self.StepScene()
+		self.UpdateScene()
+
+	def StepScene(self):
+		"""Step the simulation, find the cuts and set the highlights.
+
+		No actor is added or removed and no window is touched, so the
+		simulation worker thread runs this part.
+		"""
+		measure = self.Profiler.Measure
+		measure('step', self.Simulation.Step)
+		measure('collisions', self.SnapshotCollisions)
+		measure('queue', self.QueueCuts)
+		measure('highlight', self.SetHighlights)
+
+	def UpdateScene(self):
+		"""Show cut pieces and advance animations. GUI thread only."""
+		measure = self.Profiler.Measure
+		measure('collect', self.CollectCuts)
+		measure('cut', self.CutOnCollisions)
+		measure('animate', self.Animate)
+
+	def GetSceneSignature(self):
+		"""Return a cheap signature of everything visible.
+
+		Made of the modification times of the camera and the watched
+		actors, and of the highlight update counter.
+		"""
+		signature = [self.Scenario.GetCamera().GetMTime(), self.Highlighter.GetNumberOfUpdates()]
+		for a in self.WatchedActors:
+			signature.append(a.GetMTime())
+			matrix = a.GetUserMatrix()
+			if matrix:
+				signature.append(matrix.GetMTime())
+		return tuple(signature)
+
+	def NeedsRender(self):
+		"""Check whether anything visible has changed since the last render."""
+		if self.RenderRequested or self.Animations.IsActive() or self.Cutter.Pending:
+			return True
+		return self.GetSceneSignature() != self.__scene_signature
+
+	def RenderStep(self):
+		"""Render stage.
+
+		With render on demand, the render is skipped if nothing
+		visible has changed. With a render interval, only some
+		steps are rendered.
+
+		Every call ends a frame, whether it renders or not, so
+		RenderSteps = Renders + SkippedRenders + ThrottledRenders.
+		"""
+		self.RenderSteps += 1
+		if self.RenderInterval != 1:
+			self.__render_steps += 1
+			if not self.RenderInterval or self.__render_steps % self.RenderInterval:
+				self.ThrottledRenders += 1
+				return
+		if self.RenderOnDemand:
+			if not self.NeedsRender():
+				self.SkippedRenders += 1
+				return
+			self.__scene_signature = self.GetSceneSignature()
+		self.RenderRequested = False
+		self.Renders += 1
+		if self.Profiler.Enabled:
+			self.Profiler.EndFrame()
+		if self.LevelOfDetail:
+			self.Profiler.Measure('lod', self.UpdateLevelOfDetail)
+		self.Profiler.Measure('render', self.Scenario.Render)
+
 	def SimulationLoop(self):
 		"""Main simulation loop iteration."""
-		self.Interact()
-		self.Simulation.Step()
-		self.CutOnCollisions()
-		self.SetHighlights()
-		self.Scenario.Render()
+		self.Profiler.Measure('interact', self.Interact)
+		self.SimulationStep()
+		self.RenderStep()
 
 	def StartSimulation(self):
-		"""Timer firing method."""
-		self.__timer = threading.Timer(0.04, self.Notify_2, [time.time()])
-		self.__timer.start()
-	
+		"""Start the simulation worker thread.
+
+		The worker steps the simulation, collisions and highlights at a
+		fixed period, and queues the cuts. Cut pieces, animations and
+		rendering are handed back to the GUI thread (see UpdateScene).
+		The wx timer keeps running the haptic state machine.
+		"""
+		self.StopSimulation()
+		period = 0.04
+		if self.Scheduler:
+			period = self.Scheduler.GetStage('simulation').Period
+		self.__stop = threading.Event()
+		self.__thread = threading.Thread(target = self.SimulationThread, args = (period, self.__stop))
+		self.__thread.daemon = True
+		self.__thread.start()
+
+	def GetLock(self):
+		"""Return the lock held while the scene is stepped or rendered.
+
+		Code changing or rendering the scene from the GUI thread, like
+		the render window widget, must hold it as well.
+		"""
+		return self.__lock
+
+	def StopSimulation(self):
+		"""Stop the simulation worker thread, if running.
+
+		It may be called with the lock held, e.g. from Notify when a
+		replayed button restarts the timer. The worker never blocks on
+		the lock, so the join can't deadlock.
+		"""
+		if self.__stop:
+			self.__stop.set()
+		if self.__thread and self.__thread is not threading.current_thread():
+			self.__thread.join()
+		self.__thread = None
+		self.__stop = None
+
+	def AcquireUnlessStopped(self, stop):
+		"""Wait for the lock until the stop event is set.
+
+		Return True if the lock was acquired.
+		"""
+		while not self.__lock.acquire(False):
+			if stop.wait(0.001):
+				return False
+		if stop.is_set():
+			self.__lock.release()
+			return False
+		return True
+
+	def SimulationThread(self, period, stop):
+		"""Worker thread body. It runs until the stop event is set."""
+		next_time = time.time()
+		while not stop.is_set():
+			if self.Initialized and self.state == 0:
+				if not self.AcquireUnlessStopped(stop):
+					break
+				try:
+					start = timeit.default_timer()
+					self.Profiler.Measure('interact', self.Interact)
+					self.StepScene()
+					if self.Governor:
+						self.AccountWork(start, False)
+				finally:
+					self.__lock.release()
+				# Only one render queued at a time
+				if not self.__render_pending:
+					self.__render_pending = True
+					wx.CallAfter(self.RenderOnGUI)
+			next_time += period
+			delay = next_time - time.time()
+			if delay > 0:
+				stop.wait(delay)
+			else:
+				next_time = time.time()
+
+	def RenderOnGUI(self):
+		"""Update the scene and render on the GUI thread a step computed by the worker."""
+		self.__render_pending = False
+		if not self.__stop or self.__stop.is_set():
+			return
+		with self.__lock:
+			start = timeit.default_timer()
+			self.UpdateScene()
+			self.RenderStep()
+			if self.Governor:
+				self.AccountWork(start, True)
+
 	def Notify(self):
 		"""Main simulation timer callback.
 
+		Serialized with the simulation worker thread, if any.
+		"""
+		with self.__lock:
+			frames = self.RenderSteps
+			start = timeit.default_timer()
+			self.Profiler.Measure('frame', self.StateMachine)
+			if self.Governor:
+				self.AccountWork(start, self.RenderSteps != frames)
+	
+	def StateMachine(self):
+		"""Main simulation timer iteration.
+
 		State machine. Control simulation states
 		and GUI interaction through haptic device.
 		"""
 		if not self.Initialized:
 			self.Initialize()
+		if self.Replayer:
+			self.Replayer.Feed()
+			if self.Replayer and self.Replayer.IsFinished():
+				self.StopReplay()
+		# Animations run inside the simulation loop in state 0
+		if self.state != 0:
+			self.Animate()
 		# State 0: simulate
 		if self.state == 0:
-			self.SimulationLoop()
+			if self.__thread:
+				# Stepped by the worker thread. Just read the device.
+				if self.use_haptic:
+					self.Profiler.Measure('poll', self.PollHaptic)
+			elif self.Scheduler:
+				# Each stage at its own rate. Haptic stage polls the device.
+				self.Scheduler.Tick()
+			else:
+				self.SimulationLoop()
+				if self.use_haptic:
+					self.Profiler.Measure('poll', self.PollHaptic)
 			if self.use_haptic:
-				self.haptic.UpdateDevice()
-				if self.haptic.GetLeftToolDepth() == 0.0:
+				if self.HapticState.Depth == 0.0:
 					self.state = 2
 				else:
 					self.UpdatePedals()
 					left = self.left_pedal_pressed
 					right = self.right_pedal_pressed
-					grasp = self.haptic.GetLeftToolOpening()
+					grasp = self.HapticState.Opening
 
 					# Use grasp to activate Nail
 					self.parent.UpdateNail(grasp-1)
@@ -351,28 +861,27 @@ class SimulationTimer(wx.Timer):
 						self.parent.AddToolInsertion(1)
 
 		elif self.use_haptic:
-			self.haptic.UpdateDevice()
+			self.PollHaptic()
 			# State 1: wait for haptic extraction
 			if self.state == 1:
 				# Initialization: wait for haptic extraction
 				self.parent.ShowExtractText()
-				depth = self.haptic.GetLeftToolDepth()
+				depth = self.HapticState.Depth
 				if depth == 0.0:
 					self.state = 2
 			# State 2: Lens inclination/tool selection
 			elif self.state == 2:
-				depth = self.haptic.GetLeftToolDepth()
+				depth = self.HapticState.Depth
 				if depth > 0.0:
 					self.state = 0
 					self.parent.ApplyLensSelection()
 					self.parent.ShowSimulation()
 				else:
-					self.haptic.UpdateDevice()
 					self.UpdatePedals()
 					self.parent.ShowLenses()
 					prev = self.left_pedal_click
 					next = self.right_pedal_click
-					grasp = self.haptic.GetLeftToolOpening()
+					grasp = self.HapticState.Opening
 
 					if prev and not next:
 						if grasp < 0.5:
@@ -385,181 +894,90 @@ class SimulationTimer(wx.Timer):
 						else:
 							self.parent.SelectNextLens()
 
+	def SnapshotCollisions(self):
+		"""Read the collisions of the current step once for all consumers."""
+		if self.Highlight or self.cutting:
+			self.Collisions.Capture(self.Simulation.GetCollisions())
+		else:
+			self.Collisions.Clear()
+
 	def SetHighlights(self):
 		"""Highlight registered elements on collisions.
 
-		Working order:
-			1. Get ColPoints.
-			2. Map to VisPoints.
-			3. Get correspondant cells.
-			4. Get some neighbour cells.
-			5. Highlight them.
+		See HighlightEngine for the working order.
 		"""
 		# Is this option enabled?
 		if not self.Highlight:
 			return
 			
-		# Each element must be highlighted
-		#for eid in xrange(len(self.Elements)):
-		#	e = self.Elements[eid]
-		eid = 0
-		for e in self.Elements:
-			if e.IsEnabled():
-				vis = e.GetVisualizationModel()
-				col = e.GetCollisionModel()
-				
-				# Get point IDs
-				pids = vtk.vtkIdList()
-				cols = self.Simulation.GetCollisions()
-				# TODO: comprobar si hay colisiones
-				cols.InitTraversal()
-				c = cols.GetNextCollision()
-				while c:
-					if c.GetObjectId() == e.GetObjectId():
-						pids.InsertUniqueId(c.GetPointId())
-					c = cols.GetNextCollision()
-					
-				# Map to VisPoints
-				locator = vtk.vtkPointLocator()
-				locator.SetDataSet(vis.GetInput())
-				colpd = col.GetInput()
-				visIds = vtk.vtkIdList()
-				for i in xrange(pids.GetNumberOfIds()):
-					colid = pids.GetId(i)
-					vid = locator.FindClosestPoint(colpd.GetPoint(colid))
-					visIds.InsertUniqueId(vid)
-				
-				# Get cells
-				vispd = vis.GetInput()
-				cids = vtk.vtkIdList()
-				for i in range(visIds.GetNumberOfIds()):
-					tempIds = vtk.vtkIdList()
-					vispd.GetPointCells(visIds.GetId(i), tempIds)
-					for j in range(tempIds.GetNumberOfIds()):
-						cids.InsertUniqueId(tempIds.GetId(j))
-						
-				# Get some neighbour cells
-				Neighbours = True
-				if Neighbours:
-					nbs = vtk.vtkIdList()
-					for i in range(cids.GetNumberOfIds()):
-						tempPointIds = vtk.vtkIdList()
-						vispd.GetCellPoints(cids.GetId(i), tempPointIds)
-						for j in range(tempPointIds.GetNumberOfIds()):
-							tempCellIds = vtk.vtkIdList()
-							vispd.GetPointCells(tempPointIds.GetId(j), tempCellIds)
-							for k in range(tempCellIds.GetNumberOfIds()):
-								nbs.InsertUniqueId(tempCellIds.GetId(k))
-					for i in range(nbs.GetNumberOfIds()):
-						cids.InsertUniqueId(nbs.GetId(i))
-						
-				# Highlight them
-				if cids.GetNumberOfIds() == 0:
-					self.Mappers[eid].SetInput(self.EmptyPD)
-				else:
-					self.Extractors[eid].SetCellList(cids)
-					self.Extractors[eid].Update()
-					self.GFilters[eid].SetInput(self.Extractors[eid].GetOutput())
-					self.GFilters[eid].Update()
-					self.Mappers[eid].SetInput(self.GFilters[eid].GetOutput())
-					
-				self.Mappers[eid].Update()
-				self.Actors[eid].SetUserMatrix(col.GetActor().GetUserMatrix())
-				if e.is_cavity:
-					self.Actors[eid].SetScale(0.99)
-				else:
-					self.Actors[eid].SetScale(1.01)
-				self.Actors[eid].GetProperty().SetOpacity(0.5)
+		self.Highlighter.Update(self.Collisions)
 
-			eid += 1
-
-	def CutOnCollisions(self):
-		"""If function activated, cut organ on collision.
+	def QueueCuts(self):
+		"""If function activated, queue the cut of the organs colliding.
 
-		Split the element in two parts and make a split & fade effect.
+		Elements already queued or being cut are not queued again.
 		"""
-		if not self.cutting:
+		if not self.cutting or self.Collisions.GetNumberOfCollisions() == 0:
 			return
 
 		for eid in xrange(len(self.Elements)):
 			e = self.Elements[eid]
-			if not e.is_cavity:
-				cm = e.GetCollisionModel()
-				cols = cm.GetCollisions()
-				num_cols = cols.GetNumberOfCollisions()
+			if not e.is_cavity and e.IsEnabled() and not self.IsCutPending(eid):
+				p = self.Collisions.GetFirstPoint(e.GetObjectId(), e.GetId())
 
-				if num_cols > 0:
+				if p is not None:
 					# Is the colliding pair a blade?
 
 					# Then go!
-					vis = e.GetVisualizationModel()
-					va = vis.GetActor()
-					p = cols.GetCollision(0).GetPoint()
-					n = [0,1,0]
-
-					plane = vtk.vtkPlane()
-					plane.SetOrigin(p)
-					plane.SetNormal(n)
-
-					cf = vtk.vtkClipPolyData()
-					cf.SetValue(0)
-					cf.GenerateClippedOutputOn()
-					cf.SetInputConnection(vis.GetOutputPort())
-					cf.SetClipFunction(plane)
-
-					cutter = vtk.vtkCutter()
-					cutter.SetInputConnection(vis.GetOutputPort())
-					cutter.SetCutFunction(plane)
-					strips = vtk.vtkStripper()
-					strips.SetInputConnection(cutter.GetOutputPort())
-					strips.Update()
-					cutpoly = vtk.vtkPolyData()
-					cutpoly.SetPoints(strips.GetOutput().GetPoints())
-					cutpoly.SetPolys(strips.GetOutput().GetLines())
-					cutpoly.Update()
-
-					revpoly = vtk.vtkReverseSense()
-					revpoly.SetInput(cutpoly)
-					revpoly.ReverseNormalsOn()
-					revpoly.Update()
-
-					actor_1, actor_2 = (None, None)
-
-					for i in range(2):
-						piece = vtk.vtkAppendPolyData()
-						cleaner = vtk.vtkCleanPolyData()
-						txt_map = vtk.vtkTextureMapToSphere()
-						txt_map.PreventSeamOn()
-						mapper = vtk.vtkPolyDataMapper()
-						actor = vtk.vtkActor()
-
-						if i == 0:
-							piece.AddInput(revpoly.GetOutput())
-							piece.AddInput(cf.GetOutput())
-							actor_1 = actor
-						else:
-							piece.AddInput(cutpoly)
-							piece.AddInput(cf.GetClippedOutput())
-							actor_2 = actor
+					self.DeferredCuts.append((eid, p))
+					self.PendingCuts.add(eid)
 
-						piece.Update()
-						cleaner.SetInput(piece.GetOutput())
-						cleaner.Update()
+	def CutOnCollisions(self):
+		"""Cut the organs queued on collision.
 
-						txt_map.SetInput(cleaner.GetOutput())
-						mapper.SetInput(txt_map.GetOutput())
-						actor.SetMapper(mapper)
-						actor.SetUserMatrix(va.GetUserMatrix())
-						actor.SetTexture(va.GetTexture())
-						actor.GetProperty().BackfaceCullingOn()
-						self.ren.AddActor(actor)
+		Split the element in two parts and make a split & fade effect.
+		While deferring, one cut is done per tick. Elements stay
+		visible until their pieces are shown.
+		"""
+		count = len(self.DeferredCuts)
+		if self.DeferCuts:
+			count = min(count, 1)
+		for i in xrange(count):
+			eid, p = self.DeferredCuts.pop(0)
+			self.PendingCuts.discard(eid)
+			self.Cut(eid, p)
+
+	def IsCutPending(self, eid):
+		"""Check whether an element is queued or being cut."""
+		return eid in self.PendingCuts or self.Cutter.IsPending(eid)
+
+	def Cut(self, eid, p):
+		"""Cut an element at the point given."""
+		# Meshes the worker cannot get are cut here
+		if self.Cutter.Async and self.Cutter.CutAsync(eid, p, [0,1,0]):
+			return
+		actor_1, actor_2 = self.Cutter.Cut(eid, p, [0,1,0])
+		self.StartCutAnimation(eid, actor_1, actor_2)
 
-					# Disable element so it doesn't bother anymore
-					e.Disable()
+	def CollectCuts(self):
+		"""Swap in the pieces of the asynchronous cuts already computed."""
+		if not self.Cutter.Pending:
+			return
+		for eid, actors in self.Cutter.CollectFinished():
+			self.StartCutAnimation(eid, actors[0], actors[1])
 
-					actor.dis_timer = dis_timer = CutDisapearTimer(self.ren, actor_1, actor_2)
-					dis_timer.StartDisapearing()
+	def StartCutAnimation(self, eid, actor_1, actor_2):
+		"""Make a split & fade effect, then give the pieces back to the pool.
 
+		The element is replaced by its pieces here.
+		"""
+		# Disable element so it doesn't bother anymore
+		self.Elements[eid].Disable()
+		period = self.CutAnimationPeriod*self.CutAnimationScale
+		release = lambda eid=eid, a1=actor_1, a2=actor_2: self.Cutter.Release(eid, a1, a2)
+		self.Animations.Add(RotateTrack(actor_1, 90, period))
+		self.Animations.Add(TranslateTrack(actor_1, (0,1,0), period))
+		self.Animations.Add(FadeTrack([actor_1, actor_2], period, callback = release))
 
 	def UpdatePedals(self):
 		"""Update haptic pedals information.
@@ -568,7 +986,7 @@ class SimulationTimer(wx.Timer):
 			left/right_pedal_click
 			left/right_pedal_pressed
 		"""
-		left_pedal = self.haptic.GetLeftPedalState()
+		left_pedal = self.HapticState.LeftPedal
 		if left_pedal:
 			if not self.left_pedal_pressed:
 				self.left_pedal_click = True
@@ -579,7 +997,7 @@ class SimulationTimer(wx.Timer):
 			self.left_pedal_click = False
 			self.left_pedal_pressed = False
 						
-		right_pedal = self.haptic.GetRightPedalState()
+		right_pedal = self.HapticState.RightPedal
 		if right_pedal:
 			if not self.right_pedal_pressed:
 				self.right_pedal_click = True
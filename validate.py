@@ -0,0 +1,117 @@
+"""HysTrainer scenario validator.
+
+Check SRML files against the rules the main frame applies when
+loading them (see SceneCheck), without any GUI. Meshes are
+checked as well. Files are validated in parallel.
+
+Usage:
+	python validate.py [-j JOBS] [--headless] [--json FILE] SRML_OR_DIR...
+
+Directories are searched recursively for *.srml files. The
+exit status is 1 if any file is not valid. wx is not needed.
+With --headless, the local stand-in of vtkesqui is used, for
+machines where it is not installed.
+"""
+
+import sys
+from StandIns import *
+# Stand-ins have to be installed before vtkesqui is imported
+if '--headless' in sys.argv:
+	InstallStandIns()
+
+import vtk
+import vtkesqui
+import os
+from SceneCheck import *
+import json
+import argparse
+import timeit
+import multiprocessing
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def ValidateFile(filename):
+	"""Validate a SRML file. Return the result as a dictionary.
+
+	Process pool entry point.
+	"""
+	clock = timeit.default_timer
+	result = {'file': filename, 'valid': False, 'problems': list()}
+	start = clock()
+	try:
+		reader = vtkesqui.vtkSRMLReader()
+		reader.SetFileName(filename)
+		sim = reader.ConstructSimulation()
+		parsed = clock()
+		if not sim:
+			result['problems'].append({'code': None, 'message': 'Bad SRML file.'})
+		else:
+			for code, name, path in FindSceneProblems(sim.GetScenario(), meshes = True):
+				result['problems'].append({'code': code, 'message': SceneMessages[code],
+					'object': name, 'path': path})
+	except Exception as e:
+		parsed = clock()
+		result['problems'].append({'code': None, 'message': '%s: %s' % (e.__class__.__name__, e)})
+	end = clock()
+	result['valid'] = not result['problems']
+	result['seconds'] = {'parse': parsed - start, 'check': end - parsed, 'total': end - start}
+	return result
+
+def FindScenes(paths):
+	"""Return the SRML files given, searching directories recursively."""
+	scenes = list()
+	for path in paths:
+		if os.path.isdir(path):
+			for root, dirs, files in os.walk(path):
+				dirs.sort()
+				scenes.extend([os.path.join(root, f) for f in sorted(files) if f.lower().endswith('.srml')])
+		else:
+			scenes.append(path)
+	return scenes
+
+def main(argv):
+	"""Validate the SRML files given in the command line."""
+	parser = argparse.ArgumentParser(description = 'Headless HysTrainer scenario validator.')
+	parser.add_argument('paths', nargs = '+', metavar = 'SRML_OR_DIR')
+	parser.add_argument('-j', '--jobs', type = int, default = multiprocessing.cpu_count(),
+		help = 'number of worker processes')
+	parser.add_argument('--json', metavar = 'FILE', help = 'write the results to a JSON file')
+	parser.add_argument('--headless', action = 'store_true',
+		help = 'use the local stand-in of vtkesqui (see StandIns)')
+	args = parser.parse_args(argv)
+
+	scenes = FindScenes(args.paths)
+	clock = timeit.default_timer
+	start = clock()
+	if args.jobs > 1 and len(scenes) > 1:
+		pool = multiprocessing.Pool(min(args.jobs, len(scenes)))
+		try:
+			results = pool.map(ValidateFile, scenes, 1)
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		results = [ValidateFile(f) for f in scenes]
+	seconds = clock() - start
+
+	failed = 0
+	for result in results:
+		if result['valid']:
+			sys.stdout.write('%s: OK (%.3f s)\n' % (result['file'], result['seconds']['total']))
+			continue
+		failed += 1
+		sys.stdout.write('%s: FAILED (%.3f s)\n' % (result['file'], result['seconds']['total']))
+		for problem in result['problems']:
+			where = [v for v in (problem.get('object'), problem.get('path')) if v]
+			sys.stdout.write('\t%s%s\n' % (problem['message'], ' ' + ', '.join(where) if where else ''))
+	sys.stdout.write('%d files, %d failed, %.2f s\n' % (len(results), failed, seconds))
+
+	if args.json:
+		f = open(args.json, 'w')
+		try:
+			json.dump({'seconds': seconds, 'files': results}, f, indent = 1, sort_keys = True)
+		finally:
+			f.close()
+	return 1 if failed else 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))